@@ -0,0 +1,44 @@
+"""
+Conditional GET for API views.
+
+A view passes a cheap version of the data behind the response (a few timestamps
+and counts, see devices.versions) and a function building the response. The
+ETag and Last-Modified validators are derived from the version; when the
+request's If-None-Match or If-Modified-Since match them, 304 Not Modified is
+returned without running the queries and serialization of the full response.
+"""
+import hashlib
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+
+from django.http import HttpResponseBase
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(request, version: Iterable) -> str:
+    """
+    Returns the ETag of the response to the request for the given data version.
+    The representation (path with query params, negotiated media type) and the
+    user are part of it, so one version yields different tags per variant.
+    """
+    parts = [request.get_full_path(), getattr(request, 'accepted_media_type', ''), request.user.pk, *version]
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def conditional_response(request, version: Iterable, last_modified: Optional[datetime],
+                         build: Callable[[], HttpResponseBase]) -> HttpResponseBase:
+    """Returns 304 when the validators of the request match the version, otherwise build()."""
+    etag = make_etag(request, version)
+    timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+
+    response: Optional[HttpResponseBase] = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = build()
+        if not 200 <= response.status_code < 300:
+            return response
+
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    return response
@@ -3,6 +3,7 @@ from django.db import models
 from django.utils.timezone import now
 
 from core.managers import BaseModelManager
+from core.uuids import uuid7
 
 
 class BaseModel(models.Model):
@@ -29,4 +30,55 @@ class BaseModel(models.Model):
 
     class Meta:
         abstract = True
-   
\ No newline at end of file
+   
+
+class TrackedModel(BaseModel):
+    """
+    BaseModel whose ``updated_at`` is moved forward on every save (and added to
+    ``update_fields``), for rows the API derives conditional GET validators from.
+    Bulk and queryset updates do not go through save() and set it themselves.
+    """
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.updated_at = now()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'updated_at'}
+        super().save(*args, **kwargs)
+
+    class Meta:
+        abstract = True
+
+
+class TimeOrderedModel(BaseModel):
+    """
+    BaseModel with time-ordered (UUIDv7) primary keys, for tables with a high insert rate.
+    Rows created before switching a table to it keep their random keys.
+    """
+    uuid = models.UUIDField(primary_key=True, default=uuid7, editable=False)
+
+    class Meta:
+        abstract = True
+
+
+class AppendOnlyModel(TimeOrderedModel):
+    """
+    TimeOrderedModel without soft delete, for tables rows are only appended to.
+    There is no is_deleted column, queries carry no filter on it and delete()
+    removes the row.
+    """
+    # Removes the inherited field, which django-stubs cannot express
+    is_deleted = None  # type: ignore[assignment]
+
+    objects = models.Manager()  # type: ignore[assignment,misc]
+
+    def delete(self, *args, **kwargs):
+        return models.Model.delete(self, *args, **kwargs)
+
+    def hard_delete(self):
+        return models.Model.delete(self)
+
+    def restore(self):
+        raise TypeError(f"{type(self).__name__} rows cannot be restored, they are not soft-deleted")
+
+    class Meta:
+        abstract = True
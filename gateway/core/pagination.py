@@ -0,0 +1,142 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are selected with a condition on the ordering columns of the last row seen
+instead of an OFFSET, so every page costs the same index range scan however deep
+the client scrolls, and no COUNT(*) runs unless an estimate is requested.
+"""
+import base64
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connections
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def estimate_count(queryset: QuerySet) -> int:
+    """
+    Returns the number of rows of the queryset as estimated by the PostgreSQL
+    planner, without running it. Other databases count exactly.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on two columns, e.g. ('-timestamp', '-uuid'), where the second
+    one is unique and breaks ties of the first. Both must be ordered the same way.
+
+    Query params: ``cursor`` (from the next/previous links), ``page_size`` (up to
+    API_MAX_PAGE_SIZE) and ``count=estimate`` to include ``count_estimate``.
+    """
+    ordering: Tuple[str, str] = ('-created_at', '-uuid')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None) -> List[Any]:
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request, queryset.model)
+
+        self.count_estimate = None
+        if request.query_params.get(self.count_query_param) == 'estimate':
+            self.count_estimate = estimate_count(queryset)
+
+        fields = [name.lstrip('-') for name in self.ordering]
+        descending = self.ordering[0].startswith('-')
+        reverse = bool(cursor and cursor[1])
+        if cursor:
+            queryset = queryset.filter(self._beyond(fields, cursor[0], less=descending != reverse))
+
+        ordering = self.ordering if not reverse else [self._invert(name) for name in self.ordering]
+        results = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        # Coming back from a later page there always is a next one
+        self.has_next = has_more if not reverse else True
+        self.has_previous = cursor is not None if not reverse else has_more
+        self.first = self._values(results[0], fields) if results else None
+        self.last = self._values(results[-1], fields) if results else None
+        return results
+
+    def get_paginated_response(self, data) -> Response:
+        response: Dict[str, Any] = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+        }
+        if self.count_estimate is not None:
+            response['count_estimate'] = self.count_estimate
+        response['results'] = data
+        return Response(response)
+
+    def get_page_size(self, request) -> int:
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, page_size))
+        except ValueError:
+            pass
+        return max(1, min(page_size, settings.API_MAX_PAGE_SIZE))
+
+    def get_next_link(self) -> Optional[str]:
+        if not self.has_next or self.last is None:
+            return None
+        return self.encode_cursor(self.last, reverse=False)
+
+    def get_previous_link(self) -> Optional[str]:
+        if not self.has_previous or self.first is None:
+            return None
+        return self.encode_cursor(self.first, reverse=True)
+
+    def encode_cursor(self, values: List[Any], reverse: bool) -> str:
+        values = [value.isoformat() if hasattr(value, 'isoformat') else str(value) for value in values]
+        payload = json.dumps([values, reverse])
+        token = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, token)
+
+    def decode_cursor(self, request, model) -> Optional[Tuple[List[Any], bool]]:
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            values, reverse = json.loads(base64.urlsafe_b64decode(token.encode()))
+            fields = [model._meta.get_field(name.lstrip('-')) for name in self.ordering]
+            return [field.to_python(value) for field, value in zip(fields, values, strict=True)], bool(reverse)
+        except (TypeError, ValueError, DjangoValidationError):
+            raise NotFound("Invalid cursor")
+
+    @staticmethod
+    def _values(row: Any, fields: List[str]) -> List[Any]:
+        # Rows of .values() querysets are dicts
+        if isinstance(row, dict):
+            return [row[name] for name in fields]
+        return [getattr(row, name) for name in fields]
+
+    @staticmethod
+    def _beyond(fields: List[str], values: List[Any], less: bool) -> Q:
+        lookup = 'lt' if less else 'gt'
+        (first, second), (first_value, second_value) = fields, values
+        return Q(**{f'{first}__{lookup}': first_value}) | Q(**{first: first_value, f'{second}__{lookup}': second_value})
+
+    @staticmethod
+    def _invert(name: str) -> str:
+        return name[1:] if name.startswith('-') else f'-{name}'
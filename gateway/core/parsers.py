@@ -0,0 +1,38 @@
+"""
+JSON parsing backed by orjson, with the stdlib json module as the fallback when
+orjson is not installed. Accepts exactly what DRF's JSONParser accepts in strict
+mode (no NaN or Infinity).
+"""
+import json
+from typing import Any
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.utils.json import strict_constant
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
+
+
+def json_loads(data: bytes | str) -> Any:
+    """Parses a JSON document. Raises ValueError when it is invalid."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data, parse_constant=strict_constant)
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser that parses UTF-8 bodies with orjson."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
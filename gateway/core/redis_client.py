@@ -0,0 +1,27 @@
+from typing import Optional
+
+import redis
+from django.conf import settings
+
+_pool: Optional[redis.ConnectionPool] = None
+
+
+def get_redis_pool() -> redis.ConnectionPool:
+    """
+    Returns the process-wide Redis connection pool.
+
+    The pool is created lazily on first use. redis-py resets pools that were
+    inherited across a fork, so it is safe to share between Celery workers.
+    """
+    global _pool
+    if _pool is None:
+        _pool = redis.ConnectionPool.from_url(
+            settings.REDIS_URL,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+        )
+    return _pool
+
+
+def get_redis_client() -> redis.Redis:
+    """Returns a Redis client backed by the shared connection pool."""
+    return redis.Redis(connection_pool=get_redis_pool())
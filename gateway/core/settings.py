@@ -119,8 +119,21 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_PERMISSION_CLASSES': ('rest_framework.permissions.IsAuthenticated',),
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'core.renderers.MessagePackRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'core.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
+# Largest page_size clients may request from cursor-paginated listings
+API_MAX_PAGE_SIZE = env.int('API_MAX_PAGE_SIZE', default=1000)
+
 ROOT_URLCONF = 'core.urls'
 
 CSRF_TRUSTED_ORIGINS = env('CSRF_TRUSTED_ORIGINS').split(',')
@@ -207,6 +220,86 @@ TELEMETRY_SERVICE_URL = env('TELEMETRY_SERVICE_URL')
 
 # Redis settings
 REDIS_URL = env('REDIS_URL')
+REDIS_MAX_CONNECTIONS = env.int('REDIS_MAX_CONNECTIONS', default=50)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': 'gateway',
+    }
+}
+# Seconds computed device responses (history) stay cached, 0 disables the cache.
+# New readings of a device invalidate its entries right away (see devices.response_cache)
+RESPONSE_CACHE_TIMEOUT = env.int('RESPONSE_CACHE_TIMEOUT', default=300)
+
+# Telemetry ingestion
+# Queue backend the telemetry is read from: 'list' (per-device lists) or 'stream' (Redis Streams)
+TELEMETRY_QUEUE_BACKEND = env('TELEMETRY_QUEUE_BACKEND', default='list')
+# Maximum number of records read from a single device queue per processing cycle
+TELEMETRY_QUEUE_BATCH_SIZE = env.int('TELEMETRY_QUEUE_BATCH_SIZE', default=500)
+# Maximum number of pending device queues drained per processing cycle
+TELEMETRY_PENDING_BATCH_SIZE = env.int('TELEMETRY_PENDING_BATCH_SIZE', default=1000)
+# How often (in seconds) all device queues are checked for data missing from the pending set
+TELEMETRY_PENDING_RECONCILE_INTERVAL = env.int('TELEMETRY_PENDING_RECONCILE_INTERVAL', default=60)
+# Newest records kept in the queue of a MAC address without a registered device
+TELEMETRY_UNKNOWN_DEVICE_MAX_RECORDS = env.int('TELEMETRY_UNKNOWN_DEVICE_MAX_RECORDS', default=1000)
+# Seconds after its last reading the queue of a MAC address without a registered device is dropped
+TELEMETRY_UNKNOWN_DEVICE_TTL = env.int('TELEMETRY_UNKNOWN_DEVICE_TTL', default=7 * 24 * 3600)
+# Maximum number of stream entries read per processing cycle
+TELEMETRY_STREAM_BATCH_SIZE = env.int('TELEMETRY_STREAM_BATCH_SIZE', default=1000)
+# Milliseconds a stream entry stays unacknowledged before it is reclaimed from a crashed worker
+TELEMETRY_STREAM_CLAIM_IDLE_MS = env.int('TELEMETRY_STREAM_CLAIM_IDLE_MS', default=60000)
+# The runingest worker flushes its buffer once it holds this many records...
+TELEMETRY_INGEST_FLUSH_SIZE = env.int('TELEMETRY_INGEST_FLUSH_SIZE', default=2000)
+# ...or once the oldest buffered record waits this many seconds
+TELEMETRY_INGEST_FLUSH_AGE = env.float('TELEMETRY_INGEST_FLUSH_AGE', default=0.5)
+# How telemetry batches are written: 'copy' (COPY into a staging table, PostgreSQL only) or 'bulk_create'
+TELEMETRY_WRITE_METHOD = env('TELEMETRY_WRITE_METHOD', default='copy')
+# Seconds device metadata stays in the in-process registry cache (changes also invalidate it through Redis)
+DEVICE_REGISTRY_TTL = env.int('DEVICE_REGISTRY_TTL', default=300)
+# Number of future months the monthly telemetry partitions are created for
+TELEMETRY_PARTITIONS_AHEAD = env.int('TELEMETRY_PARTITIONS_AHEAD', default=3)
+# Seconds the partition maintenance task may run, far above the global task limit:
+# creating a partition moves its month's rows out of the default partition
+TELEMETRY_PARTITIONS_TIME_LIMIT = env.int('TELEMETRY_PARTITIONS_TIME_LIMIT', default=3600)
+# Telemetry partitions older than this many months are dropped (0 keeps all data)
+TELEMETRY_RETENTION_MONTHS = env.int('TELEMETRY_RETENTION_MONTHS', default=0)
+# Directory (a mounted volume in production) the archived raw telemetry is written to
+TELEMETRY_ARCHIVE_DIR = env('TELEMETRY_ARCHIVE_DIR', default=str(BASE_DIR / 'archive'))
+# Whole months of telemetry older than this many days are moved to the archive (0 disables archiving)
+TELEMETRY_ARCHIVE_AFTER_DAYS = env.int('TELEMETRY_ARCHIVE_AFTER_DAYS', default=0)
+# Number of readings read from the database and written to the archive at once
+TELEMETRY_ARCHIVE_CHUNK_SIZE = env.int('TELEMETRY_ARCHIVE_CHUNK_SIZE', default=10000)
+# Seconds the archive task may run, far above the global task limit: months are exported
+# device by device, the devices left when it stops are archived by the next run
+TELEMETRY_ARCHIVE_TIME_LIMIT = env.int('TELEMETRY_ARCHIVE_TIME_LIMIT', default=3600)
+# Maximum number of readings accepted by a single telemetry batch request
+TELEMETRY_BATCH_MAX_ITEMS = env.int('TELEMETRY_BATCH_MAX_ITEMS', default=10000)
+# Number of readings fetched per round trip by the streaming telemetry export
+TELEMETRY_EXPORT_CHUNK_SIZE = env.int('TELEMETRY_EXPORT_CHUNK_SIZE', default=5000)
+# Device history of up to this many hours is served from raw readings, longer ranges from rollups
+TELEMETRY_HISTORY_RAW_HOURS = env.int('TELEMETRY_HISTORY_RAW_HOURS', default=24)
+# Rollup history uses the finest resolution that returns at most this many points
+TELEMETRY_HISTORY_MAX_POINTS = env.int('TELEMETRY_HISTORY_MAX_POINTS', default=1000)
+# Number of shards the device queues are split into; every shard is consumed by one worker at a time
+TELEMETRY_SHARDS = env.int('TELEMETRY_SHARDS', default=1)
+# Seconds after which the shard lease of a worker that stopped renewing it expires
+TELEMETRY_SHARD_LEASE_TTL = env.int('TELEMETRY_SHARD_LEASE_TTL', default=15)
+
+# MQTT broker the runmqttbridge command ingests telemetry from
+MQTT_HOST = env('MQTT_HOST', default='mosquitto')
+MQTT_PORT = env.int('MQTT_PORT', default=1883)
+MQTT_USERNAME = env('MQTT_USERNAME', default='')
+MQTT_PASSWORD = env('MQTT_PASSWORD', default='')
+# Topic the devices publish readings to; the '+' level holds the device MAC address
+MQTT_TELEMETRY_TOPIC = env('MQTT_TELEMETRY_TOPIC', default='devices/+/telemetry')
+# Shared subscription group, bridges in the same group split the messages between them (empty disables)
+MQTT_SHARE_GROUP = env('MQTT_SHARE_GROUP', default='ingest')
+# Maximum number of unacknowledged QoS 1 messages the broker sends to a single bridge
+MQTT_RECEIVE_MAXIMUM = env.int('MQTT_RECEIVE_MAXIMUM', default=2000)
+# Seconds the broker keeps the session (and unacknowledged messages) of a disconnected bridge
+MQTT_SESSION_EXPIRY = env.int('MQTT_SESSION_EXPIRY', default=3600)
 
 # Celery Configuration
 CELERY_BROKER_URL = REDIS_URL
@@ -215,6 +308,20 @@ CELERY_RESULT_EXTENDED = True
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 CELERY_TASK_DEFAULT_QUEUE = 'erpapi'
+CELERY_BEAT_SCHEDULE = {
+    'deactivate-stale-devices': {
+        'task': 'deactivate_stale_devices',
+        'schedule': 300.0,
+    },
+    'maintain-telemetry-partitions': {
+        'task': 'maintain_telemetry_partitions',
+        'schedule': 24 * 60 * 60.0,
+    },
+    'archive-telemetry': {
+        'task': 'archive_telemetry',
+        'schedule': 24 * 60 * 60.0,
+    },
+}
 
 # Debug Toolbar Settings
 INTERNAL_IPS = [
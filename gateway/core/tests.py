@@ -0,0 +1,108 @@
+import io
+import uuid
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+
+import msgpack
+from django.test import SimpleTestCase
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+
+from core.parsers import FastJSONParser, json_loads
+from core.renderers import FastJSONRenderer, MessagePackRenderer
+
+DATA = {
+    'uuid': uuid.UUID(int=1),
+    'utc': datetime(2024, 1, 1, 12, 0, 0, 123456, tzinfo=dt_timezone.utc),
+    'local': datetime(2024, 1, 1, 12, tzinfo=dt_timezone(timedelta(hours=2))),
+    'date': date(2024, 1, 2),
+    'decimal': Decimal('1.50'),
+    'float': 0.1,
+    'big': 2 ** 70,
+    'text': 'zażółć\u2028\u2029',
+    'keys': {1: 'one'},
+    'list': [None, True, 1],
+}
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    def test_same_output_as_json_renderer(self):
+        self.assertEqual(FastJSONRenderer().render(DATA), JSONRenderer().render(DATA))
+
+    def test_indented_output_uses_json_renderer(self):
+        context = {'indent': 2}
+        self.assertEqual(
+            FastJSONRenderer().render(DATA, renderer_context=context),
+            JSONRenderer().render(DATA, renderer_context=context)
+        )
+
+    def test_known_divergences(self):
+        # orjson drops the exponent sign
+        self.assertEqual(FastJSONRenderer().render({'value': 1e16}), b'{"value":1e16}')
+        self.assertEqual(JSONRenderer().render({'value': 1e16}), b'{"value":1e+16}')
+        # and renders NaN as null where the strict stdlib encoder refuses it
+        self.assertEqual(FastJSONRenderer().render({'value': float('nan')}), b'{"value":null}')
+        with self.assertRaises(ValueError):
+            JSONRenderer().render({'value': float('nan')})
+
+
+    @mock.patch('core.renderers.orjson', None)
+    def test_without_orjson(self):
+        self.assertEqual(FastJSONRenderer().render(DATA), JSONRenderer().render(DATA))
+        self.assertEqual(FastJSONRenderer().render({'value': 1e16}), b'{"value":1e+16}')
+
+
+class FastJSONParserTests(SimpleTestCase):
+    BODY = '{"name": "zażółć", "values": [1, 2.5, null]}'.encode()
+
+    def parse(self, body, encoding='utf-8'):
+        return FastJSONParser().parse(io.BytesIO(body), parser_context={'encoding': encoding})
+
+    def assert_parses(self):
+        self.assertEqual(self.parse(self.BODY), {'name': 'zażółć', 'values': [1, 2.5, None]})
+        self.assertEqual(json_loads(self.BODY), {'name': 'zażółć', 'values': [1, 2.5, None]})
+        with self.assertRaises(ParseError):
+            self.parse(b'{"name": ')
+        # Strict like JSONParser
+        for constant in (b'NaN', b'Infinity'):
+            with self.assertRaises(ValueError):
+                json_loads(b'[' + constant + b']')
+            with self.assertRaises(ParseError):
+                self.parse(b'[' + constant + b']')
+
+    def test_with_orjson(self):
+        self.assert_parses()
+
+    @mock.patch('core.parsers.orjson', None)
+    def test_without_orjson(self):
+        self.assert_parses()
+
+    def test_other_encodings_use_json_parser(self):
+        body = '{"name": "zażółć"}'.encode('iso-8859-2')
+        self.assertEqual(self.parse(body, encoding='iso-8859-2'), {'name': 'zażółć'})
+
+
+class MessagePackRendererTests(SimpleTestCase):
+    def test_values_are_converted_like_json(self):
+        data = {key: value for key, value in DATA.items() if key != 'big'}
+        unpacked = msgpack.unpackb(MessagePackRenderer().render(data), strict_map_key=False)
+        self.assertEqual(unpacked, {
+            'uuid': '00000000-0000-0000-0000-000000000001',
+            'utc': '2024-01-01T12:00:00.123456Z',
+            'local': '2024-01-01T12:00:00+02:00',
+            'date': '2024-01-02',
+            'decimal': 1.5,
+            'float': 0.1,
+            'text': 'zażółć\u2028\u2029',
+            'keys': {1: 'one'},
+            'list': [None, True, 1],
+        })
+
+    def test_integers_over_64_bits_cannot_be_rendered(self):
+        # MessagePack has no type for them, unlike JSON
+        with self.assertRaises(TypeError):
+            MessagePackRenderer().render({'big': 2 ** 70})
+
+    def test_no_content(self):
+        self.assertEqual(MessagePackRenderer().render(None), b'')
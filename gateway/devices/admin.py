@@ -87,7 +87,7 @@ class HasUnreadNotificationsFilter(SimpleListFilter):
 class DeviceAdmin(admin.ModelAdmin):
     list_display = [
         'name', 'mac_address', 'plant_name', 'user', 'is_active',
-        'created_at'
+        'last_seen_at', 'created_at'
     ]
     list_filter = ['is_active', 'user', HasUnreadNotificationsFilter, 'created_at']
     search_fields = ['name', 'mac_address', 'user__username']
@@ -95,12 +95,12 @@ class DeviceAdmin(admin.ModelAdmin):
     list_select_related = ['user']
 
     readonly_fields = [
-        'uuid',  'created_at', 'updated_at',
+        'uuid',  'created_at', 'updated_at', 'last_seen_at',
         'notifications_summary', 'latest_telemetry_summary'
     ]
 
     def latest_telemetry_summary(self, obj):
-        telemetry = obj.get_latest_telemetry()
+        telemetry = obj.get_latest_reading()
         if not telemetry:
             return "No telemetry data available"
 
@@ -164,7 +164,7 @@ class DeviceAdmin(admin.ModelAdmin):
 
     fieldsets = (
         (None, {
-            'fields': ('uuid', 'name', 'mac_address', 'plant_name', 'user', 'is_active')
+            'fields': ('uuid', 'name', 'mac_address', 'plant_name', 'user', 'is_active', 'last_seen_at')
         }),
         ('Latest Telemetry', {
             'fields': ('latest_telemetry_summary',),
@@ -277,7 +277,8 @@ class DeviceSensorLimitsAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related(
             'device',
-            'device__user'
+            'device__user',
+            'device__latest_reading'
         )
 
     def device_link(self, obj):
@@ -324,7 +325,7 @@ class DeviceSensorLimitsAdmin(admin.ModelAdmin):
     soil_moisture_range.short_description = 'Soil Moisture Range'
 
     def current_telemetry(self, obj):
-        latest = obj.device.get_latest_telemetry()
+        latest = obj.device.get_latest_reading()
         if not latest:
             return "No telemetry data available"
 
@@ -425,7 +426,8 @@ class DashboardLayoutAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related(
             'device',
-            'device__user'
+            'device__user',
+            'device__latest_reading'
         )
 
     def device_link(self, obj):
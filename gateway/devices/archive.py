@@ -0,0 +1,265 @@
+"""
+Archive of old raw telemetry in Parquet files.
+
+:func:`archive_before` moves the readings of whole months older than a cutoff
+out of the telemetry table into zstd-compressed Parquet files, one per device
+and month, under TELEMETRY_ARCHIVE_DIR. Every file is recorded in
+TelemetryArchive in the transaction that deletes exactly the archived rows;
+the partition of the month is dropped once it is empty. Notifications of
+archived readings are kept, without their reading.
+
+:func:`read_archived_telemetry` reads archived readings back through memory
+mapped files, so history requests can reach past the data kept in the database.
+"""
+import itertools
+import logging
+import os
+import uuid
+from datetime import date, datetime, time, timezone as dt_timezone
+from operator import attrgetter
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Min
+
+from devices.models import Device, Telemetry, TelemetryArchive
+from devices.partitions import add_months, is_partitioned, list_partitions, month_start, remove_partition
+from notifications.models import UserNotification
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SCHEMA = pa.schema([
+    ('uuid', pa.string()),
+    ('timestamp', pa.timestamp('us', tz='UTC')),
+    ('temperature', pa.float64()),
+    ('humidity', pa.float64()),
+    ('pressure', pa.float64()),
+    ('soil_moisture', pa.int64()),
+    ('created_at', pa.timestamp('us', tz='UTC')),
+    ('updated_at', pa.timestamp('us', tz='UTC')),
+])
+
+COMPRESSION = 'zstd'
+
+# Primary keys per DELETE statement, below the bound parameter limit of SQLite
+DELETE_CHUNK_SIZE = 1000
+
+
+def archive_root() -> Path:
+    return Path(settings.TELEMETRY_ARCHIVE_DIR)
+
+
+def month_bounds(month: date) -> Tuple[datetime, datetime]:
+    """Returns the inclusive start and exclusive end of the month, in UTC."""
+    start = datetime.combine(month, time.min, tzinfo=dt_timezone.utc)
+    end = datetime.combine(add_months(month, 1), time.min, tzinfo=dt_timezone.utc)
+    return start, end
+
+
+def archive_path(device_id, month: date) -> str:
+    """
+    Returns a new file path relative to the archive root. Readings that arrive
+    for an already archived month end up in another file of the same month.
+    """
+    return f'{device_id}/{month:%Y-%m}-{uuid.uuid4().hex[:8]}.parquet'
+
+
+def write_archive_file(path: Path, rows: Iterable[tuple],
+                       chunk_size: int) -> Tuple[int, Optional[datetime], Optional[datetime]]:
+    """
+    Writes readings ordered by timestamp (tuples in ARCHIVE_SCHEMA order) to a
+    Parquet file, one row group per chunk. Returns the row count and the first
+    and last timestamp (None without rows).
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Written under a temporary name so a crash never leaves a truncated file behind
+    partial = path.with_name(f'{path.name}.partial')
+    count = 0
+    first = last = None
+    rows = iter(rows)
+    with pq.ParquetWriter(partial, ARCHIVE_SCHEMA, compression=COMPRESSION) as writer:
+        while chunk := list(itertools.islice(rows, chunk_size)):
+            uuids, *columns = zip(*chunk)
+            arrays = [pa.array([str(value) for value in uuids], type=pa.string())]
+            arrays += [pa.array(column, type=field.type) for column, field in zip(columns, list(ARCHIVE_SCHEMA)[1:])]
+            writer.write_batch(pa.record_batch(arrays, schema=ARCHIVE_SCHEMA))
+            count += len(chunk)
+            first = first or chunk[0][1]
+            last = chunk[-1][1]
+    os.replace(partial, path)
+    return count, first, last
+
+
+def delete_telemetry(uuids: List) -> int:
+    """
+    Deletes the readings with the given primary keys and detaches their
+    notifications, which are kept. Returns the number of readings.
+    """
+    quote = connection.ops.quote_name
+    table = quote(Telemetry._meta.db_table)
+    uuids = [Telemetry._meta.pk.get_db_prep_value(pk, connection) for pk in uuids]
+    deleted = 0
+    with connection.cursor() as cursor:
+        for offset in range(0, len(uuids), DELETE_CHUNK_SIZE):
+            chunk = uuids[offset:offset + DELETE_CHUNK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            # Notifications only reference telemetry logically, there is no foreign key to act on it
+            cursor.execute(
+                f'UPDATE {quote(UserNotification._meta.db_table)} SET telemetry_id = NULL '
+                f'WHERE telemetry_id IN ({placeholders})', chunk
+            )
+            cursor.execute(f'DELETE FROM {table} WHERE uuid IN ({placeholders})', chunk)
+            deleted += cursor.rowcount
+    return deleted
+
+
+def archive_device_month(device_id, month: date, chunk_size: int) -> Optional[TelemetryArchive]:
+    """
+    Archives the readings of the device in the month into a new file and deletes
+    exactly the archived rows, in one transaction. Readings arriving meanwhile
+    stay in the table for the next run. Returns the manifest entry, None when
+    the device has no readings in the month.
+    """
+    start, end = month_bounds(month)
+    rows = Telemetry.objects.filter(
+        device_id=device_id, timestamp__gte=start, timestamp__lt=end
+    ).order_by('timestamp').values_list(*ARCHIVE_SCHEMA.names).iterator(chunk_size=chunk_size)
+
+    uuids = []
+
+    def collect(rows):
+        for row in rows:
+            uuids.append(row[0])
+            yield row
+
+    relative = archive_path(device_id, month)
+    path = archive_root() / relative
+    count, first, last = write_archive_file(path, collect(rows), chunk_size)
+    if first is None or last is None:
+        # Its readings were archived by a concurrent run meanwhile
+        path.unlink(missing_ok=True)
+        return None
+
+    try:
+        with transaction.atomic():
+            manifest = TelemetryArchive.objects.create(
+                device_id=device_id,
+                month=month,
+                path=relative,
+                row_count=count,
+                first_timestamp=first,
+                last_timestamp=last,
+                size_bytes=path.stat().st_size
+            )
+            delete_telemetry(uuids)
+    except Exception:
+        path.unlink(missing_ok=True)
+        raise
+    return manifest
+
+
+def archive_month(month: date, chunk_size: int) -> List[TelemetryArchive]:
+    """
+    Archives all readings of the month, device by device, and removes them from
+    the database. Every device is committed on its own, so an interrupted run
+    keeps the finished devices and the next one continues with the rest.
+    Returns the manifest entries of the written files.
+    """
+    start, end = month_bounds(month)
+    readings = Telemetry.objects.filter(timestamp__gte=start, timestamp__lt=end)
+    device_ids = list(readings.order_by('device_id').values_list('device_id', flat=True).distinct())
+
+    manifests = []
+    for device_id in device_ids:
+        manifest = archive_device_month(device_id, month, chunk_size)
+        if manifest is not None:
+            manifests.append(manifest)
+
+    # The partition is only dropped once it is empty, late readings are archived by the next run
+    if is_partitioned() and month in list_partitions() and not readings.exists():
+        remove_partition(month)
+
+    logger.info(f"Archived {sum(manifest.row_count for manifest in manifests)} readings "
+                f"of {month:%Y-%m} into {len(manifests)} files")
+    return manifests
+
+
+def archive_before(cutoff: date, chunk_size: int) -> List[TelemetryArchive]:
+    """
+    Archives the readings of all months before the month of ``cutoff``, oldest first.
+    Returns the manifest entries of the written files.
+    """
+    cutoff = month_start(cutoff)
+    oldest = Telemetry.objects.filter(
+        timestamp__lt=month_bounds(cutoff)[0]
+    ).aggregate(oldest=Min('timestamp'))['oldest']
+    if oldest is None:
+        return []
+
+    manifests = []
+    month = month_start(oldest.astimezone(dt_timezone.utc))
+    while month < cutoff:
+        manifests.extend(archive_month(month, chunk_size))
+        month = add_months(month, 1)
+    return manifests
+
+
+def _read_archive_file(archive: TelemetryArchive, since: datetime, until: Optional[datetime]) -> Iterator[dict]:
+    filters = [('timestamp', '>=', since)]
+    if until is not None:
+        filters.append(('timestamp', '<', until))
+    table = pq.read_table(archive_root() / archive.path, memory_map=True, filters=filters)
+    return iter(table.to_pylist())
+
+
+def iter_archived_rows(device: Device, columns: Iterable[str], since: Optional[datetime] = None,
+                       until: Optional[datetime] = None, batch_size: int = 10000) -> Iterator[tuple]:
+    """
+    Yields the given columns of the archived readings of the device in [since, until),
+    file by file, oldest file first. Reads one record batch at a time.
+    """
+    columns = list(columns)
+    archives = device.telemetry_archives.order_by('first_timestamp')
+    if since is not None:
+        archives = archives.filter(last_timestamp__gte=since)
+    if until is not None:
+        archives = archives.filter(first_timestamp__lt=until)
+
+    timestamp_index = columns.index('timestamp') if 'timestamp' in columns else None
+    for archive in archives:
+        parquet = pq.ParquetFile(archive_root() / archive.path, memory_map=True)
+        for batch in parquet.iter_batches(batch_size=batch_size, columns=columns):
+            rows: Iterator[tuple] = zip(*(batch.column(name).to_pylist() for name in columns))
+            if timestamp_index is not None and (since is not None or until is not None):
+                rows = (
+                    row for row in rows
+                    if (since is None or row[timestamp_index] >= since)
+                    and (until is None or row[timestamp_index] < until)
+                )
+            yield from rows
+
+
+def read_archived_telemetry(device: Device, since: datetime, until: Optional[datetime] = None) -> List[Telemetry]:
+    """
+    Returns the archived readings of the device in [since, until) as unsaved
+    Telemetry instances, newest first.
+    """
+    archives = device.telemetry_archives.filter(last_timestamp__gte=since)
+    if until is not None:
+        archives = archives.filter(first_timestamp__lt=until)
+
+    readings: List[Telemetry] = []
+    for archive in archives:
+        try:
+            rows = _read_archive_file(archive, since, until)
+        except OSError as e:
+            logger.error(f"Failed to read telemetry archive {archive.path}: {e}")
+            continue
+        readings.extend(Telemetry(device=device, **row) for row in rows)
+
+    readings.sort(key=attrgetter('timestamp'), reverse=True)
+    return readings
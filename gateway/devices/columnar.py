@@ -0,0 +1,60 @@
+"""
+Columnar representation of telemetry for chart clients.
+
+Instead of one object per reading, ``layout=columns`` responses carry one list
+per field, ``{"timestamps": [...], "temperature": [...], ...}``, with timestamps
+as epoch milliseconds. The columns are built from ``values_list`` rows or NumPy
+series directly, without model instances or per-field serializer calls.
+"""
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+
+from devices.downsampling import Series
+from devices.rollups import METRICS
+
+LAYOUT_ROWS = 'rows'
+LAYOUT_COLUMNS = 'columns'
+
+LAYOUTS = (LAYOUT_ROWS, LAYOUT_COLUMNS)
+
+# Columns of the telemetry list besides the timestamps
+TELEMETRY_COLUMNS = ('uuid', 'device') + METRICS
+
+
+def epoch_milliseconds(timestamps: Iterable) -> List[int]:
+    return [round(timestamp.timestamp() * 1000) for timestamp in timestamps]
+
+
+def rows_to_columns(rows: Sequence[Sequence], names: Sequence[str]) -> dict:
+    """
+    Turns (timestamp, *values) rows into columns, ``names`` naming the values.
+    UUIDs become strings, as JSON and msgpack have no type for them.
+    """
+    timestamps, *columns = zip(*rows) if rows else [()] * (len(names) + 1)
+    result: Dict[str, list] = {'timestamps': epoch_milliseconds(timestamps)}
+    for name, column in zip(names, columns):
+        result[name] = [str(value) for value in column] if name in ('uuid', 'device') else list(column)
+    return result
+
+
+def series_to_columns(series: Series, counts: bool = False) -> dict:
+    """
+    Turns a history series into columns of its (average) metrics, optionally with
+    reading counts. Newest first, like the other history representations.
+    """
+    result = {'timestamps': np.round(series.timestamps[::-1] * 1000).astype(np.int64).tolist()}
+    averages = series.averages[::-1]
+    for index, metric in enumerate(METRICS):
+        result[metric] = averages[:, index].tolist()
+    if counts:
+        result['count'] = series.counts[::-1].astype(np.int64).tolist()
+    return result
+
+
+def points_to_columns(points: List[dict]) -> dict:
+    """Turns downsampled points (see devices.downsampling) into columns of the same fields."""
+    if not points:
+        return {'timestamps': [], 'count': [], **{metric: [] for metric in METRICS}}
+    names = [name for name in points[0] if name != 'timestamp']
+    return rows_to_columns([(point['timestamp'], *(point[name] for name in names)) for point in points], names)
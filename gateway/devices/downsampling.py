@@ -0,0 +1,177 @@
+"""
+Server-side downsampling of device telemetry history.
+
+A history series (raw readings or rollup buckets, see devices.history) is loaded
+with ``values_list`` into NumPy arrays and reduced to at most ``max_points``
+points, so the response size follows the chart width instead of the sample rate:
+
+* ``lttb`` - Largest-Triangle-Three-Buckets, keeps the readings that shape the
+  curve. The triangle areas of all metrics (scaled to their range) are summed,
+  so one reading is picked per bucket for every metric.
+* ``minmax`` - equal time buckets with the average, min and max of every metric.
+* ``avg`` - equal time buckets with the average of every metric.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Iterable, List
+
+import numpy as np
+from django.utils import timezone
+
+from devices.archive import iter_archived_rows
+from devices.history import RESOLUTION_RAW
+from devices.models import Device
+from devices.rollups import METRICS
+
+METHOD_LTTB = 'lttb'
+METHOD_MINMAX = 'minmax'
+METHOD_AVG = 'avg'
+
+DOWNSAMPLING_METHODS = (METHOD_LTTB, METHOD_MINMAX, METHOD_AVG)
+
+# LTTB needs the first and the last point plus one bucket in between
+MIN_POINTS = 3
+
+
+@dataclass
+class Series:
+    """History ordered by time, oldest first. Raw readings are buckets of one."""
+    timestamps: np.ndarray
+    counts: np.ndarray
+    sums: np.ndarray
+    minimums: np.ndarray
+    maximums: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def averages(self) -> np.ndarray:
+        return self.sums / self.counts[:, None]
+
+
+def _to_series(rows: List[tuple], aggregated: bool) -> Series:
+    """Builds a series from (timestamp, *values) rows, values as in :func:`load_series`."""
+    if not rows:
+        empty = np.empty((0, len(METRICS)))
+        return Series(np.empty(0), np.empty(0), empty, empty, empty)
+
+    datetimes, *values = zip(*rows)
+    timestamps = np.fromiter((timestamp.timestamp() for timestamp in datetimes), dtype=float, count=len(rows))
+    columns = np.array(values, dtype=float).T
+    if not aggregated:
+        return Series(timestamps, np.ones(len(rows)), columns, columns, columns)
+
+    metrics = len(METRICS)
+    return Series(
+        timestamps,
+        columns[:, 0],
+        columns[:, 1:1 + metrics],
+        columns[:, 1 + metrics:1 + 2 * metrics],
+        columns[:, 1 + 2 * metrics:]
+    )
+
+
+def load_series(device: Device, hours: int, resolution: str) -> Series:
+    """
+    Loads the history of the device for specified number of hours at the given
+    resolution ('raw' or a rollup resolution), without creating model instances.
+    """
+    if resolution != RESOLUTION_RAW:
+        columns = ['count'] + [
+            f'{metric}_{aggregate}' for aggregate in ('sum', 'min', 'max') for metric in METRICS
+        ]
+        rollups = device.get_telemetry_rollups(resolution, hours=hours).order_by('bucket')
+        return _to_series(list(rollups.values_list('bucket', *columns)), aggregated=True)
+
+    since = timezone.now() - timedelta(hours=hours)
+    # Archived months are older than anything left in the table
+    rows = list(iter_archived_rows(device, ('timestamp', *METRICS), since=since))
+    rows += device.get_telemetry_history(hours=hours).order_by('timestamp').values_list('timestamp', *METRICS)
+    return _to_series(rows, aggregated=False)
+
+
+def lttb_indexes(timestamps: np.ndarray, values: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Returns the indexes of the points Largest-Triangle-Three-Buckets keeps of the
+    series. ``values`` has a column per metric; their triangle areas are summed
+    after scaling every metric to its range.
+    """
+    count = len(timestamps)
+    if count <= max_points:
+        return np.arange(count)
+
+    spread = np.ptp(values, axis=0)
+    values = (values - values.min(axis=0)) / np.where(spread > 0, spread, 1)
+    x = (timestamps - timestamps[0]) / max(timestamps[-1] - timestamps[0], 1)
+
+    # The first and the last point are always kept, the rest is split into equal buckets
+    edges = np.linspace(1, count - 1, max_points - 1).astype(int)
+    selected = np.empty(max_points, dtype=int)
+    selected[0], selected[-1] = 0, count - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else count
+        # The third vertex is the average point of the next bucket
+        next_x = x[next_start:next_end].mean()
+        next_values = values[next_start:next_end].mean(axis=0)
+
+        areas = np.abs(
+            (x[previous] - next_x) * (values[start:end] - values[previous])
+            - (x[previous] - x[start:end, None]) * (next_values - values[previous])
+        ).sum(axis=1)
+        previous = start + int(areas.argmax())
+        selected[bucket + 1] = previous
+    return selected
+
+
+def bucket_starts(timestamps: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Splits the time range of the series into max_points equal buckets and returns
+    the index of the first point of every non-empty bucket.
+    """
+    if len(timestamps) <= max_points:
+        return np.arange(len(timestamps))
+    width = max(timestamps[-1] - timestamps[0], 1) / max_points
+    buckets = np.minimum(((timestamps - timestamps[0]) // width).astype(int), max_points - 1)
+    return np.flatnonzero(np.diff(buckets, prepend=-1))
+
+
+def _points(timestamps: Iterable[float], averages: np.ndarray, counts: np.ndarray) -> List[dict]:
+    return [
+        {
+            'timestamp': datetime.fromtimestamp(timestamp, tz=dt_timezone.utc),
+            'count': int(count),
+            **dict(zip(METRICS, values.tolist())),
+        }
+        for timestamp, values, count in zip(timestamps, averages, counts)
+    ]
+
+
+def downsample(series: Series, max_points: int, method: str = METHOD_LTTB) -> List[dict]:
+    """
+    Reduces the series to at most ``max_points`` points, newest first. Every point
+    has a timestamp, the (average) value of every metric and the number of readings
+    it stands for; ``minmax`` points also carry ``<metric>_min`` and ``<metric>_max``.
+    """
+    if not len(series):
+        return []
+
+    if method == METHOD_LTTB:
+        indexes = lttb_indexes(series.timestamps, series.averages, max_points)
+        points = _points(series.timestamps[indexes], series.averages[indexes], series.counts[indexes])
+        return points[::-1]
+
+    starts = bucket_starts(series.timestamps, max_points)
+    counts = np.add.reduceat(series.counts, starts)
+    averages = np.add.reduceat(series.sums, starts) / counts[:, None]
+    points = _points(series.timestamps[starts], averages, counts)
+    if method == METHOD_MINMAX:
+        minimums = np.minimum.reduceat(series.minimums, starts)
+        maximums = np.maximum.reduceat(series.maximums, starts)
+        for point, low, high in zip(points, minimums.tolist(), maximums.tolist()):
+            for metric, minimum, maximum in zip(METRICS, low, high):
+                point[f'{metric}_min'] = minimum
+                point[f'{metric}_max'] = maximum
+    return points[::-1]
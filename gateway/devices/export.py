@@ -0,0 +1,100 @@
+"""
+Streaming export of raw device telemetry.
+
+Rows are read through a server-side cursor (and from the archive files for
+archived months) and encoded chunk by chunk, so memory use does not depend on
+the exported range.
+"""
+import csv
+import io
+import json
+import math
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
+from django.conf import settings
+
+from devices.archive import iter_archived_rows
+from devices.models import Device
+
+EXPORT_COLUMNS = ('timestamp', 'temperature', 'humidity', 'pressure', 'soil_moisture')
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Encoded rows per yielded chunk
+ROWS_PER_CHUNK = 1000
+
+
+def iter_export_rows(device: Device, since: Optional[datetime] = None,
+                     until: Optional[datetime] = None) -> Iterator[tuple]:
+    """Yields EXPORT_COLUMNS of the readings of the device in [since, until), archived ones first."""
+    chunk_size = settings.TELEMETRY_EXPORT_CHUNK_SIZE
+    yield from iter_archived_rows(device, EXPORT_COLUMNS, since, until, batch_size=chunk_size)
+
+    telemetry = device.telemetry.all()
+    if since is not None:
+        telemetry = telemetry.filter(timestamp__gte=since)
+    if until is not None:
+        telemetry = telemetry.filter(timestamp__lt=until)
+    # A server-side cursor on PostgreSQL, only chunk_size rows are held at a time
+    yield from telemetry.order_by('timestamp').values_list(*EXPORT_COLUMNS).iterator(chunk_size=chunk_size)
+
+
+def _chunked(rows: Iterable[tuple]) -> Iterator[list]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == ROWS_PER_CHUNK:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def encode_csv(rows: Iterable[tuple]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for chunk in _chunked(rows):
+        writer.writerows((timestamp.isoformat(), *values) for timestamp, *values in chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only when there are no rows
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _json_value(value):
+    # NaN and infinity are not valid JSON
+    return None if isinstance(value, float) and not math.isfinite(value) else value
+
+
+def encode_ndjson(rows: Iterable[tuple]) -> Iterator[str]:
+    for chunk in _chunked(rows):
+        yield ''.join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, (timestamp.isoformat(), *map(_json_value, values))))) + '\n'
+            for timestamp, *values in chunk
+        )
+
+
+def gzip_stream(chunks: Iterable[str]) -> Iterator[bytes]:
+    """Compresses the chunks into a single gzip stream as they are produced."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_telemetry(device: Device, export_format: str, since: Optional[datetime] = None,
+                     until: Optional[datetime] = None, gzip: bool = False) -> Iterator[str | bytes]:
+    """Returns the encoded export of the readings of the device as an iterator of chunks."""
+    encode = encode_csv if export_format == 'csv' else encode_ndjson
+    chunks = encode(iter_export_rows(device, since, until))
+    return gzip_stream(chunks) if gzip else chunks
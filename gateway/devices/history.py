@@ -0,0 +1,58 @@
+"""
+Choice between raw readings and rollups for device telemetry history.
+
+Short ranges are served from the telemetry table as before. Longer ranges use
+the finest rollup resolution that keeps the response under
+TELEMETRY_HISTORY_MAX_POINTS points per device.
+
+Raw history reaching past the readings kept in the database also returns the
+archived ones (see devices.archive).
+"""
+from datetime import datetime, timedelta
+from typing import List
+
+from django.conf import settings
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from devices.archive import read_archived_telemetry
+from devices.models import Device, Telemetry, TelemetryRollup
+from devices.rollups import RESOLUTIONS, bucket_start
+
+RESOLUTION_RAW = 'raw'
+RESOLUTION_AUTO = 'auto'
+
+HISTORY_RESOLUTIONS = [RESOLUTION_RAW, RESOLUTION_AUTO] + [choice for choice, _ in TelemetryRollup.RESOLUTION_CHOICES]
+
+
+def choose_resolution(hours: int, requested: str = RESOLUTION_AUTO) -> str:
+    """Returns the resolution history of the given range is served at."""
+    if requested != RESOLUTION_AUTO:
+        return requested
+    if hours <= settings.TELEMETRY_HISTORY_RAW_HOURS:
+        return RESOLUTION_RAW
+
+    for resolution, length in RESOLUTIONS.items():
+        if hours * 3600 / length.total_seconds() <= settings.TELEMETRY_HISTORY_MAX_POINTS:
+            return resolution
+    return TelemetryRollup.RESOLUTION_DAY
+
+
+def window_start(hours: int, resolution: str) -> datetime:
+    """
+    Returns the start of the history range, truncated to the buckets of the
+    resolution it is served at (to the minute for raw history). Rollup history
+    only changes when it crosses a bucket boundary.
+    """
+    start = timezone.now() - timedelta(hours=hours)
+    return bucket_start(start, TelemetryRollup.RESOLUTION_MINUTE if resolution == RESOLUTION_RAW else resolution)
+
+
+def get_raw_history(device: Device, hours: int) -> QuerySet[Telemetry] | List[Telemetry]:
+    """Returns the readings of the device for specified number of hours, newest first."""
+    telemetry = device.get_telemetry_history(hours=hours)
+    archived = read_archived_telemetry(device, timezone.now() - timedelta(hours=hours))
+    if not archived:
+        return telemetry
+    # Archived months are older than anything left in the table
+    return list(telemetry) + archived
@@ -0,0 +1,265 @@
+"""
+Telemetry ingestion pipeline shared by all queue backends.
+
+Takes raw queued messages, validates them, drops duplicates, stores the readings
+and the limit notifications in one transaction and updates device status
+and the telemetry rollups. Cached responses of the devices are invalidated after
+the commit.
+"""
+import functools
+import json
+import logging
+import math
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import pytz
+from django.db import transaction
+
+from core.uuids import uuid7
+from devices.limits import evaluate_sensor_limits
+from devices.models import Telemetry
+from devices.registry import get_device_registry
+from devices.response_cache import bump_generations
+from devices.rollups import update_rollups
+from devices.status import mark_devices_seen, update_latest_telemetry
+from devices.writers import TelemetryRow, write_telemetry
+from notifications.models import UserNotification
+
+logger = logging.getLogger(__name__)
+
+# Raised by parse_timestamp for invalid input, pytz's for naive times a DST change skips or repeats
+TIMESTAMP_ERRORS = (TypeError, ValueError, pytz.exceptions.Error)
+
+# Range of the soil_moisture integer column
+SOIL_MOISTURE_RANGE = (-2 ** 31, 2 ** 31 - 1)
+
+
+@dataclass
+class IngestResult:
+    """Counters of a single ingest run."""
+    processed: int = 0
+    errors: int = 0
+    duplicates: int = 0
+    notifications: int = 0
+    # Raw MAC addresses that do not belong to any registered device
+    unknown_macs: Set[str] = field(default_factory=set)
+    # Outcome of every message in input order, only collected on request
+    items: Optional[List[Optional[Dict[str, Any]]]] = None
+
+    def set_item(self, index: int, status: str, **details) -> None:
+        if self.items is not None:
+            self.items[index] = {'status': status, **details}
+
+    @property
+    def message(self) -> str:
+        if not self.processed:
+            return f"No valid telemetry data to process. Errors: {self.errors}, Duplicates: {self.duplicates}"
+        return (f"Processed {self.processed} telemetry records "
+                f"({self.processed} saved, {self.errors} errors, "
+                f"{self.duplicates} duplicates, {self.notifications} notifications)")
+
+
+def format_mac_address(mac: str) -> str:
+    """
+    Format MAC address from raw format (e.g. '10061c41d104')
+    to standard format (e.g. '10:06:1C:41:D1:04')
+    """
+    # Remove any existing colons and convert to uppercase
+    mac = mac.replace(':', '').upper()
+    # Insert colons every 2 characters
+    return ':'.join(mac[i:i+2] for i in range(0, len(mac), 2))
+
+
+def parse_timestamp(timestamp_str: str) -> datetime:
+    """
+    Parse timestamp string and convert to UTC timezone.
+    Input timestamp is assumed to be in Europe/Warsaw timezone if no timezone info is provided.
+    """
+    # Parse the timestamp
+    timestamp = datetime.fromisoformat(timestamp_str)
+
+    # If timestamp is naive (no timezone info), assume it's in Europe/Warsaw
+    if timestamp.tzinfo is None:
+        local_tz = pytz.timezone('Europe/Warsaw')
+        # Najpierw utwórz świadomy czasowo datetime w strefie Warsaw
+        local_dt = local_tz.localize(timestamp, is_dst=None)
+        # Następnie przekonwertuj do UTC
+        utc_dt = local_dt.astimezone(pytz.UTC)
+        logger.debug(f"Converted naive timestamp {timestamp_str} from Europe/Warsaw to UTC: {utc_dt}")
+        return utc_dt
+
+    # Jeśli timestamp już ma strefę czasową, po prostu przekonwertuj do UTC
+    utc_dt = timestamp.astimezone(pytz.UTC)
+    logger.debug(f"Converted aware timestamp {timestamp_str} to UTC: {utc_dt}")
+    return utc_dt
+
+
+def find_existing_telemetry(keys: Set[Tuple[Any, datetime]]) -> Set[Tuple[Any, datetime]]:
+    """
+    Returns the subset of (device pk, timestamp) pairs that are already stored.
+    Uses a single query for the whole batch.
+    """
+    if not keys:
+        return set()
+
+    device_ids = {device_id for device_id, _ in keys}
+    timestamps = {timestamp for _, timestamp in keys}
+    stored = Telemetry.objects.filter(
+        device_id__in=device_ids,
+        timestamp__in=timestamps
+    ).values_list('device_id', 'timestamp')
+    return keys.intersection(stored)
+
+
+def ingest_telemetry(messages: Sequence[Tuple[str, bytes | Dict[str, Any]]], method: Optional[str] = None,
+                     collect_items: bool = False) -> IngestResult:
+    """
+    Stores a batch of queued telemetry messages.
+
+    Args:
+        messages: (raw MAC address, JSON payload or decoded dict) pairs in queue order
+        method: write method (see devices.writers), TELEMETRY_WRITE_METHOD by default
+        collect_items: report the outcome of every message in ``IngestResult.items``
+
+    Malformed messages are logged and counted as errors. Messages of unknown
+    devices are skipped and reported in ``IngestResult.unknown_macs``.
+    Raises on database errors, in which case nothing is stored.
+    """
+    result = IngestResult(items=[None] * len(messages) if collect_items else None)
+    # Device metadata comes from the registry cache, not from the database
+    devices_by_key = get_device_registry().get_many({raw_mac for raw_mac, _ in messages})
+
+    candidates = []
+    seen_keys = set()
+    # uuid of a candidate row -> index of its message
+    indexes = {}
+
+    for index, (raw_mac, raw_data) in enumerate(messages):
+        if raw_mac not in devices_by_key:
+            result.unknown_macs.add(raw_mac)
+            result.set_item(index, 'unknown_device')
+            continue
+        device = devices_by_key[raw_mac]
+
+        try:
+            # Parse telemetry data (bulk imports pass it already decoded)
+            telemetry_data = raw_data if isinstance(raw_data, dict) else json.loads(raw_data)
+            logger.debug(f"Processing telemetry for device: {device.mac_address}")
+
+            # Parse and convert timestamp
+            try:
+                timestamp = parse_timestamp(telemetry_data['timestamp'])
+                logger.debug(f"Parsed timestamp {telemetry_data['timestamp']} to UTC: {timestamp}")
+            except TIMESTAMP_ERRORS as e:
+                logger.error(f"Error parsing timestamp: {e}, Data: {telemetry_data['timestamp']}")
+                result.errors += 1
+                result.set_item(index, 'invalid', error=f"Invalid timestamp: {e}")
+                continue
+
+            # Create telemetry row with device, a malformed value only rejects its own message
+            row = TelemetryRow(
+                uuid=uuid7(),
+                device=device,
+                temperature=float(telemetry_data['temperature']),
+                humidity=float(telemetry_data['humidity']),
+                pressure=float(telemetry_data['pressure']),
+                soil_moisture=int(telemetry_data['soil_moisture']),
+                timestamp=timestamp
+            )
+            # Values the database rejects or cannot compare must not fail the whole batch
+            if not all(map(math.isfinite, (row.temperature, row.humidity, row.pressure))):
+                raise ValueError("Temperature, humidity and pressure must be finite numbers")
+            if not SOIL_MOISTURE_RANGE[0] <= row.soil_moisture <= SOIL_MOISTURE_RANGE[1]:
+                raise ValueError(f"Soil moisture {row.soil_moisture} is out of range")
+
+            # The same reading may be queued twice (e.g. a producer retry)
+            if (device.pk, timestamp) in seen_keys:
+                logger.info(f"Duplicate telemetry found for device {device.mac_address} at {timestamp}")
+                result.duplicates += 1
+                result.set_item(index, 'duplicate')
+                continue
+            seen_keys.add((device.pk, timestamp))
+            candidates.append(row)
+            indexes[row.uuid] = index
+
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError, OverflowError) as e:
+            logger.error(f"Error processing telemetry data: {e}, Data: {raw_data!r}")
+            result.errors += 1
+            result.set_item(index, 'invalid', error=f"{type(e).__name__}: {e}")
+            continue
+
+    for raw_mac in result.unknown_macs:
+        logger.warning(f"Telemetry queued for unknown device: {raw_mac}")
+
+    # One query for the whole batch instead of an EXISTS per record
+    existing_keys = find_existing_telemetry(seen_keys)
+
+    telemetry_rows = []
+    for telemetry in candidates:
+        device = telemetry.device
+        if (device.pk, telemetry.timestamp) in existing_keys:
+            logger.info(f"Duplicate telemetry found for device {device.mac_address} at {telemetry.timestamp}")
+            result.duplicates += 1
+            result.set_item(indexes[telemetry.uuid], 'duplicate')
+            continue
+        telemetry_rows.append(telemetry)
+
+    if not telemetry_rows:
+        return result
+
+    # Sort telemetry by timestamp to ensure chronological order
+    telemetry_rows.sort(key=lambda x: x.timestamp)
+
+    # Write all telemetry records and notifications in transaction
+    with transaction.atomic():
+        logger.info(f"Starting bulk write of {len(telemetry_rows)} telemetry records")
+        # Rows inserted concurrently since the lookup above are skipped by the
+        # unique constraint instead of failing the whole batch
+        inserted = write_telemetry(telemetry_rows, method)
+
+        saved_rows = []
+        for telemetry in telemetry_rows:
+            if telemetry.uuid not in inserted:
+                logger.info(f"Duplicate telemetry found for device {telemetry.device.mac_address} "
+                            f"at {telemetry.timestamp}")
+                result.duplicates += 1
+                result.set_item(indexes[telemetry.uuid], 'duplicate')
+                continue
+            saved_rows.append(telemetry)
+            result.set_item(indexes[telemetry.uuid], 'created', uuid=str(telemetry.uuid))
+        result.processed = len(saved_rows)
+
+        # Check sensor limits of the whole batch at once and create notifications if needed
+        notification_objects = []
+        for index, (violations, severity) in evaluate_sensor_limits(saved_rows).items():
+            telemetry = saved_rows[index]
+            device = telemetry.device
+            notification_objects.append(UserNotification(
+                user_id=device.user_id,
+                device_id=device.pk,
+                telemetry_id=telemetry.uuid,
+                message="\n".join(violations),
+                severity=severity
+            ))
+            result.notifications += 1
+            logger.info(f"Created {severity} notification for device {device.mac_address}: {violations}")
+
+        if notification_objects:
+            logger.info(f"Creating {len(notification_objects)} notifications")
+            UserNotification.objects.bulk_create(notification_objects)
+
+        # Rows are sorted by timestamp, so the last one of every device is its latest
+        latest = {telemetry.device.pk: telemetry.timestamp for telemetry in saved_rows}
+        updated = mark_devices_seen(latest)
+        logger.info(f"Updated last seen time of {updated} devices")
+        update_latest_telemetry(saved_rows)
+        # Once committed, so no response is cached under the new generation from the old data
+        transaction.on_commit(functools.partial(bump_generations, latest))
+
+        # Only newly inserted rows, so a redelivered batch is not counted twice
+        buckets = update_rollups(saved_rows)
+        logger.info(f"Updated {buckets} telemetry rollup buckets")
+
+    return result
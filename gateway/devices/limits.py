@@ -0,0 +1,99 @@
+"""
+Batch evaluation of sensor limits.
+
+Gives the same violations as ``DeviceSensorLimits.check_limits``, but compares
+the whole batch at once with NumPy and only formats messages for the violating
+readings.
+"""
+from operator import attrgetter
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from devices.models import DeviceSensorLimits
+
+# (reading attribute, min limit, max limit, below message, above message) in check_limits order
+SENSOR_CHECKS = (
+    ('temperature', 'temp_min', 'temp_max',
+     "Temperature {value}°C is below minimum {limit}°C",
+     "Temperature {value}°C is above maximum {limit}°C"),
+    ('humidity', 'humidity_min', 'humidity_max',
+     "Humidity {value}% is below minimum {limit}%",
+     "Humidity {value}% is above maximum {limit}%"),
+    ('pressure', 'pressure_min', 'pressure_max',
+     "Pressure {value}hPa is below minimum {limit}hPa",
+     "Pressure {value}hPa is above maximum {limit}hPa"),
+    ('soil_moisture', 'soil_moisture_min', 'soil_moisture_max',
+     "Soil moisture {value} is below minimum {limit}",
+     "Soil moisture {value} is above maximum {limit}"),
+)
+
+
+def violation_severity(count: int) -> str:
+    """Determine severity based on number of violations."""
+    if not count:
+        return 'info'
+    if count <= 2:
+        return 'warning'
+    return 'critical'
+
+
+def _device_limits(device) -> DeviceSensorLimits | None:
+    try:
+        return device.sensor_limits
+    except DeviceSensorLimits.DoesNotExist:
+        return None
+
+
+def evaluate_sensor_limits(readings: Sequence[Any]) -> Dict[int, Tuple[List[str], str]]:
+    """
+    Checks a batch of readings (Telemetry or TelemetryRow) against the limits
+    of their devices.
+
+    Returns the (violation messages, severity) pair of every violating reading,
+    keyed by its index in ``readings``. Devices without limits are never violated.
+    """
+    count = len(readings)
+    if not count:
+        return {}
+
+    # One limits row per device instance, readings point at it by index
+    device_index: Dict[int, int] = {}
+    device_limits: List[DeviceSensorLimits | None] = []
+    indexes = []
+    for device in map(attrgetter('device'), readings):
+        index = device_index.get(id(device))
+        if index is None:
+            index = device_index[id(device)] = len(device_limits)
+            device_limits.append(_device_limits(device))
+        indexes.append(index)
+    reading_devices = np.fromiter(indexes, dtype=np.intp, count=count)
+
+    # Devices without limits get NaN bounds, which never compare as violated
+    bounds = np.array([
+        [getattr(limits, name) if limits else np.nan for _, low, high, *_ in SENSOR_CHECKS for name in (low, high)]
+        for limits in device_limits
+    ], dtype=float)[reading_devices]
+    values = np.column_stack([
+        np.fromiter(map(attrgetter(attribute), readings), dtype=float, count=count)
+        for attribute, *_ in SENSOR_CHECKS
+    ])
+
+    below = values < bounds[:, 0::2]
+    # check_limits only checks the maximum when the minimum is not violated
+    above = ~below & (values > bounds[:, 1::2])
+
+    violating = np.flatnonzero((below | above).any(axis=1))
+    results = {}
+    for i, row_below, row_above in zip(violating.tolist(), below[violating].tolist(), above[violating].tolist()):
+        reading = readings[i]
+        limits = device_limits[indexes[i]]
+        violations = []
+        for is_below, is_above, (attribute, low, high, below_message, above_message) in zip(
+                row_below, row_above, SENSOR_CHECKS):
+            if is_below:
+                violations.append(below_message.format(value=getattr(reading, attribute), limit=getattr(limits, low)))
+            elif is_above:
+                violations.append(above_message.format(value=getattr(reading, attribute), limit=getattr(limits, high)))
+        results[i] = (violations, violation_severity(len(violations)))
+    return results
@@ -0,0 +1,39 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from devices.archive import archive_before
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves whole months of telemetry older than the given age from the database "
+        "to Parquet files in TELEMETRY_ARCHIVE_DIR. Also run daily by Celery beat."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days', type=int, default=settings.TELEMETRY_ARCHIVE_AFTER_DAYS,
+            help="Archive the months that ended before the month of this many days ago",
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=settings.TELEMETRY_ARCHIVE_CHUNK_SIZE,
+            help="Number of readings read and written at once",
+        )
+
+    def handle(self, *args, **options):
+        if options['older_than_days'] <= 0:
+            raise CommandError("Set --older-than-days or TELEMETRY_ARCHIVE_AFTER_DAYS")
+
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+        archives = archive_before(cutoff.date(), options['chunk_size'])
+        for archive in archives:
+            self.stdout.write(f"{archive.path}: {archive.row_count} readings, {archive.size_bytes} bytes")
+        self.stdout.write(
+            f"Archived {sum(archive.row_count for archive in archives)} readings into {len(archives)} files"
+        )
@@ -0,0 +1,87 @@
+import logging
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from devices.archive import month_bounds
+from devices.ingest import format_mac_address
+from devices.models import Device, Telemetry
+from devices.response_cache import bump_generations
+from devices.rollups import RollupAggregator, lock_rollups, replace_rollups
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the telemetry rollups from stored readings, e.g. after enabling "
+        "rollups on existing data. Ingest keeps them up to date afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--device', action='append', default=[],
+            help="MAC address of a device to rebuild (repeatable, all devices by default)",
+        )
+        parser.add_argument(
+            '--days', type=int, default=0,
+            help="Only rebuild the last N days, starting at midnight UTC (0 rebuilds everything)",
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=5000,
+            help="Number of readings fetched from the database at once",
+        )
+
+    def handle(self, *args, **options):
+        devices = Device.objects.order_by('created_at')
+        if options['device']:
+            macs = [format_mac_address(mac) for mac in options['device']]
+            devices = devices.filter(mac_address__in=macs)
+            if not devices.exists():
+                raise CommandError(f"No devices found for {', '.join(macs)}")
+
+        since = None
+        if options['days'] > 0:
+            since = timezone.now() - timedelta(days=options['days'])
+            since = since.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        total_readings = total_buckets = 0
+        for device in devices.iterator():
+            device_since = self._rebuild_since(device, since)
+            telemetry = Telemetry.objects.filter(device=device)
+            if device_since is not None:
+                telemetry = telemetry.filter(timestamp__gte=device_since)
+
+            aggregator = RollupAggregator()
+            readings = 0
+            rows = telemetry.order_by('timestamp').values_list(
+                'device_id', 'timestamp', 'temperature', 'humidity', 'pressure', 'soil_moisture'
+            )
+            with transaction.atomic():
+                # Ingest of the device waits until the rebuilt buckets are committed
+                lock_rollups([device.pk], exclusive=True)
+                for row in rows.iterator(chunk_size=options['chunk_size']):
+                    aggregator.add(*row)
+                    readings += 1
+                buckets = replace_rollups(device.pk, device_since, aggregator.buckets)
+            # Cached history responses and their ETags are built from the old rollups
+            bump_generations([device.pk])
+            total_readings += readings
+            total_buckets += buckets
+            logger.info(f"Rebuilt {buckets} rollup buckets of device {device.mac_address} from {readings} readings")
+
+        self.stdout.write(f"Rebuilt {total_buckets} rollup buckets from {total_readings} readings")
+
+    def _rebuild_since(self, device, since):
+        """
+        Rollups of archived months cannot be rebuilt from the table, only the
+        months after the last archived one are replaced.
+        """
+        archived = device.telemetry_archives.aggregate(month=Max('month'))['month']
+        if archived is None:
+            return since
+        archived_until = month_bounds(archived)[1]
+        return archived_until if since is None else max(since, archived_until)
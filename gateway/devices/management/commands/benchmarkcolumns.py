@@ -0,0 +1,74 @@
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from core.renderers import MessagePackRenderer
+from core.uuids import uuid7
+from devices.columnar import rows_to_columns, TELEMETRY_COLUMNS
+from devices.models import Device, Telemetry
+from devices.serializers import TelemetrySerializer
+
+RENDERERS = {
+    'json': JSONRenderer(),
+    'msgpack': MessagePackRenderer(),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares serializing telemetry with TelemetrySerializer (one object per reading) "
+        "and the columnar layout, rendered as JSON and msgpack. The readings are inserted "
+        "for a scratch device and rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help="Readings to serialize")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per variant, the fastest is reported")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            device = self._create_readings(options['rows'])
+            telemetry = Telemetry.objects.filter(device=device).order_by('-timestamp')
+
+            variants = {
+                'rows': lambda: TelemetrySerializer(telemetry.select_related('device'), many=True).data,
+                'columns': lambda: rows_to_columns(
+                    telemetry.values_list('timestamp', *TELEMETRY_COLUMNS), TELEMETRY_COLUMNS
+                ),
+            }
+            self.stdout.write(f"{'layout':<10}{'format':<10}{'seconds':>10}{'bytes':>14}")
+            for layout, build in variants.items():
+                for name, renderer in RENDERERS.items():
+                    timings = []
+                    for _ in range(options['repeat']):
+                        started = time.perf_counter()
+                        content = renderer.render(build())
+                        timings.append(time.perf_counter() - started)
+                    self.stdout.write(f"{layout:<10}{name:<10}{min(timings):>10.3f}{len(content):>14}")
+
+            transaction.set_rollback(True)
+
+    def _create_readings(self, rows):
+        user = get_user_model().objects.create(email=f'benchmark-{uuid7().hex}@example.com')
+        device = Device.objects.create(name='Benchmark', mac_address='00:00:00:00:00:00', user=user)
+        start = timezone.now() - timedelta(seconds=rows)
+        Telemetry.objects.bulk_create(
+            (
+                Telemetry(
+                    device=device,
+                    temperature=21.5 + i % 10 / 10,
+                    humidity=55.0,
+                    pressure=1013.0,
+                    soil_moisture=450,
+                    timestamp=start + timedelta(seconds=i)
+                )
+                for i in range(rows)
+            ),
+            batch_size=5000
+        )
+        return device
@@ -0,0 +1,95 @@
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.uuids import uuid7
+
+GENERATORS = {
+    'uuid4': uuid.uuid4,
+    'uuid7': uuid7,
+}
+
+# Rows per INSERT statement
+STATEMENT_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares insert throughput, primary key index size and WAL volume of random "
+        "(uuid4) and time-ordered (uuid7) keys on scratch tables shaped like telemetry."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000, help="Rows inserted per key type")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per transaction")
+        parser.add_argument('--keep', action='store_true', help="Keep the scratch tables for inspection")
+
+    def handle(self, *args, **options):
+        is_postgresql = connection.vendor == 'postgresql'
+        self.stdout.write(f"{'keys':<8}{'rows/s':>12}{'index size':>14}{'WAL':>14}")
+        for name, generator in GENERATORS.items():
+            table = f'benchmark_keys_{name}'
+            self._create_table(table)
+            wal_start = self._wal_position() if is_postgresql else None
+
+            started = time.perf_counter()
+            self._insert(table, generator, options['rows'], options['batch_size'])
+            elapsed = time.perf_counter() - started
+
+            index_size = wal = 'n/a'
+            if is_postgresql:
+                index_size = self._index_size(f'{table}_pkey')
+                wal = self._wal_bytes_since(wal_start)
+            self.stdout.write(f"{name:<8}{options['rows'] / elapsed:>12.0f}{index_size:>14}{wal:>14}")
+
+            if not options['keep']:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'DROP TABLE {table}')
+
+    def _create_table(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+            cursor.execute(
+                f'CREATE TABLE {table} ('
+                f'uuid uuid PRIMARY KEY, device_id uuid NOT NULL, "timestamp" timestamptz NOT NULL, '
+                f'temperature double precision NOT NULL, humidity double precision NOT NULL, '
+                f'pressure double precision NOT NULL, soil_moisture integer NOT NULL)'
+            )
+
+    def _insert(self, table, generator, rows, batch_size):
+        devices = [str(uuid.uuid4()) for _ in range(100)]
+        start = timezone.now()
+        inserted = 0
+        while inserted < rows:
+            batch = min(batch_size, rows - inserted)
+            with transaction.atomic(), connection.cursor() as cursor:
+                for offset in range(0, batch, STATEMENT_SIZE):
+                    count = min(STATEMENT_SIZE, batch - offset)
+                    params = []
+                    for i in range(inserted + offset, inserted + offset + count):
+                        params += [str(generator()), devices[i % len(devices)],
+                                   start + timedelta(seconds=i), 21.5, 55.0, 1013.0, 450]
+                    cursor.execute(
+                        f'INSERT INTO {table} VALUES {", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * count)}',
+                        params
+                    )
+            inserted += batch
+
+    def _index_size(self, index):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_size_pretty(pg_relation_size(%s::regclass))', [index])
+            return cursor.fetchone()[0]
+
+    def _wal_position(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_current_wal_lsn()')
+            return cursor.fetchone()[0]
+
+    def _wal_bytes_since(self, position):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_size_pretty(pg_wal_lsn_diff(pg_current_wal_lsn(), %s))', [position])
+            return cursor.fetchone()[0]
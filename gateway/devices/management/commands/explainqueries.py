@@ -0,0 +1,69 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from devices.ingest import format_mac_address
+from devices.models import Device, Telemetry
+from notifications.models import UserNotification
+
+
+class Command(BaseCommand):
+    help = (
+        "Prints the EXPLAIN output of the hot telemetry, device and notification queries "
+        "for one device, to check which indexes they use."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device', help="MAC address of the device to use (the most recently seen by default)")
+        parser.add_argument('--analyze', action='store_true', help="Run the queries (EXPLAIN ANALYZE, BUFFERS)")
+
+    def handle(self, *args, **options):
+        devices = Device.objects.all()
+        if options['device']:
+            device = devices.filter(mac_address=format_mac_address(options['device'])).first()
+        else:
+            device = devices.filter(last_seen_at__isnull=False).order_by('-last_seen_at').first()
+        if device is None:
+            raise CommandError("No device found")
+
+        since = timezone.now() - timedelta(hours=24)
+        timestamps = list(
+            Telemetry.objects.filter(device=device).order_by('-timestamp').values_list('timestamp', flat=True)[:100]
+        ) or [since]
+        queries = {
+            # Duplicate check of an ingest batch
+            'ingest duplicates': Telemetry.objects.filter(
+                device_id__in=[device.pk], timestamp__in=timestamps
+            ).values_list('device_id', 'timestamp'),
+            'latest reading time': Telemetry.objects.filter(
+                device=device
+            ).order_by('-timestamp').values_list('timestamp', flat=True)[:1],
+            'readings in range': Telemetry.objects.filter(
+                device=device, timestamp__gte=since
+            ).values_list('timestamp', flat=True),
+            'device history': device.get_telemetry_history(hours=24),
+            'user devices': Device.objects.filter(user_id=device.user_id),
+            'user notifications': UserNotification.objects.filter(user_id=device.user_id)[:50],
+            # Counted and updated by mark_all_as_read, without ordering
+            'unread notifications': UserNotification.objects.filter(
+                user_id=device.user_id, is_read=False
+            ).order_by().values_list('user_id', flat=True),
+        }
+
+        explain_options = {}
+        if options['analyze'] and connection.vendor == 'postgresql':
+            explain_options = {'analyze': True, 'buffers': True}
+
+        for name, queryset in queries.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain(**explain_options))
+            self.stdout.write('')
+
+        if connection.vendor == 'postgresql':
+            self.stdout.write(
+                "Index Only Scans read the heap for pages not marked all-visible yet, "
+                "their 'Heap Fetches' drop after VACUUM."
+            )
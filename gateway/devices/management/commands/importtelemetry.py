@@ -0,0 +1,78 @@
+import json
+import logging
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from devices.ingest import IngestResult, ingest_telemetry
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports telemetry from a newline-delimited JSON file (or '-' for stdin). Every line holds "
+        "a reading in the queue format plus the device MAC address: "
+        '{"mac": "10:06:1C:41:D1:04", "timestamp": "...", "temperature": ..., ...}. '
+        "Readings already stored are skipped, so an interrupted import can be rerun."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="NDJSON file to import, '-' reads stdin")
+        parser.add_argument(
+            '--chunk-size', type=int, default=10000,
+            help="Number of readings written per transaction",
+        )
+        parser.add_argument(
+            '--method', choices=['copy', 'bulk_create'], default=None,
+            help="Write method (default: TELEMETRY_WRITE_METHOD)",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        total = IngestResult()
+
+        source = sys.stdin if options['path'] == '-' else self.open(options['path'])
+        try:
+            chunk = []
+            for line_number, line in enumerate(source, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    data = json.loads(line)
+                    raw_mac = data['mac'].replace(':', '').lower()
+                except (json.JSONDecodeError, KeyError, TypeError, AttributeError) as e:
+                    logger.error(f"Skipping line {line_number}: {e}")
+                    total.errors += 1
+                    continue
+
+                chunk.append((raw_mac, data))
+                if len(chunk) >= chunk_size:
+                    self.import_chunk(chunk, options['method'], total)
+                    chunk = []
+
+            if chunk:
+                self.import_chunk(chunk, options['method'], total)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        if total.unknown_macs:
+            self.stderr.write(f"Unknown devices: {', '.join(sorted(total.unknown_macs))}")
+        self.stdout.write(self.style.SUCCESS(total.message))
+
+    def open(self, path):
+        try:
+            return open(path, encoding='utf-8')
+        except OSError as e:
+            raise CommandError(f"Cannot open {path}: {e}")
+
+    def import_chunk(self, chunk, method, total: IngestResult) -> None:
+        result = ingest_telemetry(chunk, method)
+        total.processed += result.processed
+        total.errors += result.errors
+        total.duplicates += result.duplicates
+        total.notifications += result.notifications
+        total.unknown_macs |= result.unknown_macs
+        self.stdout.write(result.message)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from devices.response_cache import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = "Prints the hits and misses of the device response cache per endpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Reset the counters after printing them")
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        if not stats:
+            self.stdout.write("No cached requests counted yet")
+        else:
+            self.stdout.write(f"{'endpoint':<16}{'hits':>10}{'misses':>10}{'hit rate':>10}")
+            for endpoint, counts in sorted(stats.items()):
+                total = counts['hits'] + counts['misses']
+                self.stdout.write(
+                    f"{endpoint:<16}{counts['hits']:>10}{counts['misses']:>10}{counts['hits'] / total:>10.1%}"
+                )
+
+        if options['reset']:
+            reset_stats()
+            self.stdout.write("Counters reset")
@@ -0,0 +1,175 @@
+import logging
+import signal
+import time
+
+import redis
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.redis_client import get_redis_client
+from devices.ingest import ingest_telemetry
+from devices.queues import default_consumer_name, get_telemetry_queue
+from devices.sharding import ShardCoordinator
+
+logger = logging.getLogger(__name__)
+
+# Upper bound of the pause after a failed flush, in seconds
+MAX_BACKOFF = 30
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the telemetry ingest worker. Blocks on the Redis queue and stores "
+        "the telemetry in batches flushed by size or age. Only the shards the worker holds "
+        "a lease on are consumed. Stops gracefully on SIGTERM/SIGINT."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.TELEMETRY_INGEST_FLUSH_SIZE,
+            help="Flush once this many records are buffered",
+        )
+        parser.add_argument(
+            '--max-age', type=float, default=settings.TELEMETRY_INGEST_FLUSH_AGE,
+            help="Flush once the oldest buffered record waits this many seconds",
+        )
+        parser.add_argument(
+            '--block', type=int, default=1000,
+            help="Milliseconds a single read waits for new data",
+        )
+        parser.add_argument(
+            '--consumer', default=None,
+            help="Consumer name within the stream consumer group (default: hostname-pid)",
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        batch_size = options['batch_size']
+        max_age = options['max_age']
+        block = options['block']
+        consumer = options['consumer'] or default_consumer_name()
+        client = get_redis_client()
+        queue = get_telemetry_queue(client, consumer, shards=[])
+        coordinator = ShardCoordinator(client, consumer)
+        # Leases are renewed a few times per TTL so a slow cycle does not lose them
+        rebalance_interval = coordinator.lease_ttl / 3
+        next_rebalance = 0.0
+
+        buffered = []
+        buffered_count = 0
+        oldest = None
+        backoff = 1
+
+        logger.info(f"Telemetry ingest worker started ({settings.TELEMETRY_QUEUE_BACKEND} backend)")
+        while True:
+            # Shards only change between flushes, so every buffered batch belongs to the held leases
+            if not buffered and not self.stopping and time.monotonic() >= next_rebalance:
+                try:
+                    queue.shards = coordinator.rebalance()
+                except redis.RedisError as e:
+                    logger.error(f"Failed to renew shard leases: {e}")
+                    queue.shards = []
+                next_rebalance = time.monotonic() + rebalance_interval
+
+            if not buffered and not queue.shards:
+                if self.stopping:
+                    break
+                time.sleep(min(block / 1000, rebalance_interval))
+                continue
+
+            if not self.stopping and buffered_count < batch_size:
+                # Do not wait longer than the oldest buffered record may
+                wait = block
+                if oldest is not None:
+                    wait = max(int((oldest + max_age - time.monotonic()) * 1000), 0)
+                try:
+                    batch = queue.fetch(block=wait or None)
+                except redis.RedisError as e:
+                    logger.error(f"Failed to read telemetry queue: {e}")
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, MAX_BACKOFF)
+                    continue
+
+                if batch.receipt:
+                    buffered.append(batch)
+                    buffered_count += len(batch.messages)
+                    if oldest is None:
+                        oldest = time.monotonic()
+
+            if not buffered:
+                if self.stopping:
+                    break
+                continue
+
+            expired = time.monotonic() - oldest >= max_age
+            if not (self.stopping or expired or buffered_count >= batch_size):
+                continue
+
+            if self.flush(queue, coordinator, buffered):
+                backoff = 1
+            else:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+            buffered = []
+            buffered_count = 0
+            oldest = None
+
+        try:
+            coordinator.release_all()
+        except redis.RedisError as e:
+            logger.error(f"Failed to release shard leases: {e}")
+        logger.info("Telemetry ingest worker stopped")
+
+    def flush(self, queue, coordinator, batches) -> bool:
+        """
+        Stores the buffered batches and acknowledges them. Returns False on failure.
+
+        The batches are only acknowledged while the worker still holds its leases;
+        otherwise the new owner may have read the same records and they are
+        released instead (the stored copies are skipped as duplicates later).
+        """
+        messages = [message for batch in batches for message in batch.messages]
+        close_old_connections()
+        try:
+            result = ingest_telemetry(messages)
+        except Exception as e:
+            logger.error(f"Unexpected error during telemetry processing: {e}", exc_info=True)
+            self.release(queue, batches)
+            return False
+
+        try:
+            lost = coordinator.renew()
+        except redis.RedisError as e:
+            # Stored already, the records are read again and skipped as duplicates
+            logger.error(f"Failed to renew shard leases, releasing the batches: {e}")
+            self.release(queue, batches)
+            return False
+        if lost:
+            logger.warning(f"Lost leases of shards {sorted(lost)} while ingesting, releasing the batches")
+            queue.shards = sorted(coordinator.owned)
+            self.release(queue, batches)
+            return True
+
+        for batch in batches:
+            queue.ack(batch, retain=result.unknown_macs)
+        logger.info(result.message)
+        return True
+
+    def release(self, queue, batches) -> None:
+        """
+        Releases the batches. The queue forgets them before talking to Redis, so
+        later reads do not skip their records even when Redis is unavailable.
+        """
+        for batch in batches:
+            try:
+                queue.release(batch)
+            except redis.RedisError as e:
+                logger.error(f"Failed to release a telemetry batch: {e}")
+
+    def stop(self, signum, frame):
+        logger.info(f"Received signal {signum}, flushing buffered telemetry and stopping")
+        self.stopping = True
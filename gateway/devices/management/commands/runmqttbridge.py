@@ -0,0 +1,112 @@
+import logging
+import signal
+import time
+from typing import List, Optional
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from devices.ingest import ingest_telemetry
+from devices.mqtt import MqttTelemetryMessage, MqttTelemetrySource, as_ingest_messages
+
+logger = logging.getLogger(__name__)
+
+# Upper bound of the pause after a failed flush, in seconds
+MAX_BACKOFF = 30
+
+
+class Command(BaseCommand):
+    help = (
+        "Subscribes to the device telemetry topic on the MQTT broker and stores the readings "
+        "in batches flushed by size or age. Messages are acknowledged after the commit. "
+        "Stops gracefully on SIGTERM/SIGINT."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.TELEMETRY_INGEST_FLUSH_SIZE,
+            help="Flush once this many records are buffered",
+        )
+        parser.add_argument(
+            '--max-age', type=float, default=settings.TELEMETRY_INGEST_FLUSH_AGE,
+            help="Flush once the oldest buffered record waits this many seconds",
+        )
+        parser.add_argument(
+            '--client-id', default=None,
+            help="MQTT client id, keep it stable to resume the session (default: gateway-ingest-hostname)",
+        )
+        parser.add_argument(
+            '--topic', default=None,
+            help="Telemetry topic with the MAC address as the '+' level (default: MQTT_TELEMETRY_TOPIC)",
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        source = MqttTelemetrySource(client_id=options['client_id'], topic=options['topic'])
+        source.start()
+        try:
+            self.consume(source, options['batch_size'], options['max_age'])
+        finally:
+            source.stop()
+
+    def consume(self, source: MqttTelemetrySource, batch_size: int, max_age: float) -> None:
+        """Buffers the received messages and flushes them until stopped."""
+        buffered: List[MqttTelemetryMessage] = []
+        oldest: Optional[float] = None
+        backoff = 1
+
+        logger.info(f"MQTT telemetry bridge started ({settings.MQTT_HOST}:{settings.MQTT_PORT})")
+        while True:
+            if not self.stopping and len(buffered) < batch_size:
+                # Do not wait longer than the oldest buffered record may
+                timeout = 1.0 if oldest is None else max(oldest + max_age - time.monotonic(), 0)
+                message = source.get(timeout)
+                if message is not None:
+                    buffered.append(message)
+                    if oldest is None:
+                        oldest = time.monotonic()
+
+            if not buffered:
+                if self.stopping:
+                    break
+                continue
+
+            expired = oldest is not None and time.monotonic() - oldest >= max_age
+            if not (self.stopping or expired or len(buffered) >= batch_size):
+                continue
+
+            if self.flush(source, buffered):
+                buffered = []
+                oldest = None
+                backoff = 1
+            elif self.stopping:
+                # Left unacknowledged, the broker redelivers them to the next session
+                break
+            else:
+                # Keep the batch, the broker holds back new messages meanwhile
+                time.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+
+        logger.info("MQTT telemetry bridge stopped")
+
+    def flush(self, source: MqttTelemetrySource, messages) -> bool:
+        """Stores the buffered messages and acknowledges them. Returns False on failure."""
+        close_old_connections()
+        try:
+            result = ingest_telemetry(as_ingest_messages(messages))
+        except Exception as e:
+            logger.error(f"Unexpected error during telemetry processing: {e}", exc_info=True)
+            return False
+
+        # Readings of unknown devices cannot be kept on the broker, they are dropped
+        source.ack(messages)
+        logger.info(result.message)
+        return True
+
+    def stop(self, signum, frame):
+        logger.info(f"Received signal {signum}, flushing buffered telemetry and stopping")
+        self.stopping = True
@@ -0,0 +1,42 @@
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from devices.partitions import add_months, create_partitions, detach_partitions_before, is_partitioned, month_start
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates monthly telemetry partitions ahead of time and removes the partitions "
+        "older than the retention period. Also run daily by Celery beat."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ahead', type=int, default=settings.TELEMETRY_PARTITIONS_AHEAD,
+            help="Number of future months to create partitions for",
+        )
+        parser.add_argument(
+            '--retention-months', type=int, default=settings.TELEMETRY_RETENTION_MONTHS,
+            help="Remove partitions of months older than this many months (0 keeps everything)",
+        )
+        parser.add_argument(
+            '--keep-detached', action='store_true',
+            help="Only detach old partitions, leaving the tables in place (e.g. for archiving)",
+        )
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError("The telemetry table is not partitioned (PostgreSQL with migration devices 0009)")
+
+        created = create_partitions(options['ahead'])
+        self.stdout.write(f"Created partitions: {', '.join(created) or 'none'}")
+
+        if options['retention_months'] > 0:
+            cutoff = add_months(month_start(timezone.now()), -options['retention_months'])
+            removed = detach_partitions_before(cutoff, drop=not options['keep_detached'])
+            self.stdout.write(f"Removed partitions: {', '.join(removed) or 'none'}")
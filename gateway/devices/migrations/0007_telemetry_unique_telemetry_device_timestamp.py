@@ -0,0 +1,46 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remove_duplicate_telemetry(apps, schema_editor):
+    """
+    Keeps the first stored reading for every (device, timestamp) pair.
+    Notifications of the removed duplicates are moved to the kept reading.
+    """
+    Telemetry = apps.get_model('devices', 'Telemetry')
+    UserNotification = apps.get_model('notifications', 'UserNotification')
+
+    duplicated = (
+        Telemetry.objects
+        .values('device_id', 'timestamp')
+        .annotate(rows=Count('uuid'))
+        .filter(rows__gt=1)
+    )
+    for group in duplicated.iterator():
+        pks = list(
+            Telemetry.objects
+            .filter(device_id=group['device_id'], timestamp=group['timestamp'])
+            .order_by('created_at', 'uuid')
+            .values_list('pk', flat=True)
+        )
+        kept, removed = pks[0], pks[1:]
+        UserNotification.objects.filter(telemetry_id__in=removed).update(telemetry_id=kept)
+        Telemetry.objects.filter(pk__in=removed).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0006_dashboardlayout'),
+        ('notifications', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_telemetry, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='telemetry',
+            constraint=models.UniqueConstraint(fields=('device', 'timestamp'), name='unique_telemetry_device_timestamp'),
+        ),
+    ]
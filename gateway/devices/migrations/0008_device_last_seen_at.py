@@ -0,0 +1,40 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:00
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+
+def backfill_last_seen_at(apps, schema_editor):
+    """Sets last_seen_at to the latest telemetry timestamp and is_active from it."""
+    Device = apps.get_model('devices', 'Device')
+    Telemetry = apps.get_model('devices', 'Telemetry')
+
+    latest = Telemetry.objects.filter(device=OuterRef('pk')).order_by('-timestamp').values('timestamp')[:1]
+    Device.objects.update(last_seen_at=Subquery(latest))
+
+    cutoff = timezone.now() - timedelta(hours=4)
+    Device.objects.filter(last_seen_at__gte=cutoff).update(is_active=True)
+    Device.objects.exclude(last_seen_at__gte=cutoff).update(is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0007_telemetry_unique_telemetry_device_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='last_seen_at',
+            field=models.DateTimeField(blank=True, help_text='Timestamp of the latest telemetry received from the device', null=True),
+        ),
+        migrations.RunPython(backfill_last_seen_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['last_seen_at'], name='device_active_last_seen_idx'),
+        ),
+    ]
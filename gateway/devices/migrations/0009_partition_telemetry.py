@@ -0,0 +1,88 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:00
+
+from datetime import date
+
+from django.db import migrations
+from django.utils import timezone
+
+# Months created ahead of the current one, later kept up by the telemetrypartitions command
+PARTITIONS_AHEAD = 3
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_telemetry(apps, schema_editor):
+    """
+    Replaces the telemetry table with a table partitioned by month on timestamp
+    and copies the stored readings into it. PostgreSQL only.
+
+    Partitioned tables require the partition key in every unique constraint,
+    so the primary key becomes (uuid, timestamp). Index and constraint names
+    of the old table are kept.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+
+    quote = connection.ops.quote_name
+    table = 'devices_telemetry'
+    new_table = 'devices_telemetry_partitioned'
+
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+        cursor.execute(f'SELECT min("timestamp") FROM {table}')
+        oldest = cursor.fetchone()[0]
+
+    current = timezone.now().date().replace(day=1)
+    first = date(oldest.year, oldest.month, 1) if oldest else current
+    first = min(first, current)
+
+    schema_editor.execute(
+        f'CREATE TABLE {new_table} (LIKE {table} INCLUDING DEFAULTS) PARTITION BY RANGE ("timestamp")'
+    )
+    schema_editor.execute(f'CREATE TABLE {table}_default PARTITION OF {new_table} DEFAULT')
+    month = first
+    while month <= add_months(current, PARTITIONS_AHEAD):
+        end = add_months(month, 1)
+        schema_editor.execute(
+            f'CREATE TABLE {table}_p{month.year:04d}_{month.month:02d} PARTITION OF {new_table} '
+            f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{end.isoformat()} 00:00:00+00')"
+        )
+        month = end
+
+    schema_editor.execute(f'INSERT INTO {new_table} SELECT * FROM {table}')
+    schema_editor.execute(f'DROP TABLE {table}')
+    schema_editor.execute(f'ALTER TABLE {new_table} RENAME TO {table}')
+
+    for name, constraint in constraints.items():
+        columns = ', '.join(quote(column) for column in constraint['columns'])
+        if constraint['primary_key']:
+            schema_editor.execute(
+                f'ALTER TABLE {table} ADD CONSTRAINT {quote(name)} PRIMARY KEY ({columns}, "timestamp")'
+            )
+        elif constraint['foreign_key']:
+            to_table, to_column = constraint['foreign_key']
+            schema_editor.execute(
+                f'ALTER TABLE {table} ADD CONSTRAINT {quote(name)} FOREIGN KEY ({columns}) '
+                f'REFERENCES {quote(to_table)} ({quote(to_column)}) DEFERRABLE INITIALLY DEFERRED'
+            )
+        elif constraint['unique']:
+            schema_editor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {quote(name)} UNIQUE ({columns})')
+        elif constraint['index']:
+            schema_editor.execute(f'CREATE INDEX {quote(name)} ON {table} ({columns})')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0008_device_last_seen_at'),
+        # The foreign key of notifications would block dropping the old table
+        ('notifications', '0002_alter_usernotification_telemetry'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_telemetry),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:00
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0009_partition_telemetry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelemetryRollup',
+            fields=[
+                ('uuid', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('resolution', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')], help_text='Length of the bucket', max_length=10)),
+                ('bucket', models.DateTimeField(help_text='Start of the bucket')),
+                ('count', models.IntegerField(help_text='Number of readings in the bucket')),
+                ('last_timestamp', models.DateTimeField(help_text='Timestamp of the latest reading in the bucket')),
+                ('temperature_min', models.FloatField()),
+                ('temperature_max', models.FloatField()),
+                ('temperature_sum', models.FloatField()),
+                ('temperature_last', models.FloatField()),
+                ('humidity_min', models.FloatField()),
+                ('humidity_max', models.FloatField()),
+                ('humidity_sum', models.FloatField()),
+                ('humidity_last', models.FloatField()),
+                ('pressure_min', models.FloatField()),
+                ('pressure_max', models.FloatField()),
+                ('pressure_sum', models.FloatField()),
+                ('pressure_last', models.FloatField()),
+                ('soil_moisture_min', models.FloatField()),
+                ('soil_moisture_max', models.FloatField()),
+                ('soil_moisture_sum', models.FloatField()),
+                ('soil_moisture_last', models.FloatField()),
+                ('device', models.ForeignKey(help_text='Device the readings come from', on_delete=django.db.models.deletion.CASCADE, related_name='telemetry_rollups', to='devices.device')),
+            ],
+            options={
+                'ordering': ['-bucket'],
+                'constraints': [models.UniqueConstraint(fields=('device', 'resolution', 'bucket'), name='unique_telemetry_rollup_bucket')],
+            },
+        ),
+    ]
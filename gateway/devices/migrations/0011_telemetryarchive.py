@@ -0,0 +1,36 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:00
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0010_telemetryrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelemetryArchive',
+            fields=[
+                ('uuid', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('month', models.DateField(help_text='First day of the archived month')),
+                ('path', models.CharField(help_text='File path relative to TELEMETRY_ARCHIVE_DIR', max_length=255, unique=True)),
+                ('row_count', models.IntegerField(help_text='Number of readings in the file')),
+                ('first_timestamp', models.DateTimeField(help_text='Timestamp of the oldest reading in the file')),
+                ('last_timestamp', models.DateTimeField(help_text='Timestamp of the latest reading in the file')),
+                ('size_bytes', models.BigIntegerField(help_text='Size of the file')),
+                ('device', models.ForeignKey(help_text='Device the readings come from', on_delete=django.db.models.deletion.CASCADE, related_name='telemetry_archives', to='devices.device')),
+            ],
+            options={
+                'ordering': ['-month'],
+                'indexes': [models.Index(fields=['device', 'last_timestamp'], name='devices_tel_device__101c7e_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:00
+
+import core.uuids
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0012_alter_telemetry_uuid'),
+        ('notifications', '0003_alter_usernotification_uuid'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Rows soft-deleted so far are removed for real before the column goes away
+        migrations.RunSQL(
+            sql=[
+                'DELETE FROM notifications_usernotification WHERE telemetry_id IN '
+                '(SELECT uuid FROM devices_telemetry WHERE is_deleted)',
+                'DELETE FROM devices_telemetry WHERE is_deleted',
+                'DELETE FROM devices_telemetryrollup WHERE is_deleted',
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.RemoveField(
+            model_name='telemetry',
+            name='is_deleted',
+        ),
+        migrations.RemoveField(
+            model_name='telemetryrollup',
+            name='is_deleted',
+        ),
+        migrations.AlterField(
+            model_name='telemetryrollup',
+            name='uuid',
+            field=models.UUIDField(default=core.uuids.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['user', '-created_at'], name='device_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:00
+
+import core.uuids
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_latest_telemetry(apps, schema_editor):
+    """Creates the snapshot of every device that has telemetry from its latest reading."""
+    Device = apps.get_model('devices', 'Device')
+    Telemetry = apps.get_model('devices', 'Telemetry')
+    DeviceLatestTelemetry = apps.get_model('devices', 'DeviceLatestTelemetry')
+
+    snapshots = []
+    for device_id in Device.objects.filter(last_seen_at__isnull=False).values_list('pk', flat=True):
+        telemetry = Telemetry.objects.filter(device_id=device_id).order_by('-timestamp').first()
+        if telemetry is None:
+            continue
+        snapshots.append(DeviceLatestTelemetry(
+            device_id=device_id,
+            telemetry_uuid=telemetry.uuid,
+            temperature=telemetry.temperature,
+            humidity=telemetry.humidity,
+            pressure=telemetry.pressure,
+            soil_moisture=telemetry.soil_moisture,
+            timestamp=telemetry.timestamp
+        ))
+    DeviceLatestTelemetry.objects.bulk_create(snapshots, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0013_telemetry_append_only'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceLatestTelemetry',
+            fields=[
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('uuid', models.UUIDField(default=core.uuids.uuid7, editable=False, primary_key=True, serialize=False)),
+                ('telemetry_uuid', models.UUIDField(help_text='Primary key of the reading')),
+                ('temperature', models.FloatField()),
+                ('humidity', models.FloatField()),
+                ('pressure', models.FloatField()),
+                ('soil_moisture', models.IntegerField()),
+                ('timestamp', models.DateTimeField()),
+                ('device', models.OneToOneField(help_text='Device the reading comes from', on_delete=django.db.models.deletion.CASCADE, related_name='latest_reading', to='devices.device')),
+            ],
+            options={
+                'verbose_name': 'Device Latest Telemetry',
+                'verbose_name_plural': 'Device Latest Telemetry',
+            },
+        ),
+        migrations.RunPython(backfill_latest_telemetry, migrations.RunPython.noop),
+    ]
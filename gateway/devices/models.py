@@ -11,17 +11,23 @@ from django.db.models import ExpressionWrapper, BooleanField, Q, F, Value
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 
-from core.models import BaseModel
+from core.models import AppendOnlyModel, BaseModel, TrackedModel
 
 User = get_user_model()
 
+# Devices that sent telemetry within this window are active
+ACTIVE_WINDOW = timedelta(hours=4)
 
-class Telemetry(BaseModel):
+
+class Telemetry(AppendOnlyModel):
     """
     Model representing telemetry data received from IoT devices.
 
     Stores environmental measurements like temperature, humidity, pressure,
     and soil moisture along with the timestamp of measurement.
+
+    On PostgreSQL the table is partitioned by month on timestamp (see devices.partitions),
+    its primary key is (uuid, timestamp).
     """
 
     device = models.ForeignKey(
@@ -53,6 +59,12 @@ class Telemetry(BaseModel):
             models.Index(fields=['timestamp']),
             models.Index(fields=['device', 'timestamp']),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['device', 'timestamp'],
+                name='unique_telemetry_device_timestamp'
+            ),
+        ]
         get_latest_by = 'timestamp'
 
     def __str__(self) -> str:
@@ -70,17 +82,13 @@ class Telemetry(BaseModel):
             'device_mac': self.device.mac_address,
         }
 
-    def save(self, *args, **kwargs):
-        """Override save to update device active status."""
-        super().save(*args, **kwargs)
-        self.device.update_active_status()
 
-
-class Device(BaseModel):
+class Device(TrackedModel):
     """
     Model representing an IoT device with telemetry capabilities.
 
-    The device is considered active if it has sent telemetry data within the last 5 minutes.
+    The device is considered active if it has sent telemetry data within the last 4 hours
+    (see ACTIVE_WINDOW), based on ``last_seen_at``.
     """
     name = models.CharField(
         max_length=255,
@@ -101,6 +109,11 @@ class Device(BaseModel):
         default=False,
         help_text="Indicates if device is active (has sent data in last 4 hours)"
     )
+    last_seen_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Timestamp of the latest telemetry received from the device"
+    )
     plant_name = models.CharField(
         max_length=255,
         help_text="Name of the plant",
@@ -112,18 +125,32 @@ class Device(BaseModel):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['mac_address']),
-            models.Index(fields=['user', 'is_active'])
+            models.Index(fields=['user', 'is_active']),
+            # Device list of a user, soft-deleted devices are never queried
+            models.Index(
+                fields=['user', '-created_at'],
+                condition=Q(is_deleted=False),
+                name='device_user_created_idx'
+            ),
+            # Used by the inactivity sweep
+            models.Index(
+                fields=['last_seen_at'],
+                condition=Q(is_active=True),
+                name='device_active_last_seen_idx'
+            ),
         ]
 
     def __str__(self) -> str:
         return f"{self.name} ({self.mac_address})"
 
+    @property
+    def raw_mac_address(self) -> str:
+        """MAC address without colons in lowercase, used as the device's telemetry queue key."""
+        return self.mac_address.replace(':', '').lower()
+
     def update_active_status(self) -> bool:
-        """Updates the is_active status based on recent telemetry data."""
-        has_recent_data = self.telemetry.filter(
-            timestamp__gte=timezone.now() - timedelta(hours=4)
-        ).exists()
-        self.is_active = has_recent_data
+        """Updates the is_active status based on the latest telemetry timestamp."""
+        self.is_active = bool(self.last_seen_at and self.last_seen_at >= timezone.now() - ACTIVE_WINDOW)
         self.save(update_fields=['is_active'])
         return self.is_active
 
@@ -135,19 +162,20 @@ class Device(BaseModel):
         """Returns the most recent telemetry data for this device."""
         return self.telemetry.order_by('-timestamp').first()
 
-    def get_latest_telemetry_data(self) -> Optional[Dict[str, Any]]:
-        """Returns the most recent telemetry data as a dictionary."""
-        telemetry = self.get_latest_telemetry()
-        if not telemetry:
+    def get_latest_reading(self) -> Optional[DeviceLatestTelemetry]:
+        """
+        Returns the snapshot of the most recent telemetry kept by ingest.
+        Select it with select_related('latest_reading') when listing devices.
+        """
+        try:
+            return self.latest_reading
+        except DeviceLatestTelemetry.DoesNotExist:
             return None
 
-        return {
-            'temperature': telemetry.temperature,
-            'humidity': telemetry.humidity,
-            'pressure': telemetry.pressure,
-            'soil_moisture': telemetry.soil_moisture,
-            'timestamp': telemetry.timestamp.isoformat(),
-        }
+    def get_latest_telemetry_data(self) -> Optional[Dict[str, Any]]:
+        """Returns the most recent telemetry data as a dictionary."""
+        latest = self.get_latest_reading()
+        return latest.as_dict() if latest else None
 
     def get_latest_telemetry_data_as_json(self) -> Optional[str]:
         """Returns the most recent telemetry data as a JSON string."""
@@ -155,12 +183,26 @@ class Device(BaseModel):
         return json.dumps(data) if data else None
 
     def get_telemetry_history(self, hours: int = 24) -> QuerySet[Telemetry]:
-        """Returns telemetry history for specified number of hours."""
+        """
+        Returns telemetry history for specified number of hours.
+        Only the telemetry partitions of the range are scanned.
+        """
         time_threshold = timezone.now() - timedelta(hours=hours)
         return self.telemetry.filter(
             timestamp__gte=time_threshold
         ).order_by('-timestamp')
 
+    def get_telemetry_rollups(self, resolution: str, hours: int = 24) -> QuerySet['TelemetryRollup']:
+        """
+        Returns the rollup buckets of the given resolution for specified number of hours.
+        The bucket containing the start of the range is included.
+        """
+        time_threshold = timezone.now() - timedelta(hours=hours)
+        return self.telemetry_rollups.filter(
+            resolution=resolution,
+            bucket__gt=time_threshold - TelemetryRollup.RESOLUTION_LENGTHS[resolution]
+        ).order_by('-bucket')
+
 
 class DeviceSensorLimits(BaseModel):
     """
@@ -229,7 +271,7 @@ class DeviceSensorLimits(BaseModel):
     def __str__(self) -> str:
         return f"Sensor limits for {self.device.name}"
 
-    def check_limits(self, telemetry: Telemetry) -> list[str]:
+    def check_limits(self, telemetry: Telemetry | DeviceLatestTelemetry) -> list[str]:
         """
         Check if telemetry values are within defined limits.
         Returns list of violation messages if any limits are exceeded.
@@ -259,7 +301,168 @@ class DeviceSensorLimits(BaseModel):
         return violations
 
 
-class DashboardLayout(BaseModel):
+class TelemetryRollup(AppendOnlyModel):
+    """
+    Aggregated telemetry of a device over a time bucket of a given resolution.
+
+    Maintained incrementally by ingest (see devices.rollups). Stores sums instead of
+    averages so buckets can be merged with late readings.
+    """
+    RESOLUTION_MINUTE = 'minute'
+    RESOLUTION_HOUR = 'hour'
+    RESOLUTION_DAY = 'day'
+    RESOLUTION_CHOICES = [
+        (RESOLUTION_MINUTE, 'Minute'),
+        (RESOLUTION_HOUR, 'Hour'),
+        (RESOLUTION_DAY, 'Day'),
+    ]
+    RESOLUTION_LENGTHS = {
+        RESOLUTION_MINUTE: timedelta(minutes=1),
+        RESOLUTION_HOUR: timedelta(hours=1),
+        RESOLUTION_DAY: timedelta(days=1),
+    }
+
+    device = models.ForeignKey(
+        'Device',
+        on_delete=models.CASCADE,
+        related_name='telemetry_rollups',
+        help_text="Device the readings come from"
+    )
+    resolution = models.CharField(
+        max_length=10,
+        choices=RESOLUTION_CHOICES,
+        help_text="Length of the bucket"
+    )
+    bucket = models.DateTimeField(
+        help_text="Start of the bucket"
+    )
+    count = models.IntegerField(
+        help_text="Number of readings in the bucket"
+    )
+    last_timestamp = models.DateTimeField(
+        help_text="Timestamp of the latest reading in the bucket"
+    )
+
+    temperature_min = models.FloatField()
+    temperature_max = models.FloatField()
+    temperature_sum = models.FloatField()
+    temperature_last = models.FloatField()
+
+    humidity_min = models.FloatField()
+    humidity_max = models.FloatField()
+    humidity_sum = models.FloatField()
+    humidity_last = models.FloatField()
+
+    pressure_min = models.FloatField()
+    pressure_max = models.FloatField()
+    pressure_sum = models.FloatField()
+    pressure_last = models.FloatField()
+
+    soil_moisture_min = models.FloatField()
+    soil_moisture_max = models.FloatField()
+    soil_moisture_sum = models.FloatField()
+    soil_moisture_last = models.FloatField()
+
+    class Meta:
+        ordering = ['-bucket']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['device', 'resolution', 'bucket'],
+                name='unique_telemetry_rollup_bucket'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.resolution} rollup for {self.device.name} at {self.bucket.isoformat()}"
+
+    def average(self, metric: str) -> float:
+        """Returns the average of the metric over the bucket."""
+        return getattr(self, f'{metric}_sum') / self.count
+
+
+class TelemetryArchive(BaseModel):
+    """
+    Manifest entry of a Parquet file holding archived raw telemetry of a device
+    from a single month (see devices.archive). The readings are no longer in
+    the telemetry table.
+    """
+    device = models.ForeignKey(
+        'Device',
+        on_delete=models.CASCADE,
+        related_name='telemetry_archives',
+        help_text="Device the readings come from"
+    )
+    month = models.DateField(
+        help_text="First day of the archived month"
+    )
+    path = models.CharField(
+        max_length=255,
+        unique=True,
+        help_text="File path relative to TELEMETRY_ARCHIVE_DIR"
+    )
+    row_count = models.IntegerField(
+        help_text="Number of readings in the file"
+    )
+    first_timestamp = models.DateTimeField(
+        help_text="Timestamp of the oldest reading in the file"
+    )
+    last_timestamp = models.DateTimeField(
+        help_text="Timestamp of the latest reading in the file"
+    )
+    size_bytes = models.BigIntegerField(
+        help_text="Size of the file"
+    )
+
+    class Meta:
+        ordering = ['-month']
+        indexes = [
+            models.Index(fields=['device', 'last_timestamp']),
+        ]
+
+    def __str__(self) -> str:
+        return f"Telemetry archive for {self.device.name} from {self.month.isoformat()}"
+
+
+class DeviceLatestTelemetry(AppendOnlyModel):
+    """
+    Snapshot of the latest reading of a device, kept up to date by ingest
+    (see devices.status.update_latest_telemetry) so device lists do not query
+    the telemetry table per device.
+    """
+    device = models.OneToOneField(
+        'Device',
+        on_delete=models.CASCADE,
+        related_name='latest_reading',
+        help_text="Device the reading comes from"
+    )
+    # Not a foreign key, the reading may be archived while the snapshot stays
+    telemetry_uuid = models.UUIDField(
+        help_text="Primary key of the reading"
+    )
+    temperature = models.FloatField()
+    humidity = models.FloatField()
+    pressure = models.FloatField()
+    soil_moisture = models.IntegerField()
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Device Latest Telemetry"
+        verbose_name_plural = "Device Latest Telemetry"
+
+    def __str__(self) -> str:
+        return f"Latest telemetry for {self.device.name} at {self.timestamp.isoformat()}"
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'temperature': self.temperature,
+            'humidity': self.humidity,
+            'pressure': self.pressure,
+            'soil_moisture': self.soil_moisture,
+            'timestamp': self.timestamp.isoformat(),
+        }
+
+
+class DashboardLayout(TrackedModel):
     """
     Model representing a user's dashboard layout configuration for a specific device.
     
@@ -0,0 +1,151 @@
+"""
+MQTT source of telemetry for the ``runmqttbridge`` command.
+
+Devices publish readings to MQTT_TELEMETRY_TOPIC on the Mosquitto broker, the
+device MAC address being the ``+`` level of the topic (e.g.
+``devices/10061c41d104/telemetry``). The bridge subscribes with QoS 1 and
+acknowledges messages manually, only after the batch they belong to has been
+committed. The broker stops sending once MQTT_RECEIVE_MAXIMUM messages are
+unacknowledged, which throttles the devices to the speed of the database.
+
+The session is persistent, so messages that were not acknowledged before the
+bridge stopped are redelivered when it reconnects; they are stored once thanks
+to the unique (device, timestamp) constraint.
+"""
+import logging
+import queue
+import socket
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import paho.mqtt.client as mqtt
+from django.conf import settings
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MqttTelemetryMessage:
+    """A reading received from the broker together with the data needed to acknowledge it."""
+    raw_mac: str
+    payload: bytes
+    mid: int
+    qos: int
+
+
+def mac_from_topic(topic: str, pattern: str) -> Optional[str]:
+    """
+    Returns the raw MAC address from the ``+`` level of ``topic`` or None
+    if the topic does not match ``pattern``.
+    """
+    levels = topic.split('/')
+    pattern_levels = pattern.split('/')
+    if len(levels) != len(pattern_levels) or '+' not in pattern_levels:
+        return None
+    for level, pattern_level in zip(levels, pattern_levels):
+        if pattern_level not in ('+', level):
+            return None
+    mac = levels[pattern_levels.index('+')]
+    return mac.replace(':', '').replace('-', '').lower() or None
+
+
+def default_client_id() -> str:
+    # Stable across restarts so the broker resumes the persistent session
+    return f"gateway-ingest-{socket.gethostname()}"
+
+
+class MqttTelemetrySource:
+    """
+    Subscribes to the telemetry topic and collects the received messages.
+
+    ``client`` may be any object with the paho client interface, e.g. an
+    in-process stand-in; messages can also be fed directly with :meth:`on_message`.
+    Callbacks run on the network thread, :meth:`get` and :meth:`ack` are called
+    from the consuming thread.
+    """
+
+    def __init__(self, client: Optional[mqtt.Client] = None, client_id: Optional[str] = None,
+                 topic: Optional[str] = None):
+        self.topic = topic or settings.MQTT_TELEMETRY_TOPIC
+        self.client = client or self.create_client(client_id or default_client_id())
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_message = self.on_message
+        # Bounded by the broker through the receive maximum
+        self.received: "queue.Queue[MqttTelemetryMessage]" = queue.Queue()
+
+    @staticmethod
+    def create_client(client_id: str) -> mqtt.Client:
+        client = mqtt.Client(
+            mqtt.CallbackAPIVersion.VERSION2,
+            client_id=client_id,
+            protocol=mqtt.MQTTv5,
+            manual_ack=True,
+        )
+        if settings.MQTT_USERNAME:
+            client.username_pw_set(settings.MQTT_USERNAME, settings.MQTT_PASSWORD)
+        client.reconnect_delay_set(min_delay=1, max_delay=30)
+        return client
+
+    @property
+    def subscription(self) -> str:
+        if settings.MQTT_SHARE_GROUP:
+            return f"$share/{settings.MQTT_SHARE_GROUP}/{self.topic}"
+        return self.topic
+
+    def start(self) -> None:
+        """Connects to the broker and starts the network thread."""
+        properties = Properties(PacketTypes.CONNECT)
+        properties.ReceiveMaximum = settings.MQTT_RECEIVE_MAXIMUM
+        properties.SessionExpiryInterval = settings.MQTT_SESSION_EXPIRY
+        self.client.connect(
+            settings.MQTT_HOST, settings.MQTT_PORT,
+            clean_start=False, properties=properties
+        )
+        self.client.loop_start()
+
+    def stop(self) -> None:
+        """Disconnects; unacknowledged messages stay in the broker session."""
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def on_connect(self, client, userdata, flags, reason_code, properties=None) -> None:
+        if reason_code.is_failure:
+            logger.error(f"MQTT connection refused: {reason_code}")
+            return
+        logger.info(f"Connected to MQTT broker, subscribing to {self.subscription}")
+        client.subscribe(self.subscription, qos=1)
+
+    def on_disconnect(self, client, userdata, flags, reason_code, properties=None) -> None:
+        if reason_code.is_failure:
+            logger.warning(f"Disconnected from MQTT broker: {reason_code}, reconnecting")
+
+    def on_message(self, client, userdata, message) -> None:
+        raw_mac = mac_from_topic(message.topic, self.topic)
+        if raw_mac is None:
+            logger.error(f"Telemetry received on unexpected topic {message.topic}")
+            # Nothing to store, acknowledge right away so it is not redelivered
+            if message.qos:
+                client.ack(message.mid, message.qos)
+            return
+        self.received.put(MqttTelemetryMessage(raw_mac, message.payload, message.mid, message.qos))
+
+    def get(self, timeout: Optional[float]) -> Optional[MqttTelemetryMessage]:
+        """Returns the next received message or None after ``timeout`` seconds."""
+        try:
+            return self.received.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def ack(self, messages: List[MqttTelemetryMessage]) -> None:
+        """Sends PUBACK for the messages, letting the broker send more."""
+        for message in messages:
+            if message.qos:
+                self.client.ack(message.mid, message.qos)
+
+
+def as_ingest_messages(messages: List[MqttTelemetryMessage]) -> List[Tuple[str, bytes]]:
+    """Converts the messages to the (raw MAC address, payload) pairs taken by ingest_telemetry."""
+    return [(message.raw_mac, message.payload) for message in messages]
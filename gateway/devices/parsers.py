@@ -0,0 +1,27 @@
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from core.parsers import json_loads
+
+
+class NDJSONParser(BaseParser):
+    """Parses newline-delimited JSON into a list with one item per non-empty line."""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            lines = stream.read().decode(encoding).splitlines()
+        except UnicodeDecodeError as e:
+            raise ParseError(f"NDJSON parse error - {e}")
+        items = []
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                items.append(json_loads(line))
+            except ValueError as e:
+                raise ParseError(f"NDJSON parse error on line {number} - {e}")
+        return items
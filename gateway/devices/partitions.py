@@ -0,0 +1,157 @@
+"""
+Monthly range partitions of the telemetry table (PostgreSQL only).
+
+The table is partitioned by ``timestamp`` (see migration 0009). Every month is a
+partition named ``devices_telemetry_pYYYY_MM``; readings outside of the created
+months land in ``devices_telemetry_default``. Partitions are created ahead of
+time by :func:`create_partitions` and old months are removed by detaching
+their partition with :func:`detach_partitions_before` instead of a DELETE.
+
+Queries filtering on ``timestamp`` only read the partitions of the requested range.
+"""
+import logging
+import re
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from devices.models import Telemetry
+from notifications.models import UserNotification
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PATTERN = re.compile(r'_p(\d{4})_(\d{2})$')
+
+
+def parent_table() -> str:
+    return Telemetry._meta.db_table
+
+
+def default_partition() -> str:
+    return f'{parent_table()}_default'
+
+
+def month_start(value: datetime | date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f'{parent_table()}_p{month.year:04d}_{month.month:02d}'
+
+
+def partition_bounds(month: date) -> Tuple[str, str]:
+    """Returns the inclusive lower and exclusive upper bound of the month, in UTC."""
+    return f'{month.isoformat()} 00:00:00+00', f'{add_months(month, 1).isoformat()} 00:00:00+00'
+
+
+def is_partitioned() -> bool:
+    """Returns True if the telemetry table is a partitioned PostgreSQL table."""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s',
+            [parent_table()]
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions() -> List[date]:
+    """Returns the months that have a partition, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE parent.relname = %s',
+            [parent_table()]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    months = []
+    for name in names:
+        match = PARTITION_PATTERN.search(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def create_partition(month: date) -> None:
+    """
+    Creates the partition of the month. Readings of that month already stored
+    in the default partition are moved into it.
+    """
+    quote = connection.ops.quote_name
+    parent = quote(parent_table())
+    name = quote(partition_name(month))
+    start, end = partition_bounds(month)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {name} (LIKE {parent} INCLUDING DEFAULTS)')
+        cursor.execute(
+            f'WITH moved AS ('
+            f'DELETE FROM {quote(default_partition())} WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *'
+            f') INSERT INTO {name} SELECT * FROM moved',
+            [start, end]
+        )
+        if cursor.rowcount:
+            logger.warning(f"Moved {cursor.rowcount} readings from the default partition to {partition_name(month)}")
+        cursor.execute(f'ALTER TABLE {parent} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)', [start, end])
+
+
+def create_partitions(ahead: int, now: Optional[datetime] = None) -> List[str]:
+    """
+    Makes sure partitions exist from the current month until ``ahead`` months later.
+    Returns the names of the created partitions.
+    """
+    current = month_start(now or timezone.now())
+    existing = set(list_partitions())
+    created = []
+    for offset in range(ahead + 1):
+        month = add_months(current, offset)
+        if month not in existing:
+            create_partition(month)
+            created.append(partition_name(month))
+            logger.info(f"Created telemetry partition {partition_name(month)}")
+    return created
+
+
+def remove_partition(month: date, drop: bool = True) -> None:
+    """
+    Detaches the partition of the month from the telemetry table and drops it
+    unless ``drop`` is False. Notifications of its readings are kept, without their reading.
+    """
+    quote = connection.ops.quote_name
+    name = quote(partition_name(month))
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Notifications only reference telemetry logically, there is no foreign key to act on it
+        cursor.execute(
+            f'UPDATE {quote(UserNotification._meta.db_table)} SET telemetry_id = NULL '
+            f'WHERE telemetry_id IN (SELECT uuid FROM {name})'
+        )
+        cursor.execute(f'ALTER TABLE {quote(parent_table())} DETACH PARTITION {name}')
+        if drop:
+            cursor.execute(f'DROP TABLE {name}')
+    logger.info(f"{'Dropped' if drop else 'Detached'} telemetry partition {partition_name(month)}")
+
+
+def detach_partitions_before(cutoff: date, drop: bool = True) -> List[str]:
+    """
+    Removes the partitions of months before ``cutoff`` from the telemetry table
+    and drops them unless ``drop`` is False. Notifications of the removed readings
+    are kept. Returns the names of the removed partitions.
+    """
+    removed = []
+    for month in list_partitions():
+        if month >= month_start(cutoff):
+            break
+        remove_partition(month, drop)
+        removed.append(partition_name(month))
+    return removed
@@ -0,0 +1,443 @@
+"""
+Redis queues the telemetry is ingested from.
+
+Two backends are available, selected with the TELEMETRY_QUEUE_BACKEND setting:
+
+``list``
+    Producers append readings with ``RPUSH <raw mac> <json>`` and mark the device
+    as having pending data with ``SADD <pending key> <raw mac>``. The consumer
+    pops a bounded number of pending keys, reads a bounded slice of every list and,
+    once the slice is committed to the database, trims exactly that many elements
+    from the head. Every step runs as a Lua script so a single round trip covers
+    many device keys.
+
+``stream``
+    Producers add readings with ``XADD <stream key> * mac <raw mac> data <json>``.
+    Workers read through the ``ingest`` consumer group, acknowledge entries after
+    the commit and reclaim entries left pending by crashed workers, which gives
+    at-least-once delivery.
+
+Devices are split into TELEMETRY_SHARDS shards (see devices.sharding), every
+shard has its own pending set or stream. With a single shard the keys are
+``telemetry:pending`` and ``telemetry:stream``, otherwise the shard number is
+appended (``telemetry:pending:3``). A queue only reads the shards listed in its
+``shards`` attribute.
+
+:func:`enqueue_telemetry` writes a reading in the format of the configured backend.
+"""
+import logging
+import os
+import random
+import socket
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Collection, Dict, Iterable, List, Optional, Set, Tuple, cast
+
+import redis
+from django.conf import settings
+
+from devices.models import Device
+from devices.sharding import shard_for_mac
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = 'telemetry:pending'
+RECONCILE_LOCK_KEY = 'telemetry:pending:reconcile'
+STREAM_KEY = 'telemetry:stream'
+STREAM_GROUP = 'ingest'
+
+# Pops up to ARGV[1] keys in total from the pending sets KEYS and returns a flat list of
+# key, records pairs with up to ARGV[2] elements of every non-empty list. ARGV[3..]
+# holds key, offset pairs of records already read but not yet trimmed, which are skipped.
+DRAIN_SCRIPT = """
+local budget = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local offsets = {}
+for i = 3, #ARGV, 2 do
+    offsets[ARGV[i]] = tonumber(ARGV[i + 1])
+end
+local result = {}
+for _, pending in ipairs(KEYS) do
+    if budget <= 0 then
+        break
+    end
+    local keys = redis.call('SPOP', pending, budget)
+    budget = budget - #keys
+    for _, key in ipairs(keys) do
+        local offset = offsets[key] or 0
+        local records = redis.call('LRANGE', key, offset, offset + limit - 1)
+        if #records > 0 then
+            table.insert(result, key)
+            table.insert(result, records)
+        end
+    end
+end
+return result
+"""
+
+# Removes the first ARGV[i] elements of the list KEYS[i + 1]. Lists that still hold
+# records (bounded slice or data pushed meanwhile) are put back into the pending set KEYS[1]
+# and no longer expire, in case they were retained for an unknown device before.
+TRIM_SCRIPT = """
+for i = 2, #KEYS do
+    local key = KEYS[i]
+    local count = tonumber(ARGV[i - 1])
+    if count > 0 then
+        redis.call('LTRIM', key, count, -1)
+    end
+    if redis.call('LLEN', key) > 0 then
+        redis.call('PERSIST', key)
+        redis.call('SADD', KEYS[1], key)
+    end
+end
+return #KEYS - 1
+"""
+
+# Adds every non-empty list from KEYS[2..] to the pending set KEYS[1].
+MARK_PENDING_SCRIPT = """
+local marked = 0
+for i = 2, #KEYS do
+    if redis.call('LLEN', KEYS[i]) > 0 then
+        marked = marked + redis.call('SADD', KEYS[1], KEYS[i])
+    end
+end
+return marked
+"""
+
+# Upper bound of keys passed to a single script invocation.
+KEYS_PER_CALL = 200
+
+
+def _chunks(items: List[str], size: int) -> Iterable[List[str]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def pending_key(shard: int) -> str:
+    """Returns the pending set of the shard."""
+    if settings.TELEMETRY_SHARDS == 1:
+        return PENDING_KEY
+    return f'{PENDING_KEY}:{shard}'
+
+
+def stream_key(shard: int) -> str:
+    """Returns the stream of the shard."""
+    if settings.TELEMETRY_SHARDS == 1:
+        return STREAM_KEY
+    return f'{STREAM_KEY}:{shard}'
+
+
+def _group_by_pending_key(keys: Iterable[str]) -> Dict[str, List[str]]:
+    groups = defaultdict(list)
+    for key in keys:
+        groups[pending_key(shard_for_mac(key))].append(key)
+    return groups
+
+
+def enqueue_telemetry(client: redis.Redis, raw_mac: str, payload: str) -> None:
+    """Queues a reading of the device in the format of the configured backend."""
+    shard = shard_for_mac(raw_mac)
+    if settings.TELEMETRY_QUEUE_BACKEND == 'stream':
+        client.xadd(stream_key(shard), {'mac': raw_mac, 'data': payload})
+        return
+
+    pipe = client.pipeline(transaction=True)
+    pipe.rpush(raw_mac, payload)
+    pipe.sadd(pending_key(shard), raw_mac)
+    pipe.execute()
+
+
+def drain_pending_queues(client: redis.Redis, pending_keys: List[str], max_keys: int, limit: int,
+                         offsets: Optional[Dict[str, int]] = None) -> Dict[str, List[bytes]]:
+    """
+    Pops up to ``max_keys`` device keys from the pending sets and reads up to
+    ``limit`` records from the head of each of their lists in one script call.
+
+    ``offsets`` holds the number of records already read from a list and not
+    trimmed yet; reading starts after them.
+
+    Popped keys that are not trimmed with :func:`trim_queues` are only picked up
+    again by :func:`mark_pending_queues`.
+    """
+    if not pending_keys:
+        return {}
+
+    args: List[Any] = [max_keys, limit]
+    for key, offset in (offsets or {}).items():
+        args.extend((key, offset))
+
+    script = client.register_script(DRAIN_SCRIPT)
+    result = script(keys=pending_keys, args=args)
+
+    slices: Dict[str, List[bytes]] = {}
+    for index in range(0, len(result), 2):
+        slices[result[index].decode()] = result[index + 1]
+    return slices
+
+
+def trim_queues(client: redis.Redis, counts: Dict[str, int]) -> None:
+    """
+    Removes ``counts[key]`` records from the head of every list.
+
+    Must only be called after the records returned by :func:`drain_pending_queues`
+    have been committed. Producers only append to the tail, so trimming the
+    head never drops records that were not read.
+    """
+    if not counts:
+        return
+
+    script = client.register_script(TRIM_SCRIPT)
+    pipe = client.pipeline(transaction=False)
+    for pending, keys in _group_by_pending_key(counts).items():
+        for chunk in _chunks(keys, KEYS_PER_CALL):
+            script(keys=[pending, *chunk], args=[counts[key] for key in chunk], client=pipe)
+    pipe.execute()
+
+
+def cap_retained_queues(client: redis.Redis, keys: Collection[str]) -> None:
+    """
+    Bounds the lists kept for devices that are not registered: only the newest
+    TELEMETRY_UNKNOWN_DEVICE_MAX_RECORDS records are kept and the list expires
+    TELEMETRY_UNKNOWN_DEVICE_TTL seconds after it was last read, i.e. after
+    the last reading of the device arrived.
+    """
+    if not keys:
+        return
+
+    pipe = client.pipeline(transaction=False)
+    for key in keys:
+        pipe.ltrim(key, -settings.TELEMETRY_UNKNOWN_DEVICE_MAX_RECORDS, -1)
+        pipe.expire(key, settings.TELEMETRY_UNKNOWN_DEVICE_TTL)
+    pipe.execute()
+
+
+def mark_pending_queues(client: redis.Redis, keys: List[str]) -> int:
+    """
+    Adds every non-empty list from ``keys`` to the pending set of its shard.
+
+    Recovers keys that were popped by a consumer which crashed before trimming,
+    lists filled by producers that do not maintain the pending set and lists
+    left in the pending set of another shard after TELEMETRY_SHARDS changed.
+    """
+    if not keys:
+        return 0
+
+    script = client.register_script(MARK_PENDING_SCRIPT)
+    pipe = client.pipeline(transaction=False)
+    for pending, shard_keys in _group_by_pending_key(keys).items():
+        for chunk in _chunks(shard_keys, KEYS_PER_CALL):
+            script(keys=[pending, *chunk], client=pipe)
+    return sum(pipe.execute())
+
+
+def claim_reconcile(client: redis.Redis, interval: int) -> bool:
+    """Returns True for at most one caller every ``interval`` seconds."""
+    return bool(client.set(RECONCILE_LOCK_KEY, 1, nx=True, ex=interval))
+
+
+@dataclass
+class TelemetryBatch:
+    """Messages fetched from a queue together with the data needed to acknowledge them."""
+    # (raw MAC address, JSON payload) pairs in queue order
+    messages: List[Tuple[str, bytes]]
+    receipt: Any
+
+
+class ListTelemetryQueue:
+    """Per-device Redis lists indexed by the pending sets of the shards."""
+
+    # Seconds between polls of the pending sets while waiting for data
+    poll_interval = 0.1
+
+    def __init__(self, client: redis.Redis, max_keys: int, limit: int, shards: Optional[List[int]] = None):
+        self.client = client
+        self.max_keys = max_keys
+        self.limit = limit
+        self.shards = list(range(settings.TELEMETRY_SHARDS)) if shards is None else shards
+        # Records fetched but not acknowledged yet, per key
+        self._in_flight: Dict[str, int] = {}
+
+    def fetch(self, block: Optional[int] = None) -> TelemetryBatch:
+        """
+        Reads the next records of pending lists. Several batches may be fetched
+        before acknowledging them. ``block`` is the number of milliseconds to
+        wait for data; the pending sets are polled meanwhile.
+        """
+        deadline = time.monotonic() + (block or 0) / 1000
+        while True:
+            self.reconcile()
+            # Shuffled so that the key budget does not always go to the same shards
+            pending_keys = [pending_key(shard) for shard in self.shards]
+            random.shuffle(pending_keys)
+            slices = drain_pending_queues(self.client, pending_keys, self.max_keys, self.limit, self._in_flight)
+            remaining = deadline - time.monotonic()
+            if slices or remaining <= 0:
+                break
+            time.sleep(min(self.poll_interval, remaining))
+
+        for key, records in slices.items():
+            self._in_flight[key] = self._in_flight.get(key, 0) + len(records)
+        messages = [(key, record) for key, records in slices.items() for record in records]
+        # Number of records read from every key, trimmed on ack
+        return TelemetryBatch(messages, {key: len(records) for key, records in slices.items()})
+
+    def ack(self, batch: TelemetryBatch, retain: Collection[str] = ()) -> None:
+        """
+        Removes the batch from the queues. Malformed records are removed too,
+        otherwise they would block the queue forever. Lists of devices in
+        ``retain`` are left out of the pending set until reconciliation finds
+        them (i.e. once the device is registered), capped by :func:`cap_retained_queues`.
+
+        Batches must be acknowledged in the order they were fetched.
+        """
+        self._forget(batch)
+        trim_queues(self.client, {
+            key: count
+            for key, count in batch.receipt.items()
+            if key not in retain
+        })
+        cap_retained_queues(self.client, [key for key in batch.receipt if key in retain])
+
+    def release(self, batch: TelemetryBatch) -> None:
+        """Returns the batch to the pending sets without removing anything."""
+        self._forget(batch)
+        trim_queues(self.client, {key: 0 for key in batch.receipt})
+
+    def _forget(self, batch: TelemetryBatch) -> None:
+        for key, count in batch.receipt.items():
+            remaining = self._in_flight.get(key, 0) - count
+            if remaining > 0:
+                self._in_flight[key] = remaining
+            else:
+                self._in_flight.pop(key, None)
+
+    def reconcile(self) -> None:
+        """
+        Marks the queues of all registered devices that hold data as pending.
+        Runs at most once per TELEMETRY_PENDING_RECONCILE_INTERVAL across all workers.
+        """
+        if not claim_reconcile(self.client, settings.TELEMETRY_PENDING_RECONCILE_INTERVAL):
+            return
+
+        keys = [device.raw_mac_address for device in Device.objects.only('mac_address')]
+        marked = mark_pending_queues(self.client, keys)
+        if marked:
+            logger.warning(f"Reconciliation found {marked} device queues missing from the pending sets")
+
+
+class StreamTelemetryQueue:
+    """Redis streams of the shards consumed through a consumer group."""
+
+    def __init__(self, client: redis.Redis, consumer: str, count: int, min_idle_time: int,
+                 shards: Optional[List[int]] = None):
+        self.client = client
+        self.consumer = consumer
+        self.count = count
+        # Milliseconds an entry has to stay unacknowledged before another consumer reclaims it
+        self.min_idle_time = min_idle_time
+        self.shards = list(range(settings.TELEMETRY_SHARDS)) if shards is None else shards
+        self._ready_streams: Set[str] = set()
+        self._next_reclaim: Dict[str, float] = {}
+
+    def ensure_group(self, stream: str) -> None:
+        if stream in self._ready_streams:
+            return
+        try:
+            # Start from the beginning so entries added before the group existed are ingested
+            self.client.xgroup_create(stream, STREAM_GROUP, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._ready_streams.add(stream)
+
+    def fetch(self, block: Optional[int] = None) -> TelemetryBatch:
+        """
+        Returns entries left pending by crashed consumers first, then new ones.
+        ``block`` is the number of milliseconds to wait for new entries.
+        """
+        streams = [stream_key(shard) for shard in self.shards]
+        if not streams:
+            return TelemetryBatch([], {})
+        for stream in streams:
+            self.ensure_group(stream)
+
+        response: list = [(stream, entries) for stream in streams if (entries := self._reclaim(stream))]
+        if not response:
+            response = cast(list, self.client.xreadgroup(
+                STREAM_GROUP, self.consumer, {stream: '>' for stream in streams},
+                count=self.count, block=block
+            )) or []
+
+        messages = []
+        receipt: Dict[str, List[bytes]] = {}
+        for key, entries in response:
+            stream = key.decode() if isinstance(key, bytes) else key
+            for entry_id, fields in entries:
+                receipt.setdefault(stream, []).append(entry_id)
+                try:
+                    messages.append((fields[b'mac'].decode(), fields[b'data']))
+                except (KeyError, TypeError, AttributeError):
+                    # Acknowledged with the rest of the batch so it is not redelivered
+                    logger.error(f"Malformed telemetry stream entry {entry_id}: {fields}")
+        return TelemetryBatch(messages, receipt)
+
+    def _reclaim(self, stream: str) -> list:
+        now = time.monotonic()
+        if now < self._next_reclaim.get(stream, 0.0):
+            return []
+
+        _, entries, *_ = cast(list, self.client.xautoclaim(
+            stream, STREAM_GROUP, self.consumer, self.min_idle_time,
+            start_id='0-0', count=self.count
+        ))
+        if entries:
+            logger.warning(f"Reclaimed {len(entries)} unacknowledged entries of {stream}")
+        if len(entries) < self.count:
+            # Nothing else to reclaim until more entries become idle
+            self._next_reclaim[stream] = now + self.min_idle_time / 1000
+        return entries
+
+    def ack(self, batch: TelemetryBatch, retain: Collection[str] = ()) -> None:
+        """
+        Acknowledges and deletes the batch entries. Entries of unknown devices
+        cannot be retained in a shared stream and are dropped.
+        """
+        if not batch.receipt:
+            return
+        pipe = self.client.pipeline(transaction=True)
+        for stream, entry_ids in batch.receipt.items():
+            pipe.xack(stream, STREAM_GROUP, *entry_ids)
+            pipe.xdel(stream, *entry_ids)
+        pipe.execute()
+
+    def release(self, batch: TelemetryBatch) -> None:
+        """Unacknowledged entries stay pending and are reclaimed after ``min_idle_time``."""
+
+
+def default_consumer_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def get_telemetry_queue(client: redis.Redis, consumer: Optional[str] = None, shards: Optional[List[int]] = None):
+    """
+    Returns the queue backend selected by the TELEMETRY_QUEUE_BACKEND setting,
+    reading the given shards (all of them by default).
+    """
+    backend = settings.TELEMETRY_QUEUE_BACKEND
+    if backend == 'list':
+        return ListTelemetryQueue(
+            client,
+            settings.TELEMETRY_PENDING_BATCH_SIZE,
+            settings.TELEMETRY_QUEUE_BATCH_SIZE,
+            shards
+        )
+    if backend == 'stream':
+        return StreamTelemetryQueue(
+            client,
+            consumer or default_consumer_name(),
+            settings.TELEMETRY_STREAM_BATCH_SIZE,
+            settings.TELEMETRY_STREAM_CLAIM_IDLE_MS,
+            shards
+        )
+    raise ValueError(f"Unknown telemetry queue backend: {backend}")
@@ -0,0 +1,199 @@
+"""
+Registry of device metadata needed by the ingest pipeline, keyed by raw MAC address.
+
+Lookups go through three levels:
+
+1. a per-process dictionary whose entries expire after DEVICE_REGISTRY_TTL seconds,
+2. the Redis hash ``devices:registry`` shared by all workers,
+3. the database, queried once for all remaining addresses of a batch.
+
+Unknown addresses are cached too, so telemetry of unregistered devices does not
+hit the database on every batch. Saving or deleting a device or its sensor
+limits clears the Redis hash and bumps ``devices:registry:version``; workers
+drop their local entries when they see a new version.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple, cast
+
+import redis
+from django.conf import settings
+from django.db.models import Value
+from django.db.models.functions import Lower, Replace
+
+from core.redis_client import get_redis_client
+from devices.models import Device
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_KEY = 'devices:registry'
+VERSION_KEY = 'devices:registry:version'
+
+LIMIT_FIELDS = (
+    'temp_min', 'temp_max', 'humidity_min', 'humidity_max',
+    'pressure_min', 'pressure_max', 'soil_moisture_min', 'soil_moisture_max',
+)
+
+# Stores the ARGV[2..] field/value pairs in the hash KEYS[1] unless the registry
+# was invalidated (KEYS[2] changed from ARGV[1]) after the values were read.
+STORE_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+for i = 2, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+
+class SensorLimits(NamedTuple):
+    """Sensor limits of a device, with the attribute names of DeviceSensorLimits."""
+    temp_min: float
+    temp_max: float
+    humidity_min: float
+    humidity_max: float
+    pressure_min: float
+    pressure_max: float
+    soil_moisture_min: int
+    soil_moisture_max: int
+
+
+class DeviceRecord(NamedTuple):
+    """Device metadata used by ingest, in place of a Device instance."""
+    pk: uuid.UUID
+    user_id: uuid.UUID
+    mac_address: str
+    sensor_limits: Optional[SensorLimits]
+
+    def to_json(self) -> str:
+        return json.dumps([str(self.pk), str(self.user_id), self.mac_address, self.sensor_limits])
+
+    @classmethod
+    def from_json(cls, data) -> 'DeviceRecord':
+        pk, user_id, mac_address, limits = json.loads(data)
+        return cls(uuid.UUID(pk), uuid.UUID(user_id), mac_address, SensorLimits(*limits) if limits else None)
+
+
+def load_device_records(raw_macs: Iterable[str]) -> Dict[str, DeviceRecord]:
+    """Reads the records of the given raw MAC addresses from the database in one query."""
+    rows = Device.objects.annotate(
+        raw_mac=Lower(Replace('mac_address', Value(':'), Value('')))
+    ).filter(raw_mac__in=list(raw_macs)).values_list(
+        'raw_mac', 'pk', 'user_id', 'mac_address',
+        *(f'sensor_limits__{field}' for field in LIMIT_FIELDS)
+    )
+    records = {}
+    for raw_mac, pk, user_id, mac_address, *limits in rows:
+        # Limits fields are NULL when the device has no limits configured
+        sensor_limits = SensorLimits(*limits) if limits[0] is not None else None
+        records[raw_mac] = DeviceRecord(pk, user_id, mac_address, sensor_limits)
+    return records
+
+
+class DeviceRegistry:
+    """Process-local view of the shared device registry."""
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = settings.DEVICE_REGISTRY_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        # raw MAC -> (expiry, record or None for unknown devices)
+        self._local: Dict[str, Tuple[float, Optional[DeviceRecord]]] = {}
+        self._version: Optional[bytes] = None
+
+    def get_many(self, raw_macs: Iterable[str]) -> Dict[str, DeviceRecord]:
+        """Returns the records of the registered devices among ``raw_macs``."""
+        raw_macs = set(raw_macs)
+        client = get_redis_client()
+        # None while Redis is unavailable
+        version: Optional[bytes]
+        try:
+            version = cast(Optional[bytes], client.get(VERSION_KEY)) or b'0'
+        except redis.RedisError as e:
+            logger.error(f"Device registry unavailable in Redis, using the database: {e}")
+            version = None
+
+        now = time.monotonic()
+        with self._lock:
+            if version is not None and version != self._version:
+                self._local.clear()
+                self._version = version
+            cached = {mac: self._local.get(mac) for mac in raw_macs}
+
+        found: Dict[str, Optional[DeviceRecord]] = {
+            mac: entry[1] for mac, entry in cached.items() if entry and entry[0] > now
+        }
+        missing = [mac for mac in raw_macs if mac not in found]
+
+        if missing and version is not None:
+            found.update(self._get_shared(client, missing))
+            missing = [mac for mac in missing if mac not in found]
+
+        if missing:
+            loaded: Dict[str, Optional[DeviceRecord]] = dict(load_device_records(missing))
+            loaded.update({mac: None for mac in missing if mac not in loaded})
+            found.update(loaded)
+            if version is not None:
+                self._store_shared(client, version, loaded)
+
+        with self._lock:
+            expiry = now + self.ttl
+            for mac in raw_macs:
+                entry = cached[mac]
+                if entry is None or entry[0] <= now:
+                    self._local[mac] = (expiry, found[mac])
+
+        return {mac: record for mac, record in found.items() if record is not None}
+
+    def _get_shared(self, client: redis.Redis, raw_macs) -> Dict[str, Optional[DeviceRecord]]:
+        try:
+            values = cast(list, client.hmget(REGISTRY_KEY, raw_macs))
+        except redis.RedisError as e:
+            logger.error(f"Failed to read the device registry from Redis: {e}")
+            return {}
+        # An empty value marks an unknown device
+        return {
+            mac: DeviceRecord.from_json(value) if value else None
+            for mac, value in zip(raw_macs, values)
+            if value is not None
+        }
+
+    def _store_shared(self, client: redis.Redis, version: bytes, records: Dict[str, Optional[DeviceRecord]]) -> None:
+        args: list = [version]
+        for mac, record in records.items():
+            args.extend((mac, record.to_json() if record else ''))
+        try:
+            client.register_script(STORE_SCRIPT)(keys=[REGISTRY_KEY, VERSION_KEY], args=args)
+        except redis.RedisError as e:
+            logger.error(f"Failed to update the device registry in Redis: {e}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._local.clear()
+
+
+_registry: Optional[DeviceRegistry] = None
+
+
+def get_device_registry() -> DeviceRegistry:
+    """Returns the process-wide device registry."""
+    global _registry
+    if _registry is None:
+        _registry = DeviceRegistry()
+    return _registry
+
+
+def invalidate_device_registry() -> None:
+    """Drops the cached records of all workers, called when devices or their limits change."""
+    get_device_registry().clear()
+    try:
+        pipe = get_redis_client().pipeline(transaction=True)
+        pipe.delete(REGISTRY_KEY)
+        pipe.incr(VERSION_KEY)
+        pipe.execute()
+    except redis.RedisError as e:
+        # Other workers pick up the change once their entries expire
+        logger.error(f"Failed to invalidate the device registry in Redis: {e}")
@@ -0,0 +1,108 @@
+"""
+Cache of computed device responses, in the Redis cache backend (CACHES).
+
+Entries are keyed by device, endpoint and the request params (window,
+resolution, ...), together with the device's telemetry generation: a counter
+ingest increments after committing new readings of the device. An entry is
+therefore never served once data arrived for its device, and nothing is
+deleted - outdated entries just stop being read and expire after
+RESPONSE_CACHE_TIMEOUT seconds. The device version (see devices.versions) is
+part of the key too, so device changes and activity updates are not served
+stale either.
+
+Hits and misses are counted per endpoint in Redis (``responsecachestats``).
+"""
+import hashlib
+import logging
+from typing import Any, Callable, Dict, Iterable, Optional, cast
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+
+from core.redis_client import get_redis_client
+from devices.models import Device
+from devices.versions import device_version
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = 'telemetry:generation:{device_id}'
+STATS_KEY = 'response_cache:stats'
+
+# Generations outlive every entry keyed by them, a reset to 0 cannot revive old entries
+GENERATION_TTL = 7 * 24 * 3600
+
+
+def bump_generations(device_ids: Iterable[Any]) -> None:
+    """Invalidates the cached responses of the devices, called when new readings are committed."""
+    device_ids = set(device_ids)
+    if not device_ids:
+        return
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        for device_id in device_ids:
+            key = GENERATION_KEY.format(device_id=device_id)
+            pipe.incr(key)
+            pipe.expire(key, GENERATION_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        # Entries of the devices are served until they expire
+        logger.error(f"Failed to bump the response cache generation of {len(device_ids)} devices: {e}")
+
+
+def get_generation(device_id) -> int:
+    return int(cast(Optional[bytes], get_redis_client().get(GENERATION_KEY.format(device_id=device_id))) or 0)
+
+
+def make_key(device: Device, endpoint: str, generation: int, params: Dict[str, Any]) -> str:
+    version, _ = device_version(device, generation)
+    digest = hashlib.md5(repr((sorted(params.items()), version)).encode()).hexdigest()
+    return f'response:{endpoint}:{device.pk}:{generation}:{digest}'
+
+
+def record(endpoint: str, hit: bool) -> None:
+    try:
+        get_redis_client().hincrby(STATS_KEY, f'{endpoint}:{"hits" if hit else "misses"}', 1)
+    except redis.RedisError:
+        pass
+
+
+def get_stats() -> Dict[str, Dict[str, int]]:
+    """Returns the hit and miss counts per endpoint."""
+    stats: Dict[str, Dict[str, int]] = {}
+    for field, count in cast(dict, get_redis_client().hgetall(STATS_KEY)).items():
+        endpoint, kind = field.decode().rsplit(':', 1)
+        stats.setdefault(endpoint, {'hits': 0, 'misses': 0})[kind] = int(count)
+    return stats
+
+
+def reset_stats() -> None:
+    get_redis_client().delete(STATS_KEY)
+
+
+def get_or_build(device: Device, endpoint: str, params: Dict[str, Any], build: Callable[[], Any]) -> Any:
+    """
+    Returns the cached response data of the endpoint for the device and params,
+    or builds and caches it. Without Redis the data is built every time.
+    """
+    timeout = settings.RESPONSE_CACHE_TIMEOUT
+    if timeout <= 0:
+        return build()
+
+    try:
+        key = make_key(device, endpoint, get_generation(device.pk), params)
+        data = cache.get(key)
+    except redis.RedisError as e:
+        logger.error(f"Response cache unavailable: {e}")
+        return build()
+
+    record(endpoint, hit=data is not None)
+    if data is not None:
+        return data
+
+    data = build()
+    try:
+        cache.set(key, data, timeout)
+    except redis.RedisError as e:
+        logger.error(f"Failed to store a response in the cache: {e}")
+    return data
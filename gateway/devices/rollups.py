@@ -0,0 +1,227 @@
+"""
+Incrementally maintained telemetry rollups.
+
+Every stored reading is added to one minute, hour and day bucket of its device
+(see TelemetryRollup). Ingest merges the buckets of a batch into the stored ones
+with a single upsert per chunk, so late readings land in the right bucket.
+The ``backfillrollups`` command rebuilds the buckets from stored telemetry,
+holding an advisory lock of the device that ingest waits for (see :func:`lock_rollups`).
+"""
+import zlib
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.uuids import uuid7
+from devices.models import TelemetryRollup
+
+METRICS = ('temperature', 'humidity', 'pressure', 'soil_moisture')
+
+# Ordered from the finest bucket
+RESOLUTIONS = TelemetryRollup.RESOLUTION_LENGTHS
+
+# Columns of a bucket besides the key (device, resolution, bucket)
+VALUE_COLUMNS = ['count', 'last_timestamp'] + [
+    f'{metric}_{aggregate}' for metric in METRICS for aggregate in ('min', 'max', 'sum', 'last')
+]
+
+# Rows per upsert statement
+UPSERT_CHUNK_SIZE = 1000
+
+BucketKey = Tuple[Any, str, datetime]
+
+# First key of the advisory locks on the rollups of a device, the second one is derived from the device
+ROLLUP_LOCK_NAMESPACE = 0x524f4c4c
+
+
+def _lock_key(device_id) -> int:
+    # Signed, as PostgreSQL takes int4 keys; colliding devices only wait for each other
+    key = zlib.crc32(str(device_id).encode())
+    return key - 2 ** 32 if key >= 2 ** 31 else key
+
+
+def lock_rollups(device_ids: Iterable[Any], exclusive: bool = False) -> None:
+    """
+    Takes the advisory lock on the rollups of the devices until the end of the
+    transaction (PostgreSQL only). Ingest takes it shared, so its batches do not
+    wait on each other; backfillrollups takes it exclusively while it reads the
+    readings of a device and replaces its buckets, so readings committed meanwhile
+    are added after the rebuild instead of being overwritten by it.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    keys = sorted({_lock_key(device_id) for device_id in device_ids})
+    function = 'pg_advisory_xact_lock' if exclusive else 'pg_advisory_xact_lock_shared'
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {function}(%s, key) FROM unnest(%s::int[]) AS key', [ROLLUP_LOCK_NAMESPACE, keys])
+
+
+def bucket_start(timestamp: datetime, resolution: str) -> datetime:
+    """Returns the start of the UTC bucket of the given resolution containing the timestamp."""
+    timestamp = timestamp.astimezone(dt_timezone.utc)
+    if resolution == TelemetryRollup.RESOLUTION_MINUTE:
+        return timestamp.replace(second=0, microsecond=0)
+    if resolution == TelemetryRollup.RESOLUTION_HOUR:
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if resolution == TelemetryRollup.RESOLUTION_DAY:
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown rollup resolution: {resolution}")
+
+
+def merge_buckets(current: Dict[str, Any], other: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the aggregates of both buckets combined."""
+    newer = other if other['last_timestamp'] >= current['last_timestamp'] else current
+    merged = {
+        'count': current['count'] + other['count'],
+        'last_timestamp': newer['last_timestamp'],
+    }
+    for metric in METRICS:
+        merged[f'{metric}_min'] = min(current[f'{metric}_min'], other[f'{metric}_min'])
+        merged[f'{metric}_max'] = max(current[f'{metric}_max'], other[f'{metric}_max'])
+        merged[f'{metric}_sum'] = current[f'{metric}_sum'] + other[f'{metric}_sum']
+        merged[f'{metric}_last'] = newer[f'{metric}_last']
+    return merged
+
+
+class RollupAggregator:
+    """Accumulates readings into buckets of all resolutions."""
+
+    def __init__(self, resolutions: Iterable[str] = tuple(RESOLUTIONS)):
+        self.resolutions = list(resolutions)
+        self.buckets: Dict[BucketKey, Dict[str, Any]] = {}
+
+    def add(self, device_id, timestamp: datetime, temperature: float, humidity: float,
+            pressure: float, soil_moisture: float) -> None:
+        values = {
+            'temperature': float(temperature),
+            'humidity': float(humidity),
+            'pressure': float(pressure),
+            'soil_moisture': float(soil_moisture),
+        }
+        reading = {'count': 1, 'last_timestamp': timestamp}
+        for metric, value in values.items():
+            reading[f'{metric}_min'] = reading[f'{metric}_max'] = value
+            reading[f'{metric}_sum'] = reading[f'{metric}_last'] = value
+
+        for resolution in self.resolutions:
+            key = (device_id, resolution, bucket_start(timestamp, resolution))
+            bucket = self.buckets.get(key)
+            self.buckets[key] = reading if bucket is None else merge_buckets(bucket, reading)
+
+    def add_readings(self, readings: Iterable[Any]) -> 'RollupAggregator':
+        """Adds Telemetry instances or TelemetryRows."""
+        for reading in readings:
+            self.add(reading.device_id, reading.timestamp, reading.temperature, reading.humidity,
+                     reading.pressure, reading.soil_moisture)
+        return self
+
+
+def update_rollups(readings: Iterable[Any]) -> int:
+    """
+    Adds newly stored readings to their rollup buckets.
+    Must only be called once per reading, in the transaction that stores it.
+    Returns the number of touched buckets.
+    """
+    buckets = RollupAggregator().add_readings(readings).buckets
+    if not buckets:
+        return 0
+
+    with transaction.atomic():
+        lock_rollups({device_id for device_id, _, _ in buckets})
+        if connection.vendor == 'postgresql':
+            _upsert_postgresql(buckets)
+        else:
+            _upsert_orm(buckets)
+    return len(buckets)
+
+
+def _upsert_postgresql(buckets: Dict[BucketKey, Dict[str, Any]]) -> None:
+    quote = connection.ops.quote_name
+    table = quote(TelemetryRollup._meta.db_table)
+    columns = ['uuid', 'created_at', 'updated_at', 'device_id', 'resolution', 'bucket'] + VALUE_COLUMNS
+
+    assignments = ['count = rollup.count + EXCLUDED.count', 'updated_at = EXCLUDED.updated_at']
+    for metric in METRICS:
+        assignments += [
+            f'{metric}_min = LEAST(rollup.{metric}_min, EXCLUDED.{metric}_min)',
+            f'{metric}_max = GREATEST(rollup.{metric}_max, EXCLUDED.{metric}_max)',
+            f'{metric}_sum = rollup.{metric}_sum + EXCLUDED.{metric}_sum',
+            f'{metric}_last = CASE WHEN EXCLUDED.last_timestamp >= rollup.last_timestamp '
+            f'THEN EXCLUDED.{metric}_last ELSE rollup.{metric}_last END',
+        ]
+    # Must come last, the CASE expressions above compare against the old value
+    assignments.append('last_timestamp = GREATEST(rollup.last_timestamp, EXCLUDED.last_timestamp)')
+
+    now = timezone.now()
+    # Sorted so concurrent writers lock the buckets in the same order
+    keys = sorted(buckets, key=lambda key: (str(key[0]), key[1], key[2]))
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(keys), UPSERT_CHUNK_SIZE):
+            chunk = keys[start:start + UPSERT_CHUNK_SIZE]
+            params = []
+            for device_id, resolution, bucket in chunk:
+                values = buckets[(device_id, resolution, bucket)]
+                params += [uuid7(), now, now, device_id, resolution, bucket]
+                params += [values[column] for column in VALUE_COLUMNS]
+            cursor.execute(
+                f'INSERT INTO {table} AS rollup ({", ".join(columns)}) '
+                f'VALUES {", ".join([placeholders] * len(chunk))} '
+                f'ON CONFLICT (device_id, resolution, bucket) DO UPDATE SET {", ".join(assignments)}',
+                params
+            )
+
+
+def _upsert_orm(buckets: Dict[BucketKey, Dict[str, Any]]) -> None:
+    """Read-merge-write fallback for backends without the upsert above (SQLite in tests)."""
+    device_ids = {device_id for device_id, _, _ in buckets}
+    starts = [bucket for _, _, bucket in buckets]
+
+    now = timezone.now()
+    with transaction.atomic():
+        # Superset of the buckets of the batch, narrowed down by key below
+        stored = TelemetryRollup.objects.select_for_update().filter(
+            device_id__in=device_ids, bucket__gte=min(starts), bucket__lte=max(starts)
+        )
+        existing = {(rollup.device_id, rollup.resolution, rollup.bucket): rollup for rollup in stored}
+        to_create, to_update = [], []
+        for key, values in buckets.items():
+            rollup = existing.get(key)
+            if rollup is None:
+                device_id, resolution, bucket = key
+                to_create.append(TelemetryRollup(
+                    device_id=device_id, resolution=resolution, bucket=bucket, **values
+                ))
+                continue
+            current = {column: getattr(rollup, column) for column in VALUE_COLUMNS}
+            for column, value in merge_buckets(current, values).items():
+                setattr(rollup, column, value)
+            rollup.updated_at = now
+            to_update.append(rollup)
+
+        TelemetryRollup.objects.bulk_create(to_create)
+        TelemetryRollup.objects.bulk_update(to_update, VALUE_COLUMNS + ['updated_at'])
+
+
+def replace_rollups(device_id, since: Optional[datetime], buckets: Dict[BucketKey, Dict[str, Any]]) -> int:
+    """
+    Replaces the stored rollups of the device from the day of ``since`` (or all of them)
+    with ``buckets``. Returns the number of written buckets.
+    Call it in the transaction that read the readings of the buckets, holding the
+    exclusive :func:`lock_rollups` of the device since before the read.
+    """
+    rollups = TelemetryRollup.objects.filter(device_id=device_id)
+    if since is not None:
+        rollups = rollups.filter(bucket__gte=bucket_start(since, TelemetryRollup.RESOLUTION_DAY))
+
+    objects: List[TelemetryRollup] = [
+        TelemetryRollup(device_id=key_device, resolution=resolution, bucket=bucket, **values)
+        for (key_device, resolution, bucket), values in buckets.items()
+    ]
+    with transaction.atomic():
+        rollups.delete()
+        TelemetryRollup.objects.bulk_create(objects, batch_size=UPSERT_CHUNK_SIZE)
+    return len(objects)
@@ -1,6 +1,9 @@
 from rest_framework import serializers
 
-from .models import Device, Telemetry, DashboardLayout
+from .columnar import LAYOUT_COLUMNS, points_to_columns, series_to_columns
+from .downsampling import METHOD_LTTB, downsample, load_series
+from .history import RESOLUTION_AUTO, RESOLUTION_RAW, choose_resolution, get_raw_history
+from .models import Device, Telemetry, TelemetryRollup, DashboardLayout
 
 
 class TelemetrySerializer(serializers.ModelSerializer):
@@ -25,6 +28,72 @@ class TelemetrySerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at']
 
 
+class TelemetryRollupSerializer(serializers.ModelSerializer):
+    """
+    Rollup bucket in the shape of a telemetry reading: the metrics are the bucket
+    averages and ``timestamp`` is the start of the bucket.
+    """
+    temperature = serializers.SerializerMethodField()
+    humidity = serializers.SerializerMethodField()
+    pressure = serializers.SerializerMethodField()
+    soil_moisture = serializers.SerializerMethodField()
+    timestamp = serializers.DateTimeField(source='bucket')
+
+    class Meta:
+        model = TelemetryRollup
+        fields = [
+            'resolution',
+            'temperature',
+            'humidity',
+            'pressure',
+            'soil_moisture',
+            'timestamp',
+            'count',
+            'temperature_min',
+            'temperature_max',
+            'humidity_min',
+            'humidity_max',
+            'pressure_min',
+            'pressure_max',
+            'soil_moisture_min',
+            'soil_moisture_max',
+        ]
+        read_only_fields = fields
+
+    def get_temperature(self, obj):
+        return obj.average('temperature')
+
+    def get_humidity(self, obj):
+        return obj.average('humidity')
+
+    def get_pressure(self, obj):
+        return obj.average('pressure')
+
+    def get_soil_moisture(self, obj):
+        return obj.average('soil_moisture')
+
+
+class TelemetryPointSerializer(serializers.Serializer):
+    """
+    Point of a downsampled history: the (average) metrics of the readings it stands
+    for, and their range for the minmax method.
+    """
+    timestamp = serializers.DateTimeField()
+    count = serializers.IntegerField()
+    temperature = serializers.FloatField()
+    humidity = serializers.FloatField()
+    pressure = serializers.FloatField()
+    soil_moisture = serializers.FloatField()
+    temperature_min = serializers.FloatField(required=False)
+    temperature_max = serializers.FloatField(required=False)
+    humidity_min = serializers.FloatField(required=False)
+    humidity_max = serializers.FloatField(required=False)
+    pressure_min = serializers.FloatField(required=False)
+    pressure_max = serializers.FloatField(required=False)
+    soil_moisture_min = serializers.FloatField(required=False)
+    soil_moisture_max = serializers.FloatField(required=False)
+
+
 class DeviceSerializer(serializers.ModelSerializer):
     latest_telemetry = serializers.SerializerMethodField()
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
@@ -40,11 +109,12 @@ class DeviceSerializer(serializers.ModelSerializer):
             'plant_name',
             'user',
             'is_active',
+            'last_seen_at',
             'latest_telemetry',
             'created_at',
             'updated_at',
         ]
-        read_only_fields = ['is_active', 'created_at', 'updated_at']
+        read_only_fields = ['is_active', 'last_seen_at', 'created_at', 'updated_at']
 
     def validate(self, attrs):
         # For creation, ensure required fields are present
@@ -62,14 +132,33 @@ class DeviceSerializer(serializers.ModelSerializer):
 
 class DeviceDetailSerializer(DeviceSerializer):
     telemetry_history = serializers.SerializerMethodField()
+    telemetry_resolution = serializers.SerializerMethodField()
 
     class Meta(DeviceSerializer.Meta):
-        fields = DeviceSerializer.Meta.fields + ['telemetry_history']
+        fields = DeviceSerializer.Meta.fields + ['telemetry_history', 'telemetry_resolution']
+
+    def get_telemetry_resolution(self, obj):
+        hours = self.context.get('hours', 24)
+        return choose_resolution(hours, self.context.get('resolution', RESOLUTION_AUTO))
 
     def get_telemetry_history(self, obj):
         hours = self.context.get('hours', 24)
-        telemetry = obj.get_telemetry_history(hours=hours)
-        return TelemetrySerializer(telemetry, many=True).data
+        resolution = self.get_telemetry_resolution(obj)
+        max_points = self.context.get('max_points')
+        columns = self.context.get('layout') == LAYOUT_COLUMNS
+        if max_points:
+            # Reduced on the server from plain values of the series
+            series = load_series(obj, hours, resolution)
+            points = downsample(series, max_points, self.context.get('method', METHOD_LTTB))
+            return points_to_columns(points) if columns else TelemetryPointSerializer(points, many=True).data
+        if columns:
+            return series_to_columns(load_series(obj, hours, resolution), counts=resolution != RESOLUTION_RAW)
+        if resolution == RESOLUTION_RAW:
+            telemetry = get_raw_history(obj, hours)
+            return TelemetrySerializer(telemetry, many=True).data
+        # Long ranges come from the rollups instead of every stored reading
+        rollups = obj.get_telemetry_rollups(resolution, hours=hours)
+        return TelemetryRollupSerializer(rollups, many=True).data
 
 
 class DashboardLayoutSerializer(serializers.ModelSerializer):
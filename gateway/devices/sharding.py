@@ -0,0 +1,144 @@
+"""
+Partitioning of telemetry ingestion into shards.
+
+Devices are assigned to one of TELEMETRY_SHARDS shards by a stable hash of their
+raw MAC address. A worker only consumes the queues of shards it holds a lease on.
+Leases are short-lived Redis keys renewed by their owner; a lease of a worker
+that disappeared expires after TELEMETRY_SHARD_LEASE_TTL seconds and is taken
+over by another worker.
+
+Every worker also sends a heartbeat to a sorted set of live workers and aims to
+hold ``ceil(shards / live workers)`` leases. Workers release leases above their
+fair share when others join and acquire free ones when others leave.
+"""
+import logging
+import math
+import time
+import zlib
+from typing import List, Optional, Set, cast
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+WORKERS_KEY = 'telemetry:workers'
+
+# Renews the leases KEYS[i] held by ARGV[1] for ARGV[2] milliseconds.
+# Returns the indexes (1-based) of the leases that are no longer held.
+RENEW_SCRIPT = """
+local lost = {}
+for i, key in ipairs(KEYS) do
+    if redis.call('GET', key) == ARGV[1] then
+        redis.call('PEXPIRE', key, ARGV[2])
+    else
+        table.insert(lost, i)
+    end
+end
+return lost
+"""
+
+# Deletes the leases KEYS[i] held by ARGV[1].
+RELEASE_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    if redis.call('GET', key) == ARGV[1] then
+        redis.call('DEL', key)
+    end
+end
+return #KEYS
+"""
+
+
+def shard_for_mac(raw_mac: str, shards: Optional[int] = None) -> int:
+    """Returns the shard of the device with the given raw MAC address."""
+    shards = shards or settings.TELEMETRY_SHARDS
+    return zlib.crc32(raw_mac.encode()) % shards
+
+
+def lease_key(shard: int) -> str:
+    return f'telemetry:shard:{shard}:lease'
+
+
+class ShardCoordinator:
+    """Acquires, renews and releases the shard leases of a single worker."""
+
+    def __init__(self, client: redis.Redis, worker_id: str,
+                 shards: Optional[int] = None, lease_ttl: Optional[int] = None):
+        self.client = client
+        self.worker_id = worker_id
+        self.shards = shards or settings.TELEMETRY_SHARDS
+        self.lease_ttl = lease_ttl or settings.TELEMETRY_SHARD_LEASE_TTL
+        self.owned: Set[int] = set()
+
+    def rebalance(self) -> List[int]:
+        """
+        Renews the held leases and moves towards the fair share of shards.
+        Returns the shards held afterwards.
+        """
+        now = time.time()
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zadd(WORKERS_KEY, {self.worker_id: now})
+        pipe.zremrangebyscore(WORKERS_KEY, '-inf', now - self.lease_ttl)
+        pipe.zcard(WORKERS_KEY)
+        live_workers = max(pipe.execute()[-1], 1)
+        fair_share = math.ceil(self.shards / live_workers)
+
+        self.renew()
+
+        if len(self.owned) > fair_share:
+            extra = sorted(self.owned)[fair_share:]
+            self._release(extra)
+            logger.info(f"Released shards {extra}, {live_workers} workers are live")
+        elif len(self.owned) < fair_share:
+            self._acquire(fair_share - len(self.owned))
+
+        return sorted(self.owned)
+
+    def renew(self) -> Set[int]:
+        """Extends the held leases. Returns the shards whose lease was lost."""
+        if not self.owned:
+            return set()
+
+        shards = sorted(self.owned)
+        script = self.client.register_script(RENEW_SCRIPT)
+        lost_indexes = script(
+            keys=[lease_key(shard) for shard in shards],
+            args=[self.worker_id, self.lease_ttl * 1000]
+        )
+        lost = {shards[index - 1] for index in lost_indexes}
+        if lost:
+            logger.warning(f"Lost leases of shards {sorted(lost)}")
+            self.owned -= lost
+        return lost
+
+    def release_all(self) -> None:
+        """Gives up all leases and leaves the set of live workers."""
+        self._release(sorted(self.owned))
+        self.client.zrem(WORKERS_KEY, self.worker_id)
+
+    def _acquire(self, count: int) -> None:
+        # Start at a worker-specific shard so workers do not race for the same leases
+        start = zlib.crc32(self.worker_id.encode()) % self.shards
+        candidates = [(start + offset) % self.shards for offset in range(self.shards)]
+        candidates = [shard for shard in candidates if shard not in self.owned]
+        holders = cast(list, self.client.mget([lease_key(shard) for shard in candidates]))
+
+        acquired: List[int] = []
+        for shard, holder in zip(candidates, holders):
+            if len(acquired) == count:
+                break
+            if holder is not None:
+                continue
+            if self.client.set(lease_key(shard), self.worker_id, nx=True, px=self.lease_ttl * 1000):
+                acquired.append(shard)
+
+        if acquired:
+            self.owned.update(acquired)
+            logger.info(f"Acquired shards {acquired}")
+
+    def _release(self, shards: List[int]) -> None:
+        if not shards:
+            return
+        script = self.client.register_script(RELEASE_SCRIPT)
+        script(keys=[lease_key(shard) for shard in shards], args=[self.worker_id])
+        self.owned -= set(shards)
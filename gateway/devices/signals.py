@@ -1,8 +1,30 @@
+from django.db import transaction
 from django.dispatch import receiver
-from devices.models import Telemetry
-from django.db.models.signals import post_save
+from devices.models import Device, DeviceSensorLimits, Telemetry
+from devices.registry import invalidate_device_registry
+from devices.response_cache import bump_generations
+from devices.rollups import update_rollups
+from devices.status import mark_devices_seen, update_latest_telemetry
+from django.db.models.signals import post_delete, post_save
 
 
 @receiver(post_save, sender=Telemetry)
-def update_device_status(sender, instance, **kwargs):
-    instance.device.update_active_status()
+def update_device_status(sender, instance, created, **kwargs):
+    if created:
+        mark_devices_seen({instance.device_id: instance.timestamp})
+        update_latest_telemetry([instance])
+        # Ingest adds its batches itself, single readings saved through the API land here
+        update_rollups([instance])
+        transaction.on_commit(lambda: bump_generations([instance.device_id]))
+
+
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+@receiver(post_save, sender=DeviceSensorLimits)
+@receiver(post_delete, sender=DeviceSensorLimits)
+def invalidate_registry(sender, instance, update_fields=None, **kwargs):
+    # Activity status is not part of the registry
+    if update_fields and set(update_fields) <= {'is_active', 'last_seen_at', 'updated_at'}:
+        return
+    # After the commit, so workers do not reload the old state meanwhile
+    transaction.on_commit(invalidate_device_registry)
@@ -0,0 +1,167 @@
+"""
+Device activity status derived from ``Device.last_seen_at``.
+
+Ingest moves ``last_seen_at`` forward for all devices of a batch in one UPDATE
+and sets ``is_active`` from it; devices that go silent are switched to inactive
+by the periodic :func:`deactivate_stale_devices` sweep. The latest reading of
+every device is kept in DeviceLatestTelemetry by :func:`update_latest_telemetry`.
+"""
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable
+
+from django.db import connection, transaction
+from django.db.models import Case, DateTimeField, Q, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.lookups import GreaterThanOrEqual
+from django.utils import timezone
+
+from core.uuids import uuid7
+from devices.models import ACTIVE_WINDOW, Device, DeviceLatestTelemetry
+
+logger = logging.getLogger(__name__)
+
+
+def mark_devices_seen(latest: Dict[Any, datetime]) -> int:
+    """
+    Moves ``last_seen_at`` of the devices to the given timestamps (unless they
+    already hold a later one) and updates ``is_active`` accordingly.
+
+    Args:
+        latest: device pk -> timestamp of its latest reading in the batch
+
+    Returns:
+        int: Number of updated devices
+    """
+    if not latest:
+        return 0
+
+    cutoff = timezone.now() - ACTIVE_WINDOW
+    if connection.vendor == 'postgresql':
+        return _mark_devices_seen_postgresql(latest, cutoff)
+
+    seen_at = Case(
+        *(When(pk=pk, then=Value(timestamp)) for pk, timestamp in latest.items()),
+        output_field=DateTimeField()
+    )
+    last_seen_at = Greatest(Coalesce('last_seen_at', seen_at), seen_at)
+    return Device.objects.filter(pk__in=list(latest)).update(
+        last_seen_at=last_seen_at,
+        is_active=GreaterThanOrEqual(last_seen_at, Value(cutoff))
+    )
+
+
+def _mark_devices_seen_postgresql(latest: Dict[Any, datetime], cutoff: datetime) -> int:
+    quote = connection.ops.quote_name
+    table = quote(Device._meta.db_table)
+    values = ', '.join(['(%s::uuid, %s::timestamptz)'] * len(latest))
+    seen = {str(pk): timestamp for pk, timestamp in latest.items()}
+    # Sorted, and the rows locked in that order before the update (whose join
+    # order is up to the planner), so concurrent batches cannot deadlock
+    pks = sorted(seen)
+    params: list = [pks, cutoff]
+    for pk in pks:
+        params.extend((pk, seen[pk]))
+
+    # GREATEST ignores NULL, so devices seen for the first time take the batch timestamp
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'WITH locked AS ('
+            f'SELECT uuid FROM {table} WHERE uuid = ANY(%s::uuid[]) ORDER BY uuid FOR UPDATE'
+            f') '
+            f'UPDATE {table} AS device '
+            f'SET last_seen_at = GREATEST(device.last_seen_at, seen.seen_at), '
+            f'is_active = GREATEST(device.last_seen_at, seen.seen_at) >= %s '
+            f'FROM locked, (VALUES {values}) AS seen (uuid, seen_at) '
+            f'WHERE device.uuid = seen.uuid AND locked.uuid = seen.uuid',
+            params
+        )
+        return cursor.rowcount
+
+
+def deactivate_stale_devices() -> int:
+    """Marks active devices that have not sent telemetry within ACTIVE_WINDOW as inactive."""
+    cutoff = timezone.now() - ACTIVE_WINDOW
+    # Both conditions are served by the partial index on last_seen_at of active devices
+    return Device.objects.filter(
+        Q(last_seen_at__lt=cutoff) | Q(last_seen_at__isnull=True),
+        is_active=True
+    ).update(is_active=False, updated_at=timezone.now())
+
+
+SNAPSHOT_FIELDS = ('telemetry_uuid', 'temperature', 'humidity', 'pressure', 'soil_moisture', 'timestamp')
+
+
+def update_latest_telemetry(readings: Iterable[Any]) -> int:
+    """
+    Stores the latest of the given readings (Telemetry or TelemetryRow) of every
+    device as its snapshot, unless the snapshot already holds a later reading.
+    Returns the number of devices in the batch.
+    """
+    latest: Dict[Any, Any] = {}
+    for reading in readings:
+        current = latest.get(reading.device_id)
+        if current is None or reading.timestamp > current.timestamp:
+            latest[reading.device_id] = reading
+    if not latest:
+        return 0
+
+    if connection.vendor == 'postgresql':
+        _update_latest_telemetry_postgresql(latest)
+    else:
+        _update_latest_telemetry_orm(latest)
+    return len(latest)
+
+
+def _snapshot_values(reading) -> list:
+    return [reading.uuid, reading.temperature, reading.humidity, reading.pressure,
+            reading.soil_moisture, reading.timestamp]
+
+
+def _update_latest_telemetry_postgresql(latest: Dict[Any, Any]) -> None:
+    quote = connection.ops.quote_name
+    table = quote(DeviceLatestTelemetry._meta.db_table)
+    columns = ['uuid', 'created_at', 'updated_at', 'device_id', *SNAPSHOT_FIELDS]
+    assignments = [f'{quote(field)} = EXCLUDED.{quote(field)}' for field in (*SNAPSHOT_FIELDS, 'updated_at')]
+
+    now = timezone.now()
+    params = []
+    # Sorted so concurrent writers lock the snapshots in the same order
+    for device_id in sorted(latest, key=str):
+        params += [uuid7(), now, now, device_id, *_snapshot_values(latest[device_id])]
+
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} AS latest ({", ".join(quote(column) for column in columns)}) '
+            f'VALUES {", ".join([placeholders] * len(latest))} '
+            f'ON CONFLICT ("device_id") DO UPDATE SET {", ".join(assignments)} '
+            f'WHERE EXCLUDED."timestamp" > latest."timestamp"',
+            params
+        )
+
+
+def _update_latest_telemetry_orm(latest: Dict[Any, Any]) -> None:
+    """Read-compare-write fallback for backends without the upsert above (SQLite in tests)."""
+    now = timezone.now()
+    with transaction.atomic():
+        existing = {
+            snapshot.device_id: snapshot
+            for snapshot in DeviceLatestTelemetry.objects.select_for_update().filter(device_id__in=list(latest))
+        }
+        to_create, to_update = [], []
+        for device_id, reading in latest.items():
+            snapshot = existing.get(device_id)
+            if snapshot is None:
+                snapshot = DeviceLatestTelemetry(device_id=device_id)
+                to_create.append(snapshot)
+            elif reading.timestamp > snapshot.timestamp:
+                to_update.append(snapshot)
+            else:
+                continue
+            for field, value in zip(SNAPSHOT_FIELDS, _snapshot_values(reading)):
+                setattr(snapshot, field, value)
+            snapshot.updated_at = now
+
+        DeviceLatestTelemetry.objects.bulk_create(to_create)
+        DeviceLatestTelemetry.objects.bulk_update(to_update, [*SNAPSHOT_FIELDS, 'updated_at'])
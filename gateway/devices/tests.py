@@ -1,3 +1,691 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import tempfile
+import uuid
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+import redis
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APIClient
+
+from devices import archive, export, partitions, rollups
+from devices.limits import evaluate_sensor_limits, violation_severity
+from devices.management.commands.runingest import Command as RunIngestCommand
+from devices.management.commands.runmqttbridge import Command as RunMqttBridgeCommand
+from devices.models import Device, DeviceSensorLimits, Telemetry, TelemetryArchive, TelemetryRollup
+from devices.mqtt import MqttTelemetrySource
+from devices.parsers import NDJSONParser
+from devices.queues import (
+    STREAM_GROUP, ListTelemetryQueue, StreamTelemetryQueue, TelemetryBatch, enqueue_telemetry, stream_key
+)
+from devices.registry import DeviceRecord, SensorLimits, get_device_registry
+from devices.sharding import ShardCoordinator, lease_key
+from devices.writers import TelemetryRow
+from notifications.models import UserNotification
+from notifications.serializers import UserNotificationSerializer
+
+
+class RunIngestFlushTests(SimpleTestCase):
+    def setUp(self):
+        self.queue = ListTelemetryQueue(mock.Mock(), max_keys=10, limit=100, shards=[0])
+        self.batch = TelemetryBatch([('aabbccddee01', b'{}')] * 3, {'aabbccddee01': 3})
+        self.queue._in_flight = {'aabbccddee01': 3}
+        self.coordinator = mock.Mock()
+        self.coordinator.renew.side_effect = redis.ConnectionError("Connection refused")
+
+    @mock.patch('devices.queues.trim_queues')
+    @mock.patch('devices.management.commands.runingest.ingest_telemetry')
+    def test_failed_lease_renewal_releases_batches(self, ingest_telemetry, trim_queues):
+        self.assertFalse(RunIngestCommand().flush(self.queue, self.coordinator, [self.batch]))
+
+        self.assertEqual(self.queue._in_flight, {})
+        trim_queues.assert_called_once_with(self.queue.client, {'aabbccddee01': 0})
+
+    @mock.patch('devices.queues.trim_queues', side_effect=redis.ConnectionError("Connection refused"))
+    @mock.patch('devices.management.commands.runingest.ingest_telemetry')
+    def test_failed_release_still_forgets_batches(self, ingest_telemetry, trim_queues):
+        self.assertFalse(RunIngestCommand().flush(self.queue, self.coordinator, [self.batch]))
+
+        # Later reads must not skip the records of the batch
+        self.assertEqual(self.queue._in_flight, {})
+
+
+class FakeMqttClient:
+    """Stand-in for the paho client that records the acknowledgements."""
+
+    def __init__(self):
+        self.acks = []
+
+    def ack(self, mid, qos):
+        self.acks.append(mid)
+
+
+class NDJSONParserTests(SimpleTestCase):
+    def parse(self, data):
+        return NDJSONParser().parse(io.BytesIO(data))
+
+    def test_one_item_per_line(self):
+        data = b'{"a": 1}\n\n  \n[1, 2]\r\n"text"\n'
+        self.assertEqual(self.parse(data), [{'a': 1}, [1, 2], 'text'])
+
+    def test_bad_line_is_reported_with_its_number(self):
+        with self.assertRaisesMessage(ParseError, 'NDJSON parse error on line 3'):
+            self.parse(b'{"a": 1}\n\n{"a": \n{"a": 2}\n')
+
+    def test_invalid_encoding_is_a_parse_error(self):
+        with self.assertRaises(ParseError):
+            self.parse(b'{"a": "\xff"}\n')
+
+
+class ShardCoordinatorTests(SimpleTestCase):
+    def setUp(self):
+        self.client = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+
+    def coordinator(self, worker_id):
+        return ShardCoordinator(self.client, worker_id, shards=4, lease_ttl=30)
+
+    def test_shards_are_rebalanced_when_workers_join(self):
+        first = self.coordinator('worker-1')
+        self.assertEqual(first.rebalance(), [0, 1, 2, 3])
+
+        second = self.coordinator('worker-2')
+        # All leases are taken until the first worker gives up its extra shards
+        self.assertEqual(second.rebalance(), [])
+        self.assertEqual(len(first.rebalance()), 2)
+        self.assertEqual(len(second.rebalance()), 2)
+        self.assertFalse(set(first.owned) & set(second.owned))
+
+        second.release_all()
+        self.assertEqual(first.rebalance(), [0, 1, 2, 3])
+
+    def test_lease_taken_over_is_lost_on_renew(self):
+        worker = self.coordinator('worker-1')
+        worker.rebalance()
+        # The lease expired and another worker acquired it meanwhile
+        self.client.set(lease_key(2), 'worker-2')
+
+        self.assertEqual(worker.renew(), {2})
+        self.assertEqual(worker.owned, {0, 1, 3})
+        self.assertEqual(self.client.get(lease_key(2)), b'worker-2')
+        self.assertGreater(self.client.pttl(lease_key(0)), 0)
+
+
+@override_settings(TELEMETRY_QUEUE_BACKEND='list', TELEMETRY_SHARDS=1,
+                   TELEMETRY_UNKNOWN_DEVICE_MAX_RECORDS=3, TELEMETRY_UNKNOWN_DEVICE_TTL=3600)
+class ListTelemetryQueueTests(SimpleTestCase):
+    def setUp(self):
+        self.client = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+        self.queue = ListTelemetryQueue(self.client, max_keys=10, limit=2, shards=[0])
+        # Not under test, it reads the devices from the database
+        patcher = mock.patch.object(ListTelemetryQueue, 'reconcile')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def enqueue(self, *payloads):
+        for payload in payloads:
+            enqueue_telemetry(self.client, 'aabbccddee01', payload)
+
+    def test_queue_of_unknown_device_is_capped_and_expires(self):
+        self.enqueue(*(f'{{"a": {number}}}' for number in range(5)))
+        self.queue.ack(self.queue.fetch(), retain={'aabbccddee01'})
+
+        self.assertEqual(self.client.lrange('aabbccddee01', 0, -1), [b'{"a": 2}', b'{"a": 3}', b'{"a": 4}'])
+        self.assertGreater(self.client.ttl('aabbccddee01'), 0)
+        # Left out of the pending set until the device is registered
+        self.assertEqual(self.queue.fetch().messages, [])
+
+    def test_queue_of_registered_device_no_longer_expires(self):
+        self.enqueue('{"a": 1}')
+        self.queue.ack(self.queue.fetch(), retain={'aabbccddee01'})
+
+        # Registered meanwhile, new readings mark the queue as pending again
+        self.enqueue('{"a": 2}', '{"a": 3}')
+        batch = self.queue.fetch()
+        self.assertEqual(len(batch.messages), 2)
+        self.queue.ack(batch)
+
+        self.assertEqual(self.client.lrange('aabbccddee01', 0, -1), [b'{"a": 3}'])
+        self.assertEqual(self.client.ttl('aabbccddee01'), -1)
+
+
+class StreamTelemetryQueueTests(SimpleTestCase):
+    def setUp(self):
+        self.client = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+        self.stream = stream_key(0)
+
+    def queue(self, consumer, min_idle_time=60000):
+        return StreamTelemetryQueue(self.client, consumer, count=10, min_idle_time=min_idle_time, shards=[0])
+
+    def add(self, *payloads):
+        for payload in payloads:
+            self.client.xadd(self.stream, {'mac': 'aabbccddee01', 'data': payload})
+
+    def test_ack_removes_the_entries(self):
+        queue = self.queue('worker-1')
+        self.add(b'{"a": 1}', b'{"a": 2}')
+        self.client.xadd(self.stream, {'data': b'{}'})
+
+        batch = queue.fetch()
+        # The entry without a MAC address is not ingested but acknowledged with the batch
+        self.assertEqual(batch.messages, [('aabbccddee01', b'{"a": 1}'), ('aabbccddee01', b'{"a": 2}')])
+        self.assertEqual(self.client.xpending(self.stream, STREAM_GROUP)['pending'], 3)
+
+        queue.ack(batch)
+        self.assertEqual(self.client.xpending(self.stream, STREAM_GROUP)['pending'], 0)
+        self.assertEqual(self.client.xlen(self.stream), 0)
+        self.assertEqual(queue.fetch().messages, [])
+
+    def test_entries_of_a_crashed_consumer_are_reclaimed(self):
+        self.add(b'{"a": 1}')
+        crashed = self.queue('worker-1')
+        crashed.release(crashed.fetch())
+
+        # Still within min_idle_time of the other worker
+        self.assertEqual(self.queue('worker-2').fetch().messages, [])
+
+        worker = self.queue('worker-3', min_idle_time=0)
+        batch = worker.fetch()
+        self.assertEqual(batch.messages, [('aabbccddee01', b'{"a": 1}')])
+        pending = self.client.xpending_range(self.stream, STREAM_GROUP, min='-', max='+', count=10)
+        self.assertEqual([entry['consumer'] for entry in pending], [b'worker-3'])
+
+        worker.ack(batch)
+        self.assertEqual(self.client.xlen(self.stream), 0)
+
+
+@mock.patch('devices.management.commands.runmqttbridge.close_old_connections')
+class MqttBridgeTests(SimpleTestCase):
+    def setUp(self):
+        self.client = FakeMqttClient()
+        self.source = MqttTelemetrySource(self.client, topic='devices/+/telemetry')
+        self.command = RunMqttBridgeCommand()
+        self.command.stopping = False
+
+    def receive(self, *mids):
+        for mid in mids:
+            message = SimpleNamespace(topic='devices/aa:bb:cc:dd:ee:01/telemetry', payload=b'{}', mid=mid, qos=1)
+            self.client.on_message(self.client, None, message)
+
+    def test_messages_are_acked_after_ingest(self, close_old_connections):
+        self.receive(1, 2)
+        messages = [self.source.get(0), self.source.get(0)]
+
+        def ingest(batch):
+            # Still inside ingest, before its transaction returns
+            self.assertEqual(self.client.acks, [])
+            self.assertEqual(batch, [('aabbccddee01', b'{}')] * 2)
+            return mock.Mock(message='Stored')
+
+        with mock.patch('devices.management.commands.runmqttbridge.ingest_telemetry', side_effect=ingest):
+            self.assertTrue(self.command.flush(self.source, messages))
+        self.assertEqual(self.client.acks, [1, 2])
+
+    @mock.patch('devices.management.commands.runmqttbridge.ingest_telemetry', side_effect=Exception("Deadlock"))
+    def test_failed_ingest_acks_nothing(self, ingest_telemetry, close_old_connections):
+        self.receive(1)
+        self.assertFalse(self.command.flush(self.source, [self.source.get(0)]))
+        self.assertEqual(self.client.acks, [])
+
+    def test_unexpected_topic_is_acked_right_away(self, close_old_connections):
+        message = SimpleNamespace(topic='sensors/aabbccddee01', payload=b'{}', mid=7, qos=1)
+        self.client.on_message(self.client, None, message)
+        self.assertIsNone(self.source.get(0))
+        self.assertEqual(self.client.acks, [7])
+
+    def consume(self, batch_size, max_age):
+        flushed = []
+
+        def flush(source, messages):
+            flushed.append([message.mid for message in messages])
+            self.command.stopping = True
+            return True
+
+        with mock.patch.object(self.command, 'flush', side_effect=flush):
+            self.command.consume(self.source, batch_size, max_age)
+        return flushed
+
+    def test_batch_is_flushed_at_batch_size(self, close_old_connections):
+        self.receive(1, 2, 3)
+        self.assertEqual(self.consume(batch_size=2, max_age=60), [[1, 2]])
+
+    def test_batch_is_flushed_at_max_age(self, close_old_connections):
+        self.receive(1)
+        self.assertEqual(self.consume(batch_size=10, max_age=0.05), [[1]])
+
+
+class SingleReadingRollupTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='owner@example.com', password='secret')
+        self.device = Device.objects.create(name='Monstera', mac_address='AA:BB:CC:DD:EE:01', user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_reading_created_through_api_is_in_rollup_history(self):
+        timestamp = timezone.now() - timedelta(hours=2)
+        response = self.client.post('/api/v1/telemetry/', {
+            'device': str(self.device.pk),
+            'temperature': 21.5,
+            'humidity': 55.0,
+            'pressure': 1013.0,
+            'soil_moisture': 450,
+            'timestamp': timestamp.isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        # Longer than TELEMETRY_HISTORY_RAW_HOURS, so served from the hourly rollups
+        response = self.client.get(f'/api/v1/devices/{self.device.pk}/history/', {'hours': 48})
+        self.assertEqual(response.data['telemetry_resolution'], TelemetryRollup.RESOLUTION_HOUR)
+        history = response.data['telemetry_history']
+        self.assertEqual(len(history), 1)
+        self.assertEqual(history[0]['count'], 1)
+        self.assertEqual(history[0]['temperature'], 21.5)
+
+
+class RollupLockTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='owner@example.com', password='secret')
+        self.device = Device.objects.create(name='Monstera', mac_address='AA:BB:CC:DD:EE:01', user=self.user)
+        self.timestamp = timezone.now().replace(minute=10, second=0, microsecond=0) - timedelta(hours=1)
+
+    def reading(self, minutes):
+        return Telemetry.objects.create(
+            device=self.device, temperature=21.5, humidity=55.0, pressure=1013.0, soil_moisture=450,
+            timestamp=self.timestamp + timedelta(minutes=minutes)
+        )
+
+    @mock.patch('devices.management.commands.backfillrollups.bump_generations')
+    def test_backfill_reads_the_readings_under_the_lock(self, bump_generations):
+        self.reading(0)
+
+        # Ingest of the device was committed just before the lock was granted
+        def lock_rollups(device_ids, exclusive=False):
+            self.assertEqual((device_ids, exclusive), ([self.device.pk], True))
+            self.reading(1)
+
+        with mock.patch('devices.management.commands.backfillrollups.lock_rollups', side_effect=lock_rollups):
+            call_command('backfillrollups', stdout=io.StringIO())
+
+        rollup = TelemetryRollup.objects.get(device=self.device, resolution=TelemetryRollup.RESOLUTION_HOUR)
+        self.assertEqual(rollup.count, 2)
+
+    @mock.patch('devices.rollups.connection')
+    def test_ingest_takes_the_shared_lock(self, connection):
+        connection.vendor = 'postgresql'
+        cursor = connection.cursor.return_value.__enter__.return_value
+        device_ids = [uuid.UUID(int=2), uuid.UUID(int=1), uuid.UUID(int=2)]
+        rollups.lock_rollups(device_ids)
+
+        sql, (namespace, keys) = cursor.execute.call_args.args
+        self.assertIn('pg_advisory_xact_lock_shared', sql)
+        self.assertEqual(namespace, rollups.ROLLUP_LOCK_NAMESPACE)
+        self.assertEqual(keys, sorted({rollups._lock_key(device_id) for device_id in device_ids}))
+        self.assertEqual(len(keys), 2)
+        self.assertTrue(all(-2 ** 31 <= key < 2 ** 31 for key in keys))
+
+
+class TelemetryPaginationTests(TestCase):
+    url = '/api/v1/telemetry/'
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='owner@example.com', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        now = timezone.now()
+        # Two devices reporting at the same times, so the uuid has to break the ties
+        for number in (1, 2):
+            device = Device.objects.create(
+                name=f'Plant {number}', mac_address=f'AA:BB:CC:DD:EE:0{number}', user=self.user
+            )
+            for minutes in range(3):
+                Telemetry.objects.create(
+                    device=device, temperature=21.5, humidity=55.0, pressure=1013.0, soil_moisture=450,
+                    timestamp=now - timedelta(minutes=minutes)
+                )
+        self.expected = [
+            str(pk) for pk in Telemetry.objects.order_by('-timestamp', '-uuid').values_list('uuid', flat=True)
+        ]
+
+    def uuids(self, response):
+        return [row['uuid'] for row in response.data['results']]
+
+    def test_cursor_round_trip(self):
+        pages = []
+        response = self.client.get(self.url, {'page_size': 4})
+        pages.append(self.uuids(response))
+        self.assertIsNone(response.data['previous'])
+        response = self.client.get(response.data['next'])
+        pages.append(self.uuids(response))
+        self.assertIsNone(response.data['next'])
+
+        self.assertEqual(pages, [self.expected[:4], self.expected[4:]])
+        # Back from the last page to the first one
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(self.uuids(response), self.expected[:4])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_invalid_cursor_is_not_found(self):
+        self.assertEqual(self.client.get(self.url, {'cursor': 'not-a-cursor'}).status_code, 404)
+
+    @override_settings(API_MAX_PAGE_SIZE=3)
+    def test_page_size_is_capped(self):
+        self.assertEqual(len(self.uuids(self.client.get(self.url, {'page_size': 100}))), 3)
+        self.assertEqual(len(self.uuids(self.client.get(self.url, {'page_size': 0}))), 1)
+        self.assertEqual(len(self.uuids(self.client.get(self.url, {'page_size': 'all'}))), 3)
+
+
+class ArchiveMonthTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='owner@example.com', password='secret')
+        self.device = Device.objects.create(name='Monstera', mac_address='AA:BB:CC:DD:EE:01', user=self.user)
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archive_dir.cleanup)
+
+    def reading(self, timestamp):
+        return Telemetry.objects.create(
+            device=self.device, temperature=21.5, humidity=55.0, pressure=1013.0, soil_moisture=450,
+            timestamp=timestamp
+        )
+
+    def test_reading_arriving_during_export_is_kept(self):
+        month = date(2024, 1, 1)
+        archived = self.reading(datetime(2024, 1, 10, tzinfo=dt_timezone.utc))
+        delete_telemetry = archive.delete_telemetry
+        late = []
+
+        # Arrives after the rows of the device were read, before they are deleted
+        def delete_after_late_reading(uuids):
+            late.append(self.reading(datetime(2024, 1, 20, tzinfo=dt_timezone.utc)))
+            return delete_telemetry(uuids)
+
+        with override_settings(TELEMETRY_ARCHIVE_DIR=self.archive_dir.name), \
+                mock.patch('devices.archive.delete_telemetry', side_effect=delete_after_late_reading):
+            manifests = archive.archive_month(month, chunk_size=100)
+
+        self.assertEqual([manifest.row_count for manifest in manifests], [1])
+        self.assertEqual(TelemetryArchive.objects.get().first_timestamp, archived.timestamp)
+        self.assertEqual(list(Telemetry.objects.values_list('pk', flat=True)), [late[0].pk])
+
+    def test_notifications_of_archived_readings_are_kept(self):
+        reading = self.reading(datetime(2024, 1, 10, tzinfo=dt_timezone.utc))
+        notification = UserNotification.objects.create(
+            user=self.user, device=self.device, telemetry=reading, message="Too cold", severity='warning'
+        )
+        with override_settings(TELEMETRY_ARCHIVE_DIR=self.archive_dir.name):
+            archive.archive_month(date(2024, 1, 1), chunk_size=100)
+
+        notification.refresh_from_db()
+        self.assertIsNone(notification.telemetry_id)
+        self.assertIsNone(UserNotificationSerializer(notification).data['telemetry_data'])
+
+    def test_backfill_keeps_rollups_of_archived_months(self):
+        with override_settings(TELEMETRY_ARCHIVE_DIR=self.archive_dir.name):
+            self.reading(datetime(2024, 1, 10, tzinfo=dt_timezone.utc))
+            archive.archive_month(date(2024, 1, 1), chunk_size=100)
+        self.reading(datetime(2024, 2, 10, tzinfo=dt_timezone.utc))
+
+        call_command('backfillrollups', stdout=mock.Mock())
+
+        days = TelemetryRollup.objects.filter(resolution=TelemetryRollup.RESOLUTION_DAY)
+        self.assertEqual(
+            [bucket.date() for bucket in days.order_by('bucket').values_list('bucket', flat=True)],
+            [date(2024, 1, 10), date(2024, 2, 10)]
+        )
+
+
+class SensorLimitsTests(SimpleTestCase):
+    LIMITS = SensorLimits(15.0, 30.0, 40.0, 70.0, 990.0, 1030.0, 300, 700)
+    # (temperature, humidity, pressure, soil_moisture): in range, every bound, on the bounds, all violated
+    VALUES = [
+        (20.0, 55.0, 1013.0, 450),
+        (14.5, 55.0, 1013.0, 450),
+        (30.5, 55.0, 1013.0, 450),
+        (20.0, 39.0, 1013.0, 450),
+        (20.0, 71.0, 1013.0, 450),
+        (20.0, 55.0, 989.5, 450),
+        (20.0, 55.0, 1030.5, 450),
+        (20.0, 55.0, 1013.0, 299),
+        (20.0, 55.0, 1013.0, 701),
+        (15.0, 70.0, 990.0, 700),
+        (40.0, 10.0, 1100.0, 1000),
+    ]
+
+    def rows(self, record):
+        timestamp = timezone.now()
+        return [TelemetryRow(uuid.uuid4(), record, *values, timestamp) for values in self.VALUES]
+
+    def test_matches_check_limits(self):
+        limits = DeviceSensorLimits(**self.LIMITS._asdict())
+        record = DeviceRecord(uuid.uuid4(), uuid.uuid4(), 'aabbccddee01', self.LIMITS)
+        device = Device(name='Monstera', mac_address='AA:BB:CC:DD:EE:01')
+        limits.device = device
+        readings = self.rows(record) + [
+            Telemetry(device=device, temperature=t, humidity=h, pressure=p, soil_moisture=s, timestamp=timezone.now())
+            for t, h, p, s in self.VALUES
+        ]
+
+        results = evaluate_sensor_limits(readings)
+
+        for index, reading in enumerate(readings):
+            expected = limits.check_limits(reading)
+            with self.subTest(index=index):
+                if expected:
+                    self.assertEqual(results[index], (expected, violation_severity(len(expected))))
+                else:
+                    self.assertNotIn(index, results)
+        self.assertEqual(results[len(self.VALUES) - 1][1], 'critical')
+        # Integer soil moisture is rendered as in check_limits, not as a float
+        self.assertEqual(results[7][0], ["Soil moisture 299 is below minimum 300"])
+
+    def test_device_without_limits_is_never_violated(self):
+        record = DeviceRecord(uuid.uuid4(), uuid.uuid4(), 'aabbccddee01', None)
+        self.assertEqual(evaluate_sensor_limits(self.rows(record)), {})
+
+
+class RemovePartitionTests(SimpleTestCase):
+    @mock.patch('devices.partitions.connection')
+    def test_notifications_of_dropped_partition_are_kept(self, connection):
+        connection.ops.quote_name = lambda name: f'"{name}"'
+        cursor = connection.cursor.return_value.__enter__.return_value
+        with mock.patch('devices.partitions.transaction'):
+            partitions.remove_partition(date(2024, 1, 1))
+
+        statements = [call.args[0] for call in cursor.execute.call_args_list]
+        self.assertEqual(statements, [
+            'UPDATE "notifications_usernotification" SET telemetry_id = NULL '
+            'WHERE telemetry_id IN (SELECT uuid FROM "devices_telemetry_p2024_01")',
+            'ALTER TABLE "devices_telemetry" DETACH PARTITION "devices_telemetry_p2024_01"',
+            'DROP TABLE "devices_telemetry_p2024_01"',
+        ])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='owner@example.com', password='secret')
+        self.device = Device.objects.create(name='Monstera', mac_address='AA:BB:CC:DD:EE:01', user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/v1/devices/{self.device.pk}/export/'
+
+    def test_naive_timestamp_skipped_by_dst_is_rejected(self):
+        response = self.client.get(self.url, {'since': '2024-03-31T02:30:00'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('since', response.json())
+
+    def test_gzip_export_is_a_gzip_file(self):
+        Telemetry.objects.create(
+            device=self.device, temperature=21.5, humidity=55.0, pressure=1013.0, soil_moisture=450,
+            timestamp=datetime(2024, 1, 10, tzinfo=dt_timezone.utc)
+        )
+        response = self.client.get(self.url, {'file_format': 'ndjson', 'compress': 'gzip'})
+
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('-telemetry.ndjson.gz"', response['Content-Disposition'])
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(json.loads(lines[0])['temperature'], 21.5)
+
+    def test_ndjson_writes_nan_as_null(self):
+        row = (datetime(2024, 1, 10, tzinfo=dt_timezone.utc), float('nan'), 55.0, float('inf'), 450)
+        # Strict parsing, NaN and Infinity are not valid JSON
+        reading = json.loads(''.join(export.encode_ndjson([row])), parse_constant=self.fail)
+        self.assertEqual(
+            reading,
+            {'timestamp': '2024-01-10T00:00:00+00:00', 'temperature': None, 'humidity': 55.0,
+             'pressure': None, 'soil_moisture': 450}
+        )
+
+
+class ConditionalHistoryTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='owner@example.com', password='secret')
+        self.device = Device.objects.create(name='Monstera', mac_address='AA:BB:CC:DD:EE:01', user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/v1/devices/{self.device.pk}/history/'
+
+    @mock.patch('devices.views.get_generation')
+    def test_committed_readings_change_the_etag(self, get_generation):
+        get_generation.return_value = 1
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # A late reading leaves the device row and its latest reading alone
+        get_generation.return_value = 2
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    @mock.patch('devices.views.get_generation', return_value=1)
+    def test_sliding_window_changes_the_etag(self, get_generation):
+        now = datetime(2024, 5, 1, 12, 5, tzinfo=dt_timezone.utc)
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            etag = self.client.get(self.url, {'hours': 48})['ETag']
+
+        # Hourly buckets, the window start stays in the same bucket
+        with mock.patch('django.utils.timezone.now', return_value=now + timedelta(minutes=50)):
+            response = self.client.get(self.url, {'hours': 48}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Until its bucket leaves the window, even without new readings
+        with mock.patch('django.utils.timezone.now', return_value=now + timedelta(minutes=60)):
+            response = self.client.get(self.url, {'hours': 48}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    @mock.patch('devices.views.get_generation', side_effect=redis.ConnectionError("Connection refused"))
+    def test_no_validators_without_redis(self, get_generation):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_invalid_hours_are_rejected(self):
+        for hours in ('abc', '0', '-5', '1.5', str(10 ** 12)):
+            with self.subTest(hours=hours):
+                response = self.client.get(self.url, {'hours': hours})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('hours', response.data)
+
+    def test_device_save_moves_updated_at(self):
+        updated_at = self.device.updated_at
+        self.device.name = 'Ficus'
+        self.device.save(update_fields=['name'])
+        self.device.refresh_from_db()
+        self.assertGreater(self.device.updated_at, updated_at)
+
+
+class TelemetryBatchTests(TestCase):
+    url = '/api/v1/telemetry/batch/'
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='owner@example.com', password='secret')
+        self.device = Device.objects.create(name='Monstera', mac_address='AA:BB:CC:DD:EE:01', user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Records cached by an earlier test may point at devices of its rolled back transaction
+        get_device_registry().clear()
+
+    def reading(self, minutes_ago=0, **fields):
+        return {
+            'device': str(self.device.pk),
+            'temperature': 21.5,
+            'humidity': 55.0,
+            'pressure': 1013.0,
+            'soil_moisture': 450,
+            'timestamp': (timezone.now() - timedelta(minutes=minutes_ago)).isoformat(),
+            **fields,
+        }
+
+    def test_bad_values_only_reject_their_item(self):
+        response = self.client.post(self.url, [
+            self.reading(1),
+            self.reading(2, temperature='nan'),
+            self.reading(3, pressure='inf'),
+            self.reading(4, soil_moisture=2 ** 31),
+            self.reading(5, soil_moisture='inf'),
+        ], format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'], 4)
+        self.assertEqual([item['status'] for item in response.data['results']], ['created'] + ['invalid'] * 4)
+        self.assertEqual(Telemetry.objects.filter(device=self.device).count(), 1)
+
+    def test_devices_are_looked_up_by_uuid_and_mac_address(self):
+        by_mac = self.reading(2)
+        del by_mac['device']
+        by_mac['mac_address'] = 'aa:bb:cc:dd:ee:01'
+        response = self.client.post(self.url, [self.reading(1), by_mac], format='json')
+
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([item['status'] for item in response.data['results']], ['created', 'created'])
+        self.assertEqual(Telemetry.objects.filter(device=self.device).count(), 2)
+
+    def test_devices_of_other_users_are_unknown(self):
+        other = get_user_model().objects.create_user(email='other@example.com', password='secret')
+        device = Device.objects.create(name='Ficus', mac_address='AA:BB:CC:DD:EE:02', user=other)
+        response = self.client.post(self.url, [
+            self.reading(1, device=str(device.pk)),
+            {**self.reading(2, device=None), 'mac_address': device.mac_address},
+        ], format='json')
+
+        self.assertEqual(response.data['errors'], 2)
+        self.assertEqual([item['status'] for item in response.data['results']], ['unknown_device'] * 2)
+        self.assertFalse(Telemetry.objects.filter(device=device).exists())
+
+    def test_duplicate_timestamps_are_reported(self):
+        stored = self.reading(5)
+        self.client.post(self.url, [stored], format='json')
+
+        repeated = self.reading(1)
+        response = self.client.post(self.url, [stored, repeated, repeated], format='json')
+
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['duplicates'], 2)
+        self.assertEqual([item['status'] for item in response.data['results']], ['duplicate', 'created', 'duplicate'])
+        self.assertEqual(Telemetry.objects.filter(device=self.device).count(), 2)
+
+    def test_ndjson_body(self):
+        body = '\n'.join(json.dumps(self.reading(minutes)) for minutes in range(2))
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.data['created'], 2)
+
+        response = self.client.post(self.url, f'{body}\nnot json\n', content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('line 3', response.data['detail'])
+
+    @override_settings(TELEMETRY_BATCH_MAX_ITEMS=2)
+    def test_oversized_batch_is_rejected(self):
+        response = self.client.post(self.url, [self.reading(minutes) for minutes in range(3)], format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Telemetry.objects.exists())
@@ -0,0 +1,62 @@
+"""
+Versions of device data for conditional GETs (see core.conditional).
+
+A version is a tuple of values that changes whenever the response built from the
+data would, plus the time of the latest change for Last-Modified. They come from
+columns of already fetched rows, one aggregate query or the telemetry generation
+of the response cache, never from the readings themselves.
+"""
+from datetime import datetime
+from typing import Optional, Tuple
+
+from django.db.models import Count, Max, Q
+
+from devices.models import DashboardLayout, Device
+
+Version = Tuple[tuple, Optional[datetime]]
+
+
+def _latest(*timestamps: Optional[datetime]) -> Optional[datetime]:
+    return max((timestamp for timestamp in timestamps if timestamp is not None), default=None)
+
+
+def devices_version(user) -> Version:
+    """
+    Version of the device list of the user: device changes, their activity and
+    their latest readings. One aggregate query. Last-Modified only comes from
+    server-side updated_at, last_seen_at is the device's clock.
+    """
+    version = Device.objects.filter(user=user).aggregate(
+        count=Count('pk'),
+        active=Count('pk', filter=Q(is_active=True)),
+        updated_at=Max('updated_at'),
+        last_seen_at=Max('last_seen_at'),
+        reading_updated_at=Max('latest_reading__updated_at'),
+    )
+    last_modified = _latest(version['updated_at'], version['reading_updated_at'])
+    return tuple(version.values()), last_modified
+
+
+def device_version(device: Device, generation: int, window_start: Optional[datetime] = None) -> Version:
+    """
+    Version of the device and its telemetry history, from the device row, its
+    latest reading snapshot (select_related by DeviceViewSet, no extra query) and
+    the telemetry generation of the response cache, which every commit of
+    readings moves forward, late ones and rollup rebuilds included. History
+    windows are relative to now: ``window_start`` (see devices.history.window_start)
+    changes the version when readings or buckets may have left the window, also
+    of a device that stopped reporting.
+
+    No row timestamp moves with late readings, so there is no Last-Modified.
+    """
+    reading = getattr(device, 'latest_reading', None)
+    reading_version = (reading.timestamp, reading.updated_at) if reading is not None else (None, None)
+    version = (
+        device.pk, device.updated_at, device.last_seen_at, device.is_active, *reading_version, generation, window_start
+    )
+    return version, None
+
+
+def layout_version(layout: DashboardLayout) -> Version:
+    """Version of a dashboard layout."""
+    return (layout.pk, layout.updated_at), layout.updated_at
@@ -1,12 +1,53 @@
 from rest_framework import viewsets, mixins
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from datetime import timedelta
+from typing import Optional
+import functools
 
+import redis
+
+from core.conditional import conditional_response
+from core.pagination import KeysetPagination
+from core.parsers import FastJSONParser
+from devices.columnar import LAYOUT_COLUMNS, LAYOUT_ROWS, LAYOUTS, TELEMETRY_COLUMNS, rows_to_columns
+from devices.downsampling import DOWNSAMPLING_METHODS, METHOD_LTTB, MIN_POINTS
+from devices.export import EXPORT_FORMATS, export_telemetry
+from devices.history import HISTORY_RESOLUTIONS, RESOLUTION_AUTO, choose_resolution, window_start
+from devices.ingest import TIMESTAMP_ERRORS, ingest_telemetry, parse_timestamp
 from devices.models import Device, Telemetry, DashboardLayout
+from devices.parsers import NDJSONParser
+from devices.response_cache import get_generation, get_or_build
 from devices.serializers import DeviceSerializer, TelemetrySerializer, DeviceDetailSerializer, DashboardLayoutSerializer
+from devices.versions import device_version, devices_version, layout_version
+
+
+def get_layout(request) -> str:
+    """Returns the ``layout`` query param: rows (default) or columns."""
+    layout = request.query_params.get('layout', LAYOUT_ROWS)
+    if layout not in LAYOUTS:
+        raise ValidationError({'layout': f"Must be one of: {', '.join(LAYOUTS)}"})
+    return layout
+
+
+# Longest time range of a request, well within what timedelta and datetime can represent
+MAX_HOURS = 24 * 366 * 100
+
+
+def get_hours(request, default: Optional[int] = None) -> Optional[int]:
+    """Returns the ``hours`` query param, a positive integer, or ``default`` without it."""
+    hours = request.query_params.get('hours')
+    if not hours:
+        return default
+    if not hours.isdigit() or not 1 <= int(hours) <= MAX_HOURS:
+        raise ValidationError({'hours': f"Must be an integer between 1 and {MAX_HOURS}"})
+    return int(hours)
 
 
 class DeviceViewSet(viewsets.ModelViewSet):
@@ -31,13 +72,20 @@ class DeviceViewSet(viewsets.ModelViewSet):
     queryset = Device.objects.all()
 
     def get_queryset(self):
-        return self.queryset.filter(user=self.request.user)
+        # The latest reading is joined in, not queried per device
+        return self.queryset.filter(user=self.request.user).select_related('latest_reading')
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return DeviceDetailSerializer
         return DeviceSerializer
 
+    def list(self, request, *args, **kwargs):
+        # Polled by the apps, unchanged lists are answered with 304 before any serialization
+        version, last_modified = devices_version(request.user)
+        build = functools.partial(super().list, request, *args, **kwargs)
+        return conditional_response(request, version, last_modified, build)
+
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
         instance = self.get_object()
@@ -58,22 +106,101 @@ class DeviceViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'])
     def history(self, request, pk=None):
-        """Get device telemetry history with optional time range."""
+        """
+        Get device telemetry history with optional time range.
+
+        ``resolution`` is one of raw, minute, hour, day or auto (default), which
+        serves long ranges from the rollups. ``max_points`` reduces the history on
+        the server with ``method`` lttb (default), minmax or avg. ``layout=columns``
+        returns the history as one list per field.
+
+        Carries an ETag; conditional requests get 304 until the device changes,
+        readings of it are committed or the start of the range moves to the next
+        bucket. Without Redis there is no ETag.
+        """
+        device = self.get_object()
+        hours = get_hours(request, 24)
+        resolution = request.query_params.get('resolution', RESOLUTION_AUTO)
+        if resolution not in HISTORY_RESOLUTIONS:
+            raise ValidationError({'resolution': f"Must be one of: {', '.join(HISTORY_RESOLUTIONS)}"})
+
+        method = request.query_params.get('method')
+        if method is not None and method not in DOWNSAMPLING_METHODS:
+            raise ValidationError({'method': f"Must be one of: {', '.join(DOWNSAMPLING_METHODS)}"})
+        max_points = request.query_params.get('max_points')
+        if max_points is not None:
+            if not max_points.isdigit() or int(max_points) < MIN_POINTS:
+                raise ValidationError({'max_points': f"Must be an integer of at least {MIN_POINTS}"})
+            max_points = int(max_points)
+        elif method is not None:
+            max_points = settings.TELEMETRY_HISTORY_MAX_POINTS
+
+        context = {
+            'hours': hours,
+            'resolution': resolution,
+            'max_points': max_points,
+            'method': method or METHOD_LTTB,
+            'layout': get_layout(request)
+        }
+        serializer = DeviceDetailSerializer(device, context=context)
+        # Moves with the bucket boundaries, so a window sliding past old data is not served from before
+        start = window_start(hours, choose_resolution(hours, resolution))
+
+        def build():
+            # Shared by everyone polling the device until new readings arrive or the window moves
+            params = {**context, 'window_start': start}
+            return Response(get_or_build(device, 'history', params, lambda: serializer.data))
+
+        try:
+            generation = get_generation(device.pk)
+        except redis.RedisError:
+            # The validators could not notice late readings
+            return build()
+        version, last_modified = device_version(device, generation, start)
+        return conditional_response(request, version, last_modified, build)
+
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        """
+        Stream raw device telemetry as CSV or NDJSON, oldest first.
+
+        Query params: ``file_format`` (csv or ndjson, default csv), optional ``since``
+        and ``until`` ISO timestamps (Europe/Warsaw when naive) and ``compress=gzip``.
+        """
         device = self.get_object()
-        hours = int(request.query_params.get('hours', 24))
+        # Not 'format', which DRF reserves for renderer selection
+        export_format = request.query_params.get('file_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'file_format': f"Must be one of: {', '.join(EXPORT_FORMATS)}"})
+
+        bounds = {}
+        for name in ('since', 'until'):
+            value = request.query_params.get(name)
+            try:
+                bounds[name] = parse_timestamp(value) if value else None
+            except TIMESTAMP_ERRORS:
+                raise ValidationError({name: "Must be an ISO 8601 timestamp"})
 
-        serializer = DeviceDetailSerializer(
-            device,
-            context={'hours': hours}
+        gzip = request.query_params.get('compress') == 'gzip'
+        filename = f"{device.mac_address.replace(':', '')}-telemetry.{export_format}"
+        content_type = EXPORT_FORMATS[export_format]
+        if gzip:
+            # A .gz file download, not a transfer encoding clients would undo while saving
+            filename += '.gz'
+            content_type = 'application/gzip'
+        response = StreamingHttpResponse(
+            export_telemetry(device, export_format, gzip=gzip, **bounds),
+            content_type=content_type
         )
-        return Response(serializer.data)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
     @action(detail=True, methods=['get', 'put'])
     def dashboard_layout(self, request, *args, **kwargs):
         """
         Get or update the dashboard layout for a device.
         
-        GET: Retrieve the current dashboard layout
+        GET: Retrieve the current dashboard layout (304 when the validators match)
         PUT: Update the dashboard layout
         """
         device = self.get_object()
@@ -84,8 +211,10 @@ class DeviceViewSet(viewsets.ModelViewSet):
                 device=device,
                 defaults={'layout': DashboardLayout().get_default_layout()}
             )
-            serializer = DashboardLayoutSerializer(layout)
-            return Response(serializer.data)
+            version, last_modified = layout_version(layout)
+            return conditional_response(
+                request, version, last_modified, lambda: Response(DashboardLayoutSerializer(layout).data)
+            )
         
         # PUT request - update layout
         elif request.method == 'PUT':
@@ -98,6 +227,10 @@ class DeviceViewSet(viewsets.ModelViewSet):
             return Response(serializer.data)
 
 
+class TelemetryPagination(KeysetPagination):
+    ordering = ('-timestamp', '-uuid')
+
+
 class TelemetryViewSet(mixins.CreateModelMixin,
                        mixins.RetrieveModelMixin,
                        mixins.ListModelMixin,
@@ -111,12 +244,80 @@ class TelemetryViewSet(mixins.CreateModelMixin,
         Get specific telemetry record
     create:
         Add new telemetry data
+    batch:
+        Add many readings of one or more devices at once
+
+    ``layout=columns`` lists the readings as one list per field instead of one
+    object per reading (see devices.columnar).
     """
     permission_classes = [IsAuthenticated]
     serializer_class = TelemetrySerializer
+    pagination_class = TelemetryPagination
+
+    @action(detail=False, methods=['post'], parser_classes=[FastJSONParser, NDJSONParser])
+    def batch(self, request):
+        """
+        Store a JSON array (or NDJSON) of readings in one ingest run.
+
+        Every reading names its device with ``device`` (uuid) or ``mac_address`` and
+        carries the fields of a queued telemetry message. Returns the outcome of every
+        reading in input order: created, duplicate, invalid or unknown_device.
+        """
+        readings = request.data
+        if not isinstance(readings, list):
+            raise ValidationError({'detail': "Expected a list of readings"})
+        if len(readings) > settings.TELEMETRY_BATCH_MAX_ITEMS:
+            raise ValidationError({'detail': f"At most {settings.TELEMETRY_BATCH_MAX_ITEMS} readings per request"})
+
+        # Only the user's own devices, by uuid and by MAC address, mapped to the raw MAC used by ingest
+        raw_macs = {}
+        for pk, mac_address in Device.objects.filter(user=request.user).values_list('pk', 'mac_address'):
+            raw_mac = mac_address.replace(':', '').lower()
+            raw_macs[str(pk)] = raw_macs[raw_mac] = raw_mac
+
+        results = [None] * len(readings)
+        messages, message_indexes = [], []
+        for index, reading in enumerate(readings):
+            if not isinstance(reading, dict):
+                results[index] = {'status': 'invalid', 'error': "Expected an object"}
+                continue
+            key = reading.get('device') or reading.get('mac_address') or ''
+            raw_mac = raw_macs.get(str(key).replace(':', '').lower())
+            if raw_mac is None:
+                results[index] = {'status': 'unknown_device'}
+                continue
+            messages.append((raw_mac, reading))
+            message_indexes.append(index)
+
+        result = ingest_telemetry(messages, collect_items=True)
+        for index, item in zip(message_indexes, result.items):
+            results[index] = item
+
+        rejected = sum(1 for item in results if item['status'] in ('invalid', 'unknown_device'))
+        return Response({
+            'created': result.processed,
+            'duplicates': result.duplicates,
+            'errors': rejected,
+            'notifications': result.notifications,
+            'results': [{'index': index, **item} for index, item in enumerate(results)],
+        })
+
+    def perform_create(self, serializer):
+        # The reading and its rollup buckets (added by a post_save signal) are committed together
+        with transaction.atomic():
+            serializer.save()
+
+    def list(self, request, *args, **kwargs):
+        if get_layout(request) != LAYOUT_COLUMNS:
+            return super().list(request, *args, **kwargs)
+        # Plain values straight from the database, no model instances or serializer fields
+        queryset = self.get_queryset().select_related(None).values('timestamp', *TELEMETRY_COLUMNS)
+        rows = self.paginate_queryset(queryset)
+        columns = rows_to_columns([tuple(row.values()) for row in rows], TELEMETRY_COLUMNS)
+        return self.get_paginated_response(columns)
 
     def get_queryset(self):
-        queryset = Telemetry.objects.filter(device__user=self.request.user)
+        queryset = Telemetry.objects.filter(device__user=self.request.user).select_related('device')
 
         # Filter by device if specified
         device_id = self.request.query_params.get('device', None)
@@ -124,9 +325,10 @@ class TelemetryViewSet(mixins.CreateModelMixin,
             queryset = queryset.filter(device_id=device_id)
 
         # Filter by time range if specified
-        hours = self.request.query_params.get('hours', None)
+        hours = get_hours(self.request)
         if hours:
-            time_threshold = timezone.now() - timedelta(hours=int(hours))
+            time_threshold = timezone.now() - timedelta(hours=hours)
+            # A plain bound on the partition key, so only the partitions of the range are scanned
             queryset = queryset.filter(timestamp__gte=time_threshold)
 
         return queryset
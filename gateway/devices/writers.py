@@ -0,0 +1,141 @@
+"""
+Bulk writers of telemetry rows.
+
+``copy``
+    Streams the rows as CSV with ``COPY ... FROM STDIN`` into a session-local
+    staging table and moves them to the telemetry table with
+    ``INSERT ... ON CONFLICT DO NOTHING RETURNING``. PostgreSQL only, other
+    backends fall back to ``bulk_create``.
+
+``bulk_create``
+    ``Telemetry.objects.bulk_create`` with ``ignore_conflicts``.
+
+Both skip rows that collide with stored readings on (device, timestamp) and
+return the primary keys of the rows actually inserted. The method is selected
+with the TELEMETRY_WRITE_METHOD setting.
+"""
+import csv
+import io
+import logging
+import uuid
+from datetime import datetime
+from typing import Any, List, NamedTuple, Optional, Set
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from devices.models import Telemetry
+
+logger = logging.getLogger(__name__)
+
+STAGING_TABLE = 'telemetry_staging'
+COPY_COLUMNS = (
+    'uuid', 'created_at', 'updated_at', 'device_id',
+    'temperature', 'humidity', 'pressure', 'soil_moisture', 'timestamp',
+)
+
+
+class TelemetryRow(NamedTuple):
+    """A validated reading; lighter than a Telemetry instance, with the same attributes."""
+    uuid: uuid.UUID
+    # Device or devices.registry.DeviceRecord
+    device: Any
+    temperature: float
+    humidity: float
+    pressure: float
+    soil_moisture: int
+    timestamp: datetime
+
+    @property
+    def device_id(self):
+        return self.device.pk
+
+
+def write_telemetry(rows: List[TelemetryRow], method: Optional[str] = None) -> Set[uuid.UUID]:
+    """
+    Inserts the rows, skipping the ones already stored.
+    Returns the primary keys of the inserted rows.
+    """
+    if not rows:
+        return set()
+
+    method = method or settings.TELEMETRY_WRITE_METHOD
+    if method == 'copy' and connection.vendor == 'postgresql':
+        return copy_telemetry(rows)
+    if method not in ('copy', 'bulk_create'):
+        raise ValueError(f"Unknown telemetry write method: {method}")
+    return bulk_create_telemetry(rows)
+
+
+def bulk_create_telemetry(rows: List[TelemetryRow]) -> Set[uuid.UUID]:
+    now = timezone.now()
+    objects = [
+        Telemetry(
+            uuid=row.uuid,
+            device_id=row.device_id,
+            temperature=row.temperature,
+            humidity=row.humidity,
+            pressure=row.pressure,
+            soil_moisture=row.soil_moisture,
+            timestamp=row.timestamp,
+            created_at=now,
+            updated_at=now,
+        )
+        for row in rows
+    ]
+    with transaction.atomic():
+        Telemetry.objects.bulk_create(objects, ignore_conflicts=True)
+        # Primary keys of skipped rows are not reported by bulk_create, look them up
+        return set(Telemetry.objects.filter(
+            uuid__in=[row.uuid for row in rows]
+        ).values_list('uuid', flat=True))
+
+
+def _to_csv(rows: List[TelemetryRow]) -> str:
+    now = timezone.now().isoformat()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # Same order as COPY_COLUMNS
+    writer.writerows(
+        (row.uuid, now, now, row.device_id, row.temperature, row.humidity,
+         row.pressure, row.soil_moisture, row.timestamp.isoformat())
+        for row in rows
+    )
+    return buffer.getvalue()
+
+
+def _copy_from(cursor, sql: str, data: str) -> None:
+    raw_cursor = cursor.cursor
+    if hasattr(raw_cursor, 'copy_expert'):
+        # psycopg2
+        raw_cursor.copy_expert(sql, io.StringIO(data))
+    else:
+        # psycopg 3
+        with raw_cursor.copy(sql) as copy:
+            copy.write(data)
+
+
+def copy_telemetry(rows: List[TelemetryRow]) -> Set[uuid.UUID]:
+    quote = connection.ops.quote_name
+    table = quote(Telemetry._meta.db_table)
+    columns = ', '.join(quote(column) for column in COPY_COLUMNS)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Created once per database session and emptied on commit
+        cursor.execute(
+            f'CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} '
+            f'(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS'
+        )
+        _copy_from(cursor, f'COPY {STAGING_TABLE} ({columns}) FROM STDIN WITH (FORMAT csv)', _to_csv(rows))
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) SELECT {columns} FROM {STAGING_TABLE} '
+            f'ON CONFLICT ({quote("device_id")}, {quote("timestamp")}) DO NOTHING RETURNING {quote("uuid")}'
+        )
+        # psycopg2 returns UUIDs as strings
+        inserted = {uuid.UUID(str(pk)) for pk, in cursor.fetchall()}
+        # Several writes may share the transaction
+        cursor.execute(f'TRUNCATE {STAGING_TABLE}')
+
+    logger.debug(f"Copied {len(rows)} telemetry rows, {len(inserted)} inserted")
+    return inserted
@@ -9,9 +9,19 @@ python manage.py migrate
 echo "Starting Celery worker..."
 celery -A core worker --loglevel=info &
 
-# Uruchom pierwszy task przetwarzania telemetrii
-echo "Starting telemetry processing..."
-python manage.py shell -c "from devices.tasks import process_telemetry_queue; process_telemetry_queue.delay()"
+# Uruchom harmonogram zadań okresowych
+echo "Starting Celery beat..."
+celery -A core beat --loglevel=info &
+
+# Uruchom worker przetwarzania telemetrii
+echo "Starting telemetry ingest worker..."
+python manage.py runingest &
+
+# Uruchom most MQTT, jeśli skonfigurowano brokera
+if [ -n "$MQTT_HOST" ]; then
+    echo "Starting MQTT telemetry bridge..."
+    python manage.py runmqttbridge &
+fi
 
 # Uruchom serwer Django
 echo "Starting Django server..."
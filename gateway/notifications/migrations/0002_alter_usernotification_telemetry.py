@@ -0,0 +1,20 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0008_device_last_seen_at'),
+        ('notifications', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='usernotification',
+            name='telemetry',
+            field=models.ForeignKey(db_constraint=False, help_text='Telemetry reading that triggered this notification', on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='devices.telemetry'),
+        ),
+    ]
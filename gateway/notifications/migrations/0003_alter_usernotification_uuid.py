@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:00
+
+import core.uuids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_alter_usernotification_telemetry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='usernotification',
+            name='uuid',
+            field=models.UUIDField(default=core.uuids.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
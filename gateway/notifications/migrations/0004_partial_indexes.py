@@ -0,0 +1,40 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0013_telemetry_append_only'),
+        ('notifications', '0003_alter_usernotification_uuid'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='usernotification',
+            name='notificatio_user_id_776dd3_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='usernotification',
+            name='notificatio_device__980f56_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='usernotification',
+            name='notificatio_is_read_0f6abc_idx',
+        ),
+        migrations.AddIndex(
+            model_name='usernotification',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['user', '-created_at'], name='notif_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usernotification',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['device', '-created_at'], name='notif_device_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usernotification',
+            index=models.Index(condition=models.Q(('is_deleted', False), ('is_read', False)), fields=['user'], name='notif_user_unread_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0014_devicelatesttelemetry'),
+        ('notifications', '0004_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='usernotification',
+            name='telemetry',
+            field=models.ForeignKey(blank=True, db_constraint=False, help_text='Telemetry reading that triggered this notification', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notifications', to='devices.telemetry'),
+        ),
+    ]
@@ -1,15 +1,16 @@
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth import get_user_model
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 
-from core.models import BaseModel
+from core.models import BaseModel, TimeOrderedModel
 from devices.models import Device, Telemetry
 
 User = get_user_model()
 
 
-class UserNotification(BaseModel):
+class UserNotification(TimeOrderedModel):
     """
     Model for storing user notifications about sensor limit violations.
     """
@@ -31,9 +32,14 @@ class UserNotification(BaseModel):
         related_name='notifications',
         help_text=_("Device that triggered this notification")
     )
+    # No database constraint, the partitioned telemetry table has no unique key on uuid alone.
+    # Cleared when the reading is archived or its partition dropped, the notification is kept.
     telemetry = models.ForeignKey(
         Telemetry,
-        on_delete=models.CASCADE,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        db_constraint=False,
         related_name='notifications',
         help_text=_("Telemetry reading that triggered this notification")
     )
@@ -58,10 +64,24 @@ class UserNotification(BaseModel):
 
     class Meta:
         ordering = ['-created_at']
+        # Partial, soft-deleted notifications are never queried
         indexes = [
-            models.Index(fields=['user', '-created_at']),
-            models.Index(fields=['device', '-created_at']),
-            models.Index(fields=['is_read', '-created_at']),
+            models.Index(
+                fields=['user', '-created_at'],
+                condition=Q(is_deleted=False),
+                name='notif_user_created_idx'
+            ),
+            models.Index(
+                fields=['device', '-created_at'],
+                condition=Q(is_deleted=False),
+                name='notif_device_created_idx'
+            ),
+            # Unread notifications of a user (mark_all_as_read)
+            models.Index(
+                fields=['user'],
+                condition=Q(is_read=False, is_deleted=False),
+                name='notif_user_unread_idx'
+            ),
         ]
 
     def __str__(self) -> str:
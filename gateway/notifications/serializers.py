@@ -25,7 +25,9 @@ class UserNotificationSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at', 'user']
 
     def get_telemetry_data(self, obj):
-        """Return relevant telemetry data that triggered the notification."""
+        """Return relevant telemetry data that triggered the notification, None once it is archived."""
+        if obj.telemetry is None:
+            return None
         return {
             'temperature': obj.telemetry.temperature,
             'humidity': obj.telemetry.humidity,
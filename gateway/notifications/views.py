@@ -5,10 +5,15 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.utils import timezone
 
+from core.pagination import KeysetPagination
 from .models import UserNotification
 from .serializers import UserNotificationSerializer
 
 
+class UserNotificationPagination(KeysetPagination):
+    ordering = ('-created_at', '-uuid')
+
+
 class UserNotificationViewSet(viewsets.ReadOnlyModelViewSet):
     """
     ViewSet for managing user notifications.
@@ -24,6 +29,7 @@ class UserNotificationViewSet(viewsets.ReadOnlyModelViewSet):
     """
     permission_classes = [IsAuthenticated]
     serializer_class = UserNotificationSerializer
+    pagination_class = UserNotificationPagination
     
     def get_queryset(self):
         return UserNotification.objects.filter(